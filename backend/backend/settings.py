@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro: mede a requisição inteira, inclusive o tempo dos demais middlewares
+    "simulador.middleware.InstrumentacaoMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -44,6 +46,11 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Instrumentação por requisição (queries, Firebird, calculadora) - opt-in
+SIMULADOR_INSTRUMENTACAO = os.getenv("DJANGO_INSTRUMENTACAO", "False").lower() in ("1", "true", "yes")
+# /api/_metrics/ fica restrito a usuários staff; liberar só em rede interna
+SIMULADOR_METRICAS_ABERTAS = os.getenv("DJANGO_METRICAS_ABERTAS", "False").lower() in ("1", "true", "yes")
+
 CORS_ALLOW_ALL_ORIGINS = os.getenv("DJANGO_CORS_ALLOW_ALL", "True").lower() in ("1", "true", "yes")
 CORS_ALLOWED_ORIGINS = [
     origem.strip()
@@ -84,6 +91,17 @@ DATABASES = {
     }
 }
 
+# Cache. Sem configuração, LocMem (por processo). Para o single-flight entre
+# workers entregar o resultado da consulta do balancete, use um cache
+# compartilhado (ex.: DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# e DJANGO_CACHE_LOCATION=redis://...); o lock fica no banco de qualquer forma.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,3 +144,18 @@ BALANCETE_DEPARA_FILE = os.getenv(
     "BALANCETE_DEPARA_FILE",
     str(BASE_DIR / "simulador" / "data" / "balancete_depara.json"),
 )
+# Planilha de referência do DE-PARA (BDCODTPLA -> parâmetro) e cache das contas de cada plano
+DEPARA_CSV_FILE = os.getenv(
+    "DEPARA_CSV_FILE",
+    str(BASE_DIR.parent / "_docs" / "DEPARA_simulacao_tributaria_com_BDCODTPLA.csv"),
+)
+PLANO_CONTAS_CACHE_TTL = int(os.getenv("PLANO_CONTAS_CACHE_TTL", "3600"))
+
+# Consultas do balancete em segundo plano (pool dedicado para o fdb; estado na tabela Job)
+BALANCETE_MAX_CONCORRENCIA = int(os.getenv("BALANCETE_MAX_CONCORRENCIA", "4"))
+# Espera máxima por uma consulta idêntica em andamento (single-flight)
+BALANCETE_SINGLE_FLIGHT_TIMEOUT = int(os.getenv("BALANCETE_SINGLE_FLIGHT_TIMEOUT", "120"))
+
+# Cache de resultados por impressão digital das entradas (memória + banco)
+RESULTADO_CACHE_MEMORIA = int(os.getenv("RESULTADO_CACHE_MEMORIA", "2048"))
+RESULTADO_CACHE_BANCO = int(os.getenv("RESULTADO_CACHE_BANCO", "50000"))
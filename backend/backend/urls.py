@@ -12,7 +12,16 @@ from simulador.views import (
     AliquotaFixaViewSet,
     AliquotaFederalViewSet,
     BalanceteAPIView,
+    BalanceteParametrosAPIView,
+    BalanceteArvoreAPIView,
     BalanceteDeParaViewSet,
+    AnaliseCarteiraAPIView,
+    MetricasAPIView,
+    BalanceteJobsAPIView,
+    BalanceteJobDetalheAPIView,
+    JobViewSet,
+    ReferenciasAPIView,
+    VersaoTabelasViewSet,
 )
 
 router = DefaultRouter()
@@ -20,6 +29,7 @@ router = DefaultRouter()
 router.register(r"empresas", EmpresaViewSet)
 router.register(r"simulacoes", SimulacaoViewSet)
 router.register(r"resultados", ResultadoViewSet)
+router.register(r"jobs", JobViewSet)
 
 # tabelas auxiliares
 router.register(r"cnae-impedimentos", CnaeImpedimentoViewSet)
@@ -29,9 +39,17 @@ router.register(r"faixas-simples", FaixaSimplesViewSet)
 router.register(r"base-presumido", BasePresumidoViewSet)
 router.register(r"aliquotas-fixas", AliquotaFixaViewSet)
 router.register(r"aliquotas-federais", AliquotaFederalViewSet)
+router.register(r"versoes-tabelas", VersaoTabelasViewSet)
 router.register(r"balancete-depara", BalanceteDeParaViewSet, basename="balancete-depara")
 
 urlpatterns = [
     path("api/", include(router.urls)),
     path("api/balancete/", BalanceteAPIView.as_view(), name="balancete"),
+    path("api/balancete/parametros/", BalanceteParametrosAPIView.as_view(), name="balancete-parametros"),
+    path("api/balancete/arvore/", BalanceteArvoreAPIView.as_view(), name="balancete-arvore"),
+    path("api/balancete/jobs/", BalanceteJobsAPIView.as_view(), name="balancete-jobs"),
+    path("api/balancete/jobs/<str:job_id>/", BalanceteJobDetalheAPIView.as_view(), name="balancete-job"),
+    path("api/_metrics/", MetricasAPIView.as_view(), name="metricas"),
+    path("api/analises/carteira/", AnaliseCarteiraAPIView.as_view(), name="analise-carteira"),
+    path("api/referencias/", ReferenciasAPIView.as_view(), name="referencias"),
 ]
@@ -0,0 +1,157 @@
+"""
+Módulo 'fdb' falso para os benchmarks: responde às consultas feitas por
+simulador.services.firebird_balancete com dados sintéticos em memória.
+"""
+import sys
+import types
+from datetime import date
+from decimal import Decimal
+
+D = Decimal
+
+# (nome, type_code, display_size, internal_size, precision, scale, null_ok) como no fdb
+DESCRICAO_BALANCETE = (
+    ("BDCODTPLA", int, 11, 4, 0, 0, False),
+    ("BDCTALON", str, 40, 40, 0, 0, True),
+    ("BDNOMCTA", str, 100, 100, 0, 0, True),
+    ("BDTIPCTA", int, 6, 2, 0, 0, True),
+    ("BDNIVEL", int, 6, 2, 0, 0, True),
+    ("BDSALDO_ANTERIOR", Decimal, 20, 8, 18, -2, True),
+    ("BDSALDO_DEB", Decimal, 20, 8, 18, -2, True),
+    ("BDSALDO_CRE", Decimal, 20, 8, 18, -2, True),
+    ("BDSALDO_ATUAL", Decimal, 20, 8, 18, -2, True),
+    ("BDDATA", date, 10, 4, 0, 0, True),
+)
+
+
+def gerar_balancete(qtd_linhas: int = 5000):
+    """
+    Gera um plano sintético hierárquico (01 a 04, quatro níveis) com contas
+    sintéticas (BDTIPCTA = 0) cujo saldo é a soma das filhas e contas
+    analíticas (BDTIPCTA = 1), com saldos em centavos exatos.
+    """
+    grupos = ["01", "02", "03", "04"]
+    por_grupo = max(4, qtd_linhas // len(grupos))
+    contas = []  # (conta, analitica)
+    for grupo in grupos:
+        inicio = len(contas)
+        contas.append((grupo, False))
+        n2 = 0
+        while len(contas) - inicio < por_grupo:
+            n2 += 1
+            contas.append((f"{grupo}.{n2}", False))
+            for n3 in range(1, 6):
+                if len(contas) - inicio >= por_grupo:
+                    break
+                contas.append((f"{grupo}.{n2}.{n3}", False))
+                for n4 in range(1, 11):
+                    if len(contas) - inicio >= por_grupo:
+                        break
+                    contas.append((f"{grupo}.{n2}.{n3}.{n4:02d}", True))
+
+    valores = {}
+    for codigo, (conta, analitica) in enumerate(contas, start=1):
+        if not analitica:
+            continue
+        saldo_anterior = D(codigo * 137 % 1000003) / 100
+        debito = D(codigo * 31 % 100000) / 100
+        credito = D(codigo * 17 % 70000) / 100
+        movimento = (saldo_anterior, debito, credito, saldo_anterior + debito - credito)
+        partes = conta.split(".")
+        for nivel in range(1, len(partes) + 1):
+            chave = ".".join(partes[:nivel])
+            atual = valores.get(chave, (D(0), D(0), D(0), D(0)))
+            valores[chave] = tuple(a + b for a, b in zip(atual, movimento))
+
+    linhas = []
+    for codigo, (conta, analitica) in enumerate(contas, start=1):
+        saldo_anterior, debito, credito, saldo_atual = valores.get(conta, (D(0), D(0), D(0), D(0)))
+        linhas.append((
+            codigo,
+            conta,
+            f"CONTA {conta}",
+            1 if analitica else 0,
+            conta.count(".") + 1,
+            saldo_anterior,
+            debito,
+            credito,
+            saldo_atual,
+            date(2024, 12, 31),
+        ))
+    return linhas
+
+
+class FakeCursor:
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.description = None
+        self._linhas = []
+
+    def execute(self, sql, params=None):
+        texto = " ".join(sql.split()).upper()
+        self.conexao.consultas.append(texto)
+        if "VSUC_SP_RETORNA_BALANCETE" in texto:
+            self.description = DESCRICAO_BALANCETE
+            self._linhas = list(self.conexao.balancete)
+        elif "BDCODPLAPADRAO" in texto and "PLANOS_TPLA" not in texto:
+            self.description = (("BDCODPLAPADRAO", int, 11, 4, 0, 0, False),)
+            self._linhas = [(1,)]
+        elif "PLANOS_TPLA" in texto:
+            self.description = (("BDCODTPLA", int, 11, 4, 0, 0, False),)
+            self._linhas = [(1,)] if " DESC" not in texto else [(len(self.conexao.balancete),)]
+        elif "TEMPRESAS" in texto:
+            self.description = tuple(
+                (nome, str, 100, 100, 0, 0, True)
+                for nome in ("BDCODEMP", "BDNOMEMP", "BDCNPJEMP", "BDCODCNAE", "BDCODCID", "BDNOMCID", "BDREFEMP")
+            )
+            empresa = params[0] if params else 1
+            self._linhas = [
+                (empresa, "EMPRESA SINTETICA LTDA", "12345678000190", "4711302", 1, "FLORIANOPOLIS", date(2024, 1, 1))
+            ]
+        else:
+            self.description = None
+            self._linhas = []
+
+    def fetchone(self):
+        return self._linhas[0] if self._linhas else None
+
+    def fetchall(self):
+        return list(self._linhas)
+
+    def fetchmany(self, size=1000):
+        lote, self._linhas = self._linhas[:size], self._linhas[size:]
+        return lote
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, balancete):
+        self.balancete = balancete
+        self.consultas = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+
+_BALANCETE = gerar_balancete()
+
+
+def connect(**kwargs):
+    return FakeConnection(_BALANCETE)
+
+
+def instalar(qtd_linhas: int = 5000) -> types.ModuleType:
+    """Registra este módulo como 'fdb' (antes de importar o serviço do balancete)."""
+    global _BALANCETE
+    _BALANCETE = gerar_balancete(qtd_linhas)
+    modulo = sys.modules[__name__]
+    sys.modules["fdb"] = modulo
+    return modulo
@@ -0,0 +1,427 @@
+"""
+Benchmarks do backend: calculadora, serializers, balancete (Firebird) e DE-PARA.
+
+Roda em SQLite em memória com um módulo 'fdb' falso, sem depender do MySQL
+nem do SCI. A partir do diretório backend/:
+
+    python -m benchmarks.run                    # roda tudo e compara com baseline.json
+    python -m benchmarks.run --rapido           # escalas reduzidas (desenvolvimento)
+    python -m benchmarks.run -k processar       # somente benchmarks cujo nome contém o filtro
+    python -m benchmarks.run --salvar-baseline  # grava o resultado como nova baseline
+
+Sai com código 1 quando algum benchmark fica mais lento que a baseline além da
+tolerância (--tolerancia, padrão 25%).
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+
+D = Decimal
+
+
+def _configurar_django(tmpdir: Path):
+    os.environ["DJANGO_DB_ENGINE"] = "django.db.backends.sqlite3"
+    os.environ["DJANGO_DB_NAME"] = ":memory:"
+    os.environ["BALANCETE_DEPARA_FILE"] = str(tmpdir / "balancete_depara.json")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from benchmarks import fake_fdb
+    fake_fdb.instalar()
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.test.utils import setup_test_environment
+    from django.test.runner import DiscoverRunner
+
+    shutil.copy(BACKEND_DIR / "simulador" / "data" / "balancete_depara.json", settings.BALANCETE_DEPARA_FILE)
+
+    setup_test_environment()
+    DiscoverRunner(verbosity=0).setup_databases()
+
+
+# --------------------------
+# Medição
+# --------------------------
+class ContadorQueries:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def contar_queries():
+    from django.db import connection
+    contador = ContadorQueries()
+    with connection.execute_wrapper(contador):
+        yield contador
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[idx]
+
+
+def medir(func: Callable[[], Any], repeticoes: int, itens_por_execucao: int) -> Dict[str, Any]:
+    """Executa `func` N vezes; latências em ms por execução."""
+    func()  # aquecimento (caches de import, compilação de regex etc.)
+    duracoes = []
+    with contar_queries() as contador:
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            func()
+            duracoes.append(time.perf_counter() - inicio)
+    total = sum(duracoes)
+    return {
+        "execucoes": repeticoes,
+        "itens": itens_por_execucao * repeticoes,
+        "throughput": round(itens_por_execucao * repeticoes / total, 1) if total else None,
+        "p50_ms": round(_percentil(duracoes, 50) * 1000, 3),
+        "p95_ms": round(_percentil(duracoes, 95) * 1000, 3),
+        "queries_por_item": round(contador.total / (itens_por_execucao * repeticoes), 2),
+    }
+
+
+# --------------------------
+# Dados sintéticos
+# --------------------------
+FAIXAS_SIMPLES = [
+    (D("0"), D("180000"), D("4.00"), D("0")),
+    (D("180000.01"), D("360000"), D("7.30"), D("5940")),
+    (D("360000.01"), D("720000"), D("9.50"), D("13860")),
+    (D("720000.01"), D("1800000"), D("10.70"), D("22500")),
+    (D("1800000.01"), D("3600000"), D("14.30"), D("87300")),
+    (D("3600000.01"), D("4800000"), D("19.00"), D("378000")),
+]
+
+
+def criar_tabelas_auxiliares():
+    from simulador.models import AnexoSimples, FaixaSimples, AliquotaFixa, CnaeImpedimento
+
+    if AnexoSimples.objects.exists():
+        return
+    for numero in range(1, 6):
+        anexo = AnexoSimples.objects.create(numero=numero, atividade=f"Anexo {numero}")
+        FaixaSimples.objects.bulk_create([
+            FaixaSimples(anexo=anexo, receita_de=de, receita_ate=ate, aliquota=aliq + numero, deducao=ded)
+            for de, ate, aliq, ded in FAIXAS_SIMPLES
+        ])
+    AliquotaFixa.objects.create(imposto="IRPJ", aliquota=D("15"))
+    AliquotaFixa.objects.create(imposto="CSLL", aliquota=D("9"))
+    CnaeImpedimento.objects.create(cnae="6422-1", descricao="Bancos")
+
+
+def criar_simulacoes(quantidade: int) -> List[int]:
+    from simulador.models import (
+        AnexoSimples, Empresa, Simulacao, SimulacaoAnexoMercadoria, SimulacaoAnexoServico,
+    )
+
+    criar_tabelas_auxiliares()
+    anexos = {a.numero: a for a in AnexoSimples.objects.all()}
+    inicio = Empresa.objects.count()
+    empresas = Empresa.objects.bulk_create([
+        Empresa(
+            razao_social=f"Empresa {inicio + i}",
+            cnpj=f"{inicio + i:014d}",
+            cnae_principal="4711-3",
+            municipio="Florianópolis",
+            uf="SC",
+        )
+        for i in range(max(1, quantidade // 10))
+    ])
+    simulacoes = []
+    for i in range(quantidade):
+        receita = D(50000 + (i * 7919) % 300000)
+        merc = (receita * D("0.6")).quantize(D("0.01"))
+        serv = receita - merc
+        simulacoes.append(Simulacao(
+            empresa=empresas[i % len(empresas)],
+            receita_total=receita,
+            receita_mercadorias=merc,
+            receita_servicos=serv,
+            receita_12_meses=receita * 12,
+            folha_total=receita * D("0.2"),
+            aliquota_inss_total=D("28"),
+            aliquota_iss=D("5"),
+            aliquota_icms=D("17"),
+            aliquota_pis=D("0.65"),
+            aliquota_cofins=D("3"),
+            regime_atual=("Simples", "Presumido", "Real")[i % 3],
+            custo_mercadorias=merc * D("0.4"),
+            presumido_irpj_merc=D("8"),
+            presumido_csll_merc=D("12"),
+            presumido_irpj_serv=D("32"),
+            presumido_csll_serv=D("32"),
+        ))
+    Simulacao.objects.bulk_create(simulacoes, batch_size=500)
+
+    mercadorias, servicos = [], []
+    for sim in simulacoes:
+        metade = (sim.receita_mercadorias / 2).quantize(D("0.01"))
+        mercadorias.append(SimulacaoAnexoMercadoria(simulacao=sim, anexo=anexos[1], valor=metade))
+        mercadorias.append(SimulacaoAnexoMercadoria(
+            simulacao=sim, anexo=anexos[2], valor=sim.receita_mercadorias - metade
+        ))
+        servicos.append(SimulacaoAnexoServico(simulacao=sim, anexo=anexos[3], valor=sim.receita_servicos))
+    SimulacaoAnexoMercadoria.objects.bulk_create(mercadorias, batch_size=500)
+    SimulacaoAnexoServico.objects.bulk_create(servicos, batch_size=500)
+    return [sim.pk for sim in simulacoes]
+
+
+# --------------------------
+# Benchmarks
+# --------------------------
+def bench_processar(quantidade: int) -> Dict[str, Any]:
+    from simulador.models import Simulacao
+    from simulador.services import cache_resultados
+    from simulador.services.calculadora import CalculadoraTributaria
+
+    cache_resultados.limpar(banco=True)  # mede o cálculo, não o cache de resultados
+    ids = criar_simulacoes(quantidade)
+    simulacoes = list(Simulacao.objects.filter(pk__in=ids).select_related("empresa"))
+    duracoes = []
+    with contar_queries() as contador:
+        for sim in simulacoes:
+            inicio = time.perf_counter()
+            CalculadoraTributaria(sim).processar()
+            duracoes.append(time.perf_counter() - inicio)
+    total = sum(duracoes)
+    return {
+        "execucoes": quantidade,
+        "itens": quantidade,
+        "throughput": round(quantidade / total, 1),
+        "p50_ms": round(_percentil(duracoes, 50) * 1000, 3),
+        "p95_ms": round(_percentil(duracoes, 95) * 1000, 3),
+        "queries_por_item": round(contador.total / quantidade, 2),
+    }
+
+
+def bench_serializer_lista(quantidade: int, repeticoes: int) -> Dict[str, Any]:
+    from simulador.models import Simulacao
+    from simulador.serializers import SimulacaoSerializer
+    from simulador.views import SimulacaoViewSet
+
+    if Simulacao.objects.count() < quantidade:
+        criar_simulacoes(quantidade - Simulacao.objects.count())
+
+    def executar():
+        qs = SimulacaoViewSet.queryset.all()[:quantidade]
+        return SimulacaoSerializer(qs, many=True).data
+
+    return medir(executar, repeticoes, quantidade)
+
+
+def bench_rows_to_dicts(linhas: int, repeticoes: int, decimais: str = "float", tuplas: bool = False) -> Dict[str, Any]:
+    from benchmarks import fake_fdb
+    from simulador.services import firebird_balancete
+
+    conexao = fake_fdb.FakeConnection(fake_fdb.gerar_balancete(linhas))
+    converter = firebird_balancete._rows_to_tuples if tuplas else firebird_balancete._rows_to_dicts
+
+    def executar():
+        cursor = conexao.cursor()
+        cursor.execute("SELECT * FROM VSUC_SP_RETORNA_BALANCETE(?)", [])
+        return converter(cursor, decimais)
+
+    return medir(executar, repeticoes, linhas)
+
+
+def bench_obter_balancete(linhas: int, repeticoes: int) -> Dict[str, Any]:
+    from benchmarks import fake_fdb
+    from simulador.services.firebird_balancete import obter_balancete
+
+    fake_fdb.instalar(linhas)
+
+    def executar():
+        return obter_balancete(
+            empresa=1, data_inicio="2024-01-01", data_fim="2024-12-31", competencia_ref="2024"
+        )
+
+    return medir(executar, repeticoes, linhas)
+
+
+def bench_depara_listar(repeticoes: int) -> Dict[str, Any]:
+    from simulador.services.depara_storage import list_entries
+
+    return medir(list_entries, repeticoes, 1)
+
+
+def bench_depara_escrita(repeticoes: int) -> Dict[str, Any]:
+    from simulador.services.depara_storage import create_entry, delete_entry, update_entry
+
+    def executar():
+        novo = create_entry({
+            "parametro": "benchmark",
+            "contas": [str(i) for i in range(100)],
+            "matchField": "bdcodtpla",
+            "matchType": "exact",
+            "ativo": False,
+        })
+        update_entry(novo["id"], {"contas": ["1", "2"]})
+        delete_entry(novo["id"])
+
+    return medir(executar, repeticoes, 3)
+
+
+def bench_consolidacao(linhas: int, repeticoes: int) -> Dict[str, Any]:
+    from benchmarks import fake_fdb
+    from simulador.services import firebird_balancete
+    from simulador.services.consolidacao import consolidar_balancete
+    from simulador.services.depara_storage import list_entries
+
+    conexao = fake_fdb.FakeConnection(fake_fdb.gerar_balancete(linhas))
+    cursor = conexao.cursor()
+    cursor.execute("SELECT * FROM VSUC_SP_RETORNA_BALANCETE(?)", [])
+    dados = firebird_balancete._rows_to_dicts(cursor)
+    entradas = list_entries()
+
+    return medir(lambda: consolidar_balancete(dados, entradas), repeticoes, linhas)
+
+
+def bench_depara_plano(linhas: int, repeticoes: int) -> Dict[str, Any]:
+    """DE-PARA do projeto mais regras de prefixo e regex, avaliado pelo plano compilado."""
+    from benchmarks import fake_fdb
+    from simulador.services import firebird_balancete
+    from simulador.services.depara_regras import PlanoDePara
+    from simulador.services.depara_storage import list_entries
+
+    conexao = fake_fdb.FakeConnection(fake_fdb.gerar_balancete(linhas))
+    cursor = conexao.cursor()
+    cursor.execute("SELECT * FROM VSUC_SP_RETORNA_BALANCETE(?)", [])
+    dados = firebird_balancete._rows_to_dicts(cursor)
+    entradas = list_entries() + [
+        {"parametro": f"grupo_{n}", "contas": [f"0{n % 4 + 1}.{n}"], "matchType": "prefix", "matchField": "bdctalon"}
+        for n in range(1, 41)
+    ] + [
+        {"parametro": f"regex_{n}", "contas": [rf"0{n}\.\d+\.{n}\.0[1-5]"], "matchType": "regex", "matchField": "bdctalon"}
+        for n in range(1, 5)
+    ]
+    plano = PlanoDePara(entradas)
+
+    return medir(lambda: plano.avaliar(dados), repeticoes, linhas)
+
+
+def benchmarks(rapido: bool) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    escalas = (1, 100, 1000) if rapido else (1, 100, 10000)
+    lista = {f"processar_{n}": (lambda n=n: bench_processar(n)) for n in escalas}
+    lista.update({
+        "serializer_lista_1000": lambda: bench_serializer_lista(1000, 3 if rapido else 10),
+        "rows_to_dicts_5000": lambda: bench_rows_to_dicts(5000, 10 if rapido else 30),
+        "rows_to_dicts_5000_str": lambda: bench_rows_to_dicts(5000, 10 if rapido else 30, "str"),
+        "rows_to_tuples_5000": lambda: bench_rows_to_dicts(5000, 10 if rapido else 30, "str", True),
+        "obter_balancete_5000": lambda: bench_obter_balancete(5000, 5 if rapido else 20),
+        "depara_listar": lambda: bench_depara_listar(20 if rapido else 100),
+        "depara_escrita": lambda: bench_depara_escrita(10 if rapido else 50),
+        "consolidacao_5000": lambda: bench_consolidacao(5000, 3 if rapido else 10),
+        "depara_plano_10000": lambda: bench_depara_plano(10000, 5 if rapido else 20),
+    })
+    return lista
+
+
+# --------------------------
+# Relatório / baseline
+# --------------------------
+def comparar(resultados: Dict[str, Dict], baseline: Dict[str, Dict], tolerancia: float) -> List[str]:
+    regressoes = []
+    for nome, atual in resultados.items():
+        base = baseline.get(nome)
+        if not base or not base.get("p50_ms"):
+            atual["status"] = "novo"
+            continue
+        variacao = (atual["p50_ms"] - base["p50_ms"]) / base["p50_ms"]
+        atual["variacao_p50"] = round(variacao * 100, 1)
+        piorou_queries = atual["queries_por_item"] > base.get("queries_por_item", atual["queries_por_item"])
+        if variacao > tolerancia or piorou_queries:
+            atual["status"] = "REGRESSAO"
+            regressoes.append(nome)
+        elif variacao < -tolerancia:
+            atual["status"] = "melhor"
+        else:
+            atual["status"] = "ok"
+    return regressoes
+
+
+def imprimir(resultados: Dict[str, Dict]):
+    cabecalho = f"{'benchmark':<24}{'itens':>8}{'itens/s':>12}{'p50 ms':>11}{'p95 ms':>11}{'q/item':>9}{'Δp50':>9}  status"
+    print(cabecalho)
+    print("-" * len(cabecalho))
+    for nome, r in resultados.items():
+        variacao = f"{r['variacao_p50']:+.1f}%" if "variacao_p50" in r else "-"
+        print(
+            f"{nome:<24}{r['itens']:>8}{r['throughput'] or 0:>12.1f}{r['p50_ms']:>11.3f}"
+            f"{r['p95_ms']:>11.3f}{r['queries_por_item']:>9.2f}{variacao:>9}  {r.get('status', '')}"
+        )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rapido", action="store_true", help="Escalas reduzidas")
+    parser.add_argument("-k", dest="filtro", default="", help="Filtra benchmarks pelo nome")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Regressão aceitável no p50 (fração)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--salvar-baseline", action="store_true")
+    parser.add_argument("--json", type=Path, help="Grava os resultados neste arquivo")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _configurar_django(Path(tmp))
+        resultados = {}
+        for nome, func in benchmarks(args.rapido).items():
+            if args.filtro and args.filtro not in nome:
+                continue
+            print(f"executando {nome}...", file=sys.stderr)
+            resultados[nome] = func()
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")).get("resultados", {})
+    regressoes = comparar(resultados, baseline, args.tolerancia)
+    imprimir(resultados)
+
+    saida = {
+        "ambiente": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "rapido": args.rapido,
+        },
+        "resultados": resultados,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(saida, indent=2, ensure_ascii=False), encoding="utf-8")
+    if args.salvar_baseline:
+        for r in resultados.values():
+            r.pop("status", None)
+            r.pop("variacao_p50", None)
+        atual = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+        atual.setdefault("resultados", {}).update(resultados)
+        atual["ambiente"] = saida["ambiente"]
+        args.baseline.write_text(json.dumps(atual, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"baseline gravada em {args.baseline}", file=sys.stderr)
+        return 0
+
+    if regressoes:
+        print(f"\nRegressões: {', '.join(regressoes)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
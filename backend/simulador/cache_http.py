@@ -0,0 +1,110 @@
+"""
+Validação condicional (ETag/Last-Modified) para as views da API.
+
+Políticas de Cache-Control por tipo de recurso:
+- REVALIDAR: dados que mudam por edição do usuário (tabelas, simulações);
+  o navegador guarda, mas sempre revalida (304 quando nada mudou).
+- IMUTAVEL: conteúdo que nunca muda para a mesma URL (versões publicadas).
+- SEM_CACHE: estado volátil (jobs, métricas).
+"""
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from simulador.services import versoes
+
+REVALIDAR = {"private": True, "no_cache": True}
+IMUTAVEL = {"private": True, "max_age": 60 * 60 * 24 * 365, "immutable": True}
+SEM_CACHE = {"no_store": True}
+
+
+def etag_corresponde(request, etag: str) -> bool:
+    """Compara o If-None-Match da requisição com o ETag atual (aceita lista e W/)."""
+    cabecalho = request.headers.get("If-None-Match", "")
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    valores = {valor.strip().removeprefix("W/") for valor in cabecalho.split(",")}
+    return etag in valores
+
+
+def _nao_modificado_desde(request, ultima_alteracao: Optional[datetime]) -> bool:
+    if ultima_alteracao is None:
+        return False
+    desde = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return desde is not None and int(ultima_alteracao.timestamp()) <= desde
+
+
+def nao_modificado(etag: str, ultima_alteracao: Optional[datetime] = None, **cache_control) -> Response:
+    resposta = Response(status=status.HTTP_304_NOT_MODIFIED)
+    return com_validadores(resposta, etag, ultima_alteracao, **cache_control)
+
+
+def com_validadores(resposta, etag: str, ultima_alteracao: Optional[datetime] = None, **cache_control):
+    resposta["ETag"] = etag
+    if ultima_alteracao is not None:
+        resposta["Last-Modified"] = http_date(ultima_alteracao.timestamp())
+    patch_cache_control(resposta, **(cache_control or REVALIDAR))
+    return resposta
+
+
+def responder_condicional(
+    request,
+    etag: str,
+    ultima_alteracao: Optional[datetime],
+    gerar: Callable[[], Response],
+    **cache_control,
+) -> Response:
+    """
+    304 sem chamar `gerar` quando o cliente já tem a versão atual. If-None-Match
+    tem precedência; If-Modified-Since só é considerado sem ele (RFC 9110).
+    """
+    if request.headers.get("If-None-Match"):
+        atual = etag_corresponde(request, etag)
+    else:
+        atual = _nao_modificado_desde(request, ultima_alteracao)
+    if atual:
+        return nao_modificado(etag, ultima_alteracao, **cache_control)
+    resposta = gerar()
+    if resposta.status_code == status.HTTP_200_OK:
+        com_validadores(resposta, etag, ultima_alteracao, **cache_control)
+    return resposta
+
+
+class ValidacaoCondicionalMixin:
+    """
+    list/retrieve com ETag/Last-Modified pelas versões de `modelos_versao`
+    (services/versoes.py). A URL completa entra no ETag (filtros, paginação).
+    """
+
+    modelos_versao: Iterable = ()
+    cache_control = REVALIDAR
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        versoes.registrar(*cls.modelos_versao)
+
+    def get_cache_control(self):
+        return self.cache_control
+
+    def validadores(self, request):
+        return versoes.validadores(self.modelos_versao, self.action, request.get_full_path())
+
+    def list(self, request, *args, **kwargs):
+        etag, ultima = self.validadores(request)
+        return responder_condicional(
+            request, etag, ultima, lambda: super(ValidacaoCondicionalMixin, self).list(request, *args, **kwargs),
+            **self.get_cache_control(),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        etag, ultima = self.validadores(request)
+        return responder_condicional(
+            request, etag, ultima, lambda: super(ValidacaoCondicionalMixin, self).retrieve(request, *args, **kwargs),
+            **self.get_cache_control(),
+        )
@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulador.services.importacao_simulacoes import ImportacaoError, importar_simulacoes, ler_linhas
+
+
+class Command(BaseCommand):
+    help = "Importa simulações em lote a partir de um arquivo CSV ou XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho do arquivo .csv ou .xlsx")
+        parser.add_argument("--processar", action="store_true", help="Processa as simulações importadas")
+        parser.add_argument("--meses", type=int, default=1, help="Meses no período (para --processar)")
+
+    def handle(self, *args, **options):
+        caminho = Path(options["arquivo"])
+        if not caminho.exists():
+            raise CommandError(f"Arquivo não encontrado: {caminho}")
+
+        with caminho.open("rb") as arquivo:
+            try:
+                relatorio = importar_simulacoes(
+                    ler_linhas(arquivo, caminho.name),
+                    processar=options["processar"],
+                    meses_no_periodo=options["meses"],
+                )
+            except ImportacaoError as exc:
+                raise CommandError(str(exc)) from exc
+
+        for erro in relatorio["erros"]:
+            self.stderr.write(json.dumps(erro, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(
+            f"{relatorio['importadas']} de {relatorio['total_linhas']} linhas importadas."
+        ))
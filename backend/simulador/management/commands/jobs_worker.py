@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from simulador.services import tarefas  # noqa: F401 - registra as tarefas
+from simulador.services.jobs import executar, identificador_worker, recuperar_travados, reservar_proximo
+
+
+class Command(BaseCommand):
+    help = "Executa os jobs em segundo plano (balancete, processamento) gravados no banco."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--intervalo", type=float, default=2.0, help="Espera (s) quando a fila está vazia")
+        parser.add_argument("--uma-vez", action="store_true", help="Esvazia a fila e termina")
+        parser.add_argument(
+            "--timeout-travado",
+            type=int,
+            default=3600,
+            help="Segundos após os quais um job 'executando' volta para a fila",
+        )
+
+    def handle(self, *args, **options):
+        worker = identificador_worker()
+        limite_travado = timedelta(seconds=options["timeout_travado"])
+        self.stdout.write(f"Worker {worker} iniciado.")
+
+        while True:
+            close_old_connections()
+            devolvidos, finalizados = recuperar_travados(limite_travado)
+            if devolvidos:
+                self.stdout.write(f"{devolvidos} job(s) travado(s) devolvido(s) à fila.")
+            if finalizados:
+                self.stdout.write(f"{finalizados} job(s) travado(s) finalizado(s) (tentativas esgotadas ou cancelados).")
+
+            job = reservar_proximo(worker)
+            if job is None:
+                if options["uma_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+                continue
+
+            self.stdout.write(f"Executando job {job.pk} ({job.tipo})...")
+            job = executar(job)
+            self.stdout.write(f"Job {job.pk}: {job.status}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from simulador.services.busca_empresas import reindexar_busca
+
+
+class Command(BaseCommand):
+    help = "Preenche as colunas de busca (razão social normalizada e dígitos do CNPJ) das empresas."
+
+    def handle(self, *args, **options):
+        atualizadas = reindexar_busca()
+        self.stdout.write(self.style.SUCCESS(f"{atualizadas} empresas reindexadas."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from simulador.services.espelho_sci import TAMANHO_LOTE, sincronizar_empresas_sci
+from simulador.services.firebird_balancete import BalanceteError
+
+
+class Command(BaseCommand):
+    help = "Sincroniza o espelho local do cadastro de empresas do SCI (incremental por BDREFEMP)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--completo", action="store_true", help="Relê todas as empresas, não só as referências novas")
+        parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas lidas/gravadas por lote")
+
+    def handle(self, *args, **options):
+        try:
+            totais = sincronizar_empresas_sci(completo=options["completo"], tamanho_lote=max(1, options["lote"]))
+        except (BalanceteError, RuntimeError) as exc:
+            raise CommandError(str(exc)) from exc
+        modo = f"incremental desde {totais['desde']}" if totais["incremental"] else "completa"
+        self.stdout.write(self.style.SUCCESS(
+            f"Sincronização {modo}: {totais['lidas']} lidas, {totais['criadas']} criadas, "
+            f"{totais['atualizadas']} atualizadas."
+        ))
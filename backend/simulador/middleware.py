@@ -0,0 +1,94 @@
+import contextlib
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .services import metricas
+
+logger = logging.getLogger("simulador.metricas")
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede, por requisição, queries/tempo por banco (default, dp), Firebird,
+    calculadora, serialização (viewsets com SerializacaoMedidaMixin) e
+    renderização. Publica em Server-Timing, em uma linha de log JSON e no
+    agregado de /api/_metrics. Ativado por SIMULADOR_INSTRUMENTACAO.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SIMULADOR_INSTRUMENTACAO", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = metricas.iniciar_coleta()
+        coleta = metricas.coleta_atual()
+        try:
+            with contextlib.ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metricas.contador_queries(alias))
+                    )
+                response = self.get_response(request)
+            self._publicar(request, response, coleta)
+            return response
+        finally:
+            metricas.encerrar_coleta(token)
+
+    def process_template_response(self, request, response):
+        # A resposta do DRF é renderizada depois deste ponto
+        coleta = metricas.coleta_atual()
+        if coleta is not None:
+            inicio = time.perf_counter()
+
+            def _fim_render(resp):
+                coleta.adicionar("render", time.perf_counter() - inicio)
+
+            response.add_post_render_callback(_fim_render)
+        return response
+
+    @staticmethod
+    def _endpoint(request) -> str:
+        match = getattr(request, "resolver_match", None)
+        rota = match.route if match else request.path
+        # rotas do router do DRF são regex: "(?P<pk>[^/.]+)" -> "{pk}"
+        rota = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"{\1}", rota).replace("^", "").replace("$", "")
+        return f"{request.method} /{rota.lstrip('/')}"
+
+    def _publicar(self, request, response, coleta):
+        endpoint = self._endpoint(request)
+        total_ms = coleta.total_ms()
+        aliases = list(connections)
+        amostra = {
+            "total_ms": total_ms,
+            "queries": {alias: coleta.queries.get(alias, 0) for alias in aliases},
+            "db_ms": {alias: coleta.tempo_queries.get(alias, 0.0) * 1000 for alias in aliases},
+            "tempos_ms": {nome: seg * 1000 for nome, seg in coleta.tempos.items()},
+        }
+        if endpoint != "GET /api/_metrics/":
+            metricas.registrar_amostra(endpoint, amostra)
+
+        timing = [f"total;dur={total_ms:.1f}"]
+        for alias in aliases:
+            timing.append(
+                f'db-{alias};desc="{amostra["queries"][alias]} queries";dur={amostra["db_ms"][alias]:.1f}'
+            )
+        for nome, ms in amostra["tempos_ms"].items():
+            timing.append(f"{nome};dur={ms:.1f}")
+        response["Server-Timing"] = ", ".join(timing)
+
+        logger.info(json.dumps({
+            "endpoint": endpoint,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "queries": amostra["queries"],
+            "db_ms": {alias: round(ms, 2) for alias, ms in amostra["db_ms"].items()},
+            "tempos_ms": {nome: round(ms, 2) for nome, ms in amostra["tempos_ms"].items()},
+        }))
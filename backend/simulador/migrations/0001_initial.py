@@ -0,0 +1,267 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanilhaGerencial',
+            fields=[
+                ('cod_folha', models.CharField(db_column='Cod_folha', max_length=10, primary_key=True, serialize=False)),
+                ('cnpj', models.CharField(blank=True, db_column='CNPJ', max_length=50, null=True)),
+                ('cnpj_original', models.CharField(blank=True, db_column='CNPJ_Original', max_length=50, null=True)),
+                ('tributacao', models.CharField(blank=True, db_column='Tributacao', max_length=100, null=True)),
+            ],
+            options={
+                'db_table': 'geral_planilha_gerencial',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AliquotaFederal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imposto', models.CharField(choices=[('PIS', 'PIS'), ('COFINS', 'COFINS'), ('IRPJ', 'IRPJ'), ('CSLL', 'CSLL'), ('INSS', 'INSS Patronal')], max_length=20)),
+                ('aliquota', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('base_calculo', models.CharField(help_text='Ex: Receita, Lucro, Folha, etc.', max_length=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AliquotaFixa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imposto', models.CharField(max_length=50)),
+                ('aliquota', models.DecimalField(decimal_places=2, max_digits=5)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnexoSimples',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.IntegerField()),
+                ('atividade', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BasePresumido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('atividade', models.CharField(max_length=100)),
+                ('fator_irpj', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('fator_csll', models.DecimalField(decimal_places=2, max_digits=5)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CnaeImpedimento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnae', models.CharField(max_length=10, unique=True)),
+                ('descricao', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Empresa',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('razao_social', models.CharField(max_length=255)),
+                ('cnpj', models.CharField(max_length=18, unique=True)),
+                ('cnae_principal', models.CharField(max_length=10)),
+                ('municipio', models.CharField(max_length=100)),
+                ('uf', models.CharField(max_length=2)),
+                ('regime_tributario', models.CharField(choices=[('Simples', 'Simples Nacional'), ('Presumido', 'Lucro Presumido'), ('Real', 'Lucro Real'), ('Outras', 'Outras')], default='Outras', max_length=20)),
+                ('codigo_sci', models.PositiveIntegerField(blank=True, db_index=True, null=True)),
+                ('razao_social_busca', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255)),
+                ('cnpj_digitos', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EmpresaSCI',
+            fields=[
+                ('codigo', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('referencia', models.CharField(blank=True, default='', max_length=32)),
+                ('razao_social', models.CharField(blank=True, default='', max_length=255)),
+                ('cnpj', models.CharField(blank=True, default='', max_length=18)),
+                ('cnpj_digitos', models.CharField(blank=True, db_index=True, default='', max_length=14)),
+                ('cnae', models.CharField(blank=True, default='', max_length=10)),
+                ('cod_cidade', models.IntegerField(blank=True, null=True)),
+                ('municipio', models.CharField(blank=True, default='', max_length=100)),
+                ('sincronizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResultadoCalculoCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=100, unique=True)),
+                ('regime', models.CharField(choices=[('Simples', 'Simples Nacional'), ('Presumido', 'Lucro Presumido'), ('Real', 'Lucro Real')], max_length=20)),
+                ('detalhado', models.JSONField()),
+                ('acessos', models.PositiveIntegerField(default=0)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_acesso', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='VersaoTabelas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vigencia_inicio', models.DateField(unique=True)),
+                ('descricao', models.CharField(blank=True, default='', max_length=255)),
+                ('snapshot', models.JSONField()),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-vigencia_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CnaeAnexo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cnae', models.CharField(max_length=10)),
+                ('anexo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='simulador.anexosimples')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FaixaSimples',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receita_de', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('receita_ate', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('aliquota', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('deducao', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('anexo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='faixas', to='simulador.anexosimples')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('executando', 'Executando'), ('concluido', 'Concluído'), ('erro', 'Erro'), ('cancelado', 'Cancelado')], default='pendente', max_length=20)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('progresso', models.PositiveSmallIntegerField(default=0)),
+                ('mensagem', models.CharField(blank=True, default='', max_length=255)),
+                ('cancelamento_solicitado', models.BooleanField(default=False)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('max_tentativas', models.PositiveSmallIntegerField(default=3)),
+                ('disponivel_em', models.DateTimeField()),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('concluido_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'disponivel_em'], name='job_fila_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Simulacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(auto_now_add=True)),
+                ('competencia', models.DateField(blank=True, null=True)),
+                ('receita_total', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('receita_mercadorias', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('receita_servicos', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('receita_exportacao', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('receita_deducoes', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('outras_receitas', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('folha_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('inss_patronal', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('desoneracao_folha', models.BooleanField(default=False)),
+                ('aliquota_inss_total', models.DecimalField(decimal_places=4, default=0, max_digits=6)),
+                ('aliquota_iss', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('aliquota_icms', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('aliquota_pis', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('aliquota_cofins', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('regime_atual', models.CharField(choices=[('Simples', 'Simples Nacional'), ('Presumido', 'Lucro Presumido'), ('Real', 'Lucro Real'), ('Outras', 'Outras')], max_length=20)),
+                ('custo_mercadorias', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('custo_servicos', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('despesas_operacionais', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('outras_despesas', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('pro_labore', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('despesas_nao_dedutiveis', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('investimentos', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('depreciacao', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('creditos_pis', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('creditos_cofins', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('adicoes_fiscais', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('exclusoes_fiscais', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('lucro_contabil', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True)),
+                ('receita_12_meses', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('rat_percentual', models.DecimalField(decimal_places=4, default=0, max_digits=6)),
+                ('fap_percentual', models.DecimalField(decimal_places=4, default=1, max_digits=6)),
+                ('terceiros_percentual', models.DecimalField(decimal_places=4, default=0, max_digits=6)),
+                ('usa_cprb', models.BooleanField(default=False)),
+                ('cprb_percentual', models.DecimalField(decimal_places=4, default=0, max_digits=6)),
+                ('presumido_irpj_merc', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('presumido_csll_merc', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('presumido_irpj_serv', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('presumido_csll_serv', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('atualizado_em', models.DateTimeField(auto_now=True, null=True)),
+                ('anexo_manual', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='simulacoes', to='simulador.anexosimples')),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simulacoes', to='simulador.empresa')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumoSimulacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receita_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_simples', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_presumido', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_real', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('carga_simples', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('carga_presumido', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('carga_real', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('vencedor', models.CharField(choices=[('Simples', 'Simples Nacional'), ('Presumido', 'Lucro Presumido'), ('Real', 'Lucro Real')], db_index=True, max_length=20)),
+                ('economia_potencial', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=15)),
+                ('detalhado', models.JSONField(default=dict)),
+                ('hashes_entradas', models.JSONField(blank=True, default=dict)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+                ('simulacao', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='resumo', to='simulador.simulacao')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimulacaoAnexoMercadoria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('anexo', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='rateios_mercadoria', to='simulador.anexosimples')),
+                ('simulacao', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='anexos_mercadoria', to='simulador.simulacao')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimulacaoAnexoServico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('anexo', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='rateios_servico', to='simulador.anexosimples')),
+                ('simulacao', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='anexos_servico', to='simulador.simulacao')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Resultado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('regime', models.CharField(choices=[('Simples', 'Simples Nacional'), ('Presumido', 'Lucro Presumido'), ('Real', 'Lucro Real')], max_length=20)),
+                ('imposto', models.CharField(max_length=50)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('simulacao', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resultados', to='simulador.simulacao')),
+                ('versao_tabelas', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='resultados', to='simulador.versaotabelas')),
+            ],
+            options={
+                'unique_together': {('simulacao', 'regime', 'imposto')},
+            },
+        ),
+    ]
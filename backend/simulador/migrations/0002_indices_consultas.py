@@ -0,0 +1,60 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aliquotafixa',
+            name='imposto',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='anexosimples',
+            name='numero',
+            field=models.IntegerField(unique=True),
+        ),
+        migrations.AlterField(
+            model_name='simulacaoanexomercadoria',
+            name='anexo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='rateios_mercadoria', to='simulador.anexosimples'),
+        ),
+        migrations.AlterField(
+            model_name='simulacaoanexomercadoria',
+            name='simulacao',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anexos_mercadoria', to='simulador.simulacao'),
+        ),
+        migrations.AlterField(
+            model_name='simulacaoanexoservico',
+            name='anexo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='rateios_servico', to='simulador.anexosimples'),
+        ),
+        migrations.AlterField(
+            model_name='simulacaoanexoservico',
+            name='simulacao',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anexos_servico', to='simulador.simulacao'),
+        ),
+        migrations.AddConstraint(
+            model_name='aliquotafederal',
+            constraint=models.UniqueConstraint(fields=('imposto', 'base_calculo'), name='aliquota_federal_imposto_base_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='cnaeanexo',
+            constraint=models.UniqueConstraint(fields=('cnae', 'anexo'), name='cnae_anexo_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='faixasimples',
+            constraint=models.UniqueConstraint(fields=('anexo', 'receita_de'), name='faixa_anexo_receita_de_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='faixasimples',
+            constraint=models.CheckConstraint(condition=models.Q(('receita_ate__gte', models.F('receita_de'))), name='faixa_receita_ate_gte_de'),
+        ),
+    ]
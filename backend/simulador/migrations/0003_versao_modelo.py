@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador', '0002_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersaoModelo',
+            fields=[
+                ('rotulo', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+                ('alterado_em', models.DateTimeField()),
+            ],
+        ),
+    ]
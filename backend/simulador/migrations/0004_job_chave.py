@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador', '0003_versao_modelo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='chave',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador', '0004_job_chave'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecucaoCompartilhada',
+            fields=[
+                ('chave', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('dono', models.CharField(max_length=32)),
+                ('expira_em', models.DateTimeField(db_index=True)),
+                ('resultado', models.BinaryField(null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-19 12:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulador', '0005_execucao_compartilhada'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='execucaocompartilhada',
+            name='resultado',
+        ),
+    ]
@@ -1,5 +1,18 @@
+import unicodedata
+
 from django.db import models
 
+
+def normalizar_busca(valor) -> str:
+    """Texto em maiúsculas, sem acentos e com espaços simples (colunas de busca)."""
+    texto = unicodedata.normalize("NFKD", str(valor or ""))
+    texto = "".join(ch for ch in texto if not unicodedata.combining(ch))
+    return " ".join(texto.upper().split())
+
+
+def somente_digitos(valor) -> str:
+    return "".join(ch for ch in str(valor or "") if ch.isdigit())
+
 # ------------------------
 # Empresa
 # ------------------------
@@ -21,6 +34,20 @@ class Empresa(models.Model):
         choices=REGIME_CHOICES,
         default="Outras",
     )
+    # Código da empresa no SCI (BDCODEMP), quando cadastrada pela importação do balancete
+    codigo_sci = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+
+    # Colunas de busca, preenchidas no save (ver services/busca_empresas.py)
+    razao_social_busca = models.CharField(max_length=255, blank=True, default="", editable=False, db_index=True)
+    cnpj_digitos = models.CharField(max_length=14, blank=True, default="", editable=False, db_index=True)
+
+    def save(self, *args, **kwargs):
+        self.razao_social_busca = normalizar_busca(self.razao_social)
+        self.cnpj_digitos = somente_digitos(self.cnpj)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"razao_social_busca", "cnpj_digitos"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.razao_social} ({self.cnpj})"
@@ -39,6 +66,8 @@ class Simulacao(models.Model):
 
     empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name="simulacoes")
     data = models.DateField(auto_now_add=True)
+    # Competência usada para escolher a versão das tabelas (padrão: data da simulação)
+    competencia = models.DateField(null=True, blank=True)
 
     # Parâmetros
     receita_total = models.DecimalField(max_digits=15, decimal_places=2)
@@ -99,6 +128,8 @@ class Simulacao(models.Model):
         blank=True,
         related_name="simulacoes",
     )
+    # Atualizado a cada gravação (inclui a dos rateios, feita no mesmo update)
+    atualizado_em = models.DateTimeField(auto_now=True, null=True)
 
     def __str__(self):
         return f"Simulação {self.id} - {self.empresa}"
@@ -118,6 +149,14 @@ class Resultado(models.Model):
     regime = models.CharField(max_length=20, choices=REGIME_CHOICES)
     imposto = models.CharField(max_length=50)
     valor = models.DecimalField(max_digits=15, decimal_places=2)
+    # Versão das tabelas auxiliares usada no cálculo (nula = tabelas vigentes, sem versão)
+    versao_tabelas = models.ForeignKey(
+        "VersaoTabelas",
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name="resultados",
+    )
 
     class Meta:
         unique_together = ("simulacao", "regime", "imposto")
@@ -126,6 +165,96 @@ class Resultado(models.Model):
         return f"{self.simulacao} - {self.regime} - {self.imposto}: {self.valor}"
 
 
+class ResumoSimulacao(models.Model):
+    """
+    Resumo desnormalizado do último processamento (uma linha por simulação).
+    Gravado pela CalculadoraTributaria na mesma transação dos Resultados.
+    """
+
+    simulacao = models.OneToOneField(Simulacao, on_delete=models.CASCADE, related_name="resumo")
+    receita_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    total_simples = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_presumido = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_real = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    # Carga tributária (% sobre a receita total)
+    carga_simples = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    carga_presumido = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    carga_real = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+
+    vencedor = models.CharField(max_length=20, choices=Resultado.REGIME_CHOICES, db_index=True)
+    # Diferença entre o regime atual da simulação e o vencedor (0 quando já é o melhor)
+    economia_potencial = models.DecimalField(max_digits=15, decimal_places=2, default=0, db_index=True)
+    detalhado = models.JSONField(default=dict)
+    # Hash das entradas usadas em cada regime (reprocessamento incremental)
+    hashes_entradas = models.JSONField(default=dict, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Resumo {self.simulacao_id} - vencedor {self.vencedor}"
+
+    def totais(self):
+        return {
+            "Simples": self.total_simples,
+            "Presumido": self.total_presumido,
+            "Real": self.total_real,
+        }
+
+    def cargas(self):
+        return {
+            "Simples": self.carga_simples,
+            "Presumido": self.carga_presumido,
+            "Real": self.carga_real,
+        }
+
+
+class ResultadoCalculoCache(models.Model):
+    """
+    Detalhamento de um regime indexado pelo hash das suas entradas. Simulações
+    com entradas idênticas (clones, re-gravações) reaproveitam o cálculo.
+    """
+
+    chave = models.CharField(max_length=100, unique=True)
+    regime = models.CharField(max_length=20, choices=Resultado.REGIME_CHOICES)
+    detalhado = models.JSONField()
+    acessos = models.PositiveIntegerField(default=0)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    ultimo_acesso = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.regime} {self.chave[:12]}"
+
+
+class VersaoModelo(models.Model):
+    """
+    Contador de alterações por modelo (services/versoes.py). Fica no banco para que
+    todos os workers vejam a mesma versão ao montar ETags e invalidar caches.
+    """
+
+    rotulo = models.CharField(max_length=100, primary_key=True)  # app_label.model
+    versao = models.PositiveBigIntegerField(default=0)
+    alterado_em = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.rotulo} v{self.versao}"
+
+
+class ExecucaoCompartilhada(models.Model):
+    """
+    Lease do single-flight entre workers (services/single_flight.py): enquanto
+    `expira_em` não passou, `dono` está executando. O resultado não fica aqui;
+    é entregue em JSON pelo cache, numa chave do dono.
+    """
+
+    chave = models.CharField(max_length=64, primary_key=True)  # sha1 da chave da chamada
+    dono = models.CharField(max_length=32)
+    expira_em = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.chave[:12]} ({self.dono})"
+
+
 # ------------------------
 # Tabelas auxiliares
 # ------------------------
@@ -139,7 +268,7 @@ class CnaeImpedimento(models.Model):
 
 
 class AnexoSimples(models.Model):
-    numero = models.IntegerField()  # Ex: 1, 2, 3, 4, 5
+    numero = models.IntegerField(unique=True)  # Ex: 1, 2, 3, 4, 5
     atividade = models.CharField(max_length=255)  # Comércio, Indústria, Serviços
 
     def __str__(self):
@@ -151,13 +280,11 @@ class SimulacaoAnexoMercadoria(models.Model):
         Simulacao,
         on_delete=models.CASCADE,
         related_name="anexos_mercadoria",
-        db_constraint=False,
     )
     anexo = models.ForeignKey(
         AnexoSimples,
         on_delete=models.PROTECT,
         related_name="rateios_mercadoria",
-        db_constraint=False,
     )
     valor = models.DecimalField(max_digits=15, decimal_places=2)
 
@@ -170,13 +297,11 @@ class SimulacaoAnexoServico(models.Model):
         Simulacao,
         on_delete=models.CASCADE,
         related_name="anexos_servico",
-        db_constraint=False,
     )
     anexo = models.ForeignKey(
         AnexoSimples,
         on_delete=models.PROTECT,
         related_name="rateios_servico",
-        db_constraint=False,
     )
     valor = models.DecimalField(max_digits=15, decimal_places=2)
 
@@ -191,6 +316,15 @@ class FaixaSimples(models.Model):
     aliquota = models.DecimalField(max_digits=5, decimal_places=2)  # %
     deducao = models.DecimalField(max_digits=15, decimal_places=2, default=0)
 
+    class Meta:
+        # anexo + início da faixa identificam a faixa; o índice único atende a busca por receita
+        constraints = [
+            models.UniqueConstraint(fields=["anexo", "receita_de"], name="faixa_anexo_receita_de_uniq"),
+            models.CheckConstraint(
+                condition=models.Q(receita_ate__gte=models.F("receita_de")), name="faixa_receita_ate_gte_de"
+            ),
+        ]
+
     def __str__(self):
         return f"Anexo {self.anexo.numero} - {self.aliquota}%"
 
@@ -199,6 +333,12 @@ class CnaeAnexo(models.Model):
     cnae = models.CharField(max_length=10)
     anexo = models.ForeignKey(AnexoSimples, on_delete=models.CASCADE)
 
+    class Meta:
+        # Um CNAE pode cair em mais de um anexo (ex.: III ou V pelo fator R), mas não repetido
+        constraints = [
+            models.UniqueConstraint(fields=["cnae", "anexo"], name="cnae_anexo_uniq"),
+        ]
+
     def __str__(self):
         return f"{self.cnae} → Anexo {self.anexo.numero}"
 
@@ -213,7 +353,7 @@ class BasePresumido(models.Model):
 
 
 class AliquotaFixa(models.Model):
-    imposto = models.CharField(max_length=50)  # ISS, ICMS, INSS, PIS, COFINS
+    imposto = models.CharField(max_length=50, unique=True)  # ISS, ICMS, INSS, PIS, COFINS
     aliquota = models.DecimalField(max_digits=5, decimal_places=2)  # %
 
     def __str__(self):
@@ -236,10 +376,41 @@ class AliquotaFederal(models.Model):
         help_text="Ex: Receita, Lucro, Folha, etc."
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["imposto", "base_calculo"], name="aliquota_federal_imposto_base_uniq"),
+        ]
+
     def __str__(self):
         return f"{self.imposto} ({self.aliquota}%)"
 
 
+class VersaoTabelas(models.Model):
+    """
+    Cópia imutável das tabelas auxiliares (faixas do Simples, alíquotas, bases do
+    Presumido e CNAEs impedidos) com início de vigência. A versão aplicada a uma
+    simulação é a de maior vigencia_inicio <= competência.
+    """
+
+    vigencia_inicio = models.DateField(unique=True)
+    descricao = models.CharField(max_length=255, blank=True, default="")
+    snapshot = models.JSONField()
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-vigencia_inicio"]
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            anterior = VersaoTabelas.objects.filter(pk=self.pk).values_list("snapshot", flat=True).first()
+            if anterior is not None and anterior != self.snapshot:
+                raise ValueError("As tabelas de uma versão publicada não podem ser alteradas.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Tabelas vigentes desde {self.vigencia_inicio:%d/%m/%Y}"
+
+
 # ------------------------
 # Base DP (Planilha Gerencial)
 # ------------------------
@@ -252,3 +423,73 @@ class PlanilhaGerencial(models.Model):
     class Meta:
         managed = False
         db_table = "geral_planilha_gerencial"
+
+
+# ------------------------
+# Espelho do cadastro de empresas do SCI (Firebird)
+# ------------------------
+class EmpresaSCI(models.Model):
+    """
+    Dados da referência mais recente (BDREFEMP) de cada empresa do SCI, sincronizados
+    em lote pelo comando sincronizar_empresas_sci.
+    """
+
+    codigo = models.PositiveIntegerField(primary_key=True)  # BDCODEMP
+    referencia = models.CharField(max_length=32, blank=True, default="")  # BDREFEMP (ISO ou número)
+    razao_social = models.CharField(max_length=255, blank=True, default="")
+    cnpj = models.CharField(max_length=18, blank=True, default="")
+    cnpj_digitos = models.CharField(max_length=14, blank=True, default="", db_index=True)
+    cnae = models.CharField(max_length=10, blank=True, default="")
+    cod_cidade = models.IntegerField(null=True, blank=True)
+    municipio = models.CharField(max_length=100, blank=True, default="")
+    sincronizado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.codigo} - {self.razao_social}"
+
+
+# ------------------------
+# Jobs em segundo plano
+# ------------------------
+class Job(models.Model):
+    STATUS_PENDENTE = "pendente"
+    STATUS_EXECUTANDO = "executando"
+    STATUS_CONCLUIDO = "concluido"
+    STATUS_ERRO = "erro"
+    STATUS_CANCELADO = "cancelado"
+    STATUS_CHOICES = [
+        (STATUS_PENDENTE, "Pendente"),
+        (STATUS_EXECUTANDO, "Executando"),
+        (STATUS_CONCLUIDO, "Concluído"),
+        (STATUS_ERRO, "Erro"),
+        (STATUS_CANCELADO, "Cancelado"),
+    ]
+
+    tipo = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDENTE)
+    parametros = models.JSONField(default=dict, blank=True)
+    # Identifica jobs equivalentes (ex.: mesma consulta do balancete) para reaproveitar o que está em andamento
+    chave = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    resultado = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True, default="")
+
+    progresso = models.PositiveSmallIntegerField(default=0)  # %
+    mensagem = models.CharField(max_length=255, blank=True, default="")
+    cancelamento_solicitado = models.BooleanField(default=False)
+
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    max_tentativas = models.PositiveSmallIntegerField(default=3)
+    disponivel_em = models.DateTimeField()
+    worker = models.CharField(max_length=100, blank=True, default="")
+
+    criado_em = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    concluido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "disponivel_em"], name="job_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.tipo}) - {self.status}"
@@ -1,13 +1,15 @@
 from decimal import Decimal
 
+from django.db import transaction
 from rest_framework import serializers
 
 from .models import (
-    Empresa, Simulacao, Resultado,
+    Empresa, Simulacao, Resultado, ResumoSimulacao,
     CnaeImpedimento, CnaeAnexo, AnexoSimples, FaixaSimples,
     BasePresumido, AliquotaFixa, AliquotaFederal,
-    SimulacaoAnexoMercadoria, SimulacaoAnexoServico,
+    SimulacaoAnexoMercadoria, SimulacaoAnexoServico, Job, VersaoTabelas,
 )
+from .services.depara_regras import DeParaInvalido, PlanoDePara
 from .services.planilha_gerencial import obter_regime_por_cnpj
 
 # ------------------------
@@ -21,6 +23,7 @@ class EmpresaSerializer(serializers.ModelSerializer):
         model = Empresa
         fields = (
             "id",
+            "codigo_sci",
             "razao_social",
             "cnpj",
             "cnae_principal",
@@ -77,6 +80,12 @@ class ResultadoSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class ResumoSimulacaoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ResumoSimulacao
+        exclude = ("id", "simulacao")
+
+
 class EmpresaMiniSerializer(serializers.ModelSerializer):
     planilha_regime = serializers.SerializerMethodField()
 
@@ -149,6 +158,7 @@ class SimulacaoSerializer(serializers.ModelSerializer):
         write_only=True
     )
     resultados = ResultadoSerializer(many=True, read_only=True)
+    resumo = ResumoSimulacaoSerializer(read_only=True)
     anexos_mercadoria = SimulacaoAnexoMercadoriaSerializer(many=True, required=False)
     anexos_servico = SimulacaoAnexoServicoSerializer(many=True, required=False)
 
@@ -295,45 +305,131 @@ class SimulacaoSerializer(serializers.ModelSerializer):
 
         return attrs
 
-    def _salvar_rateios(self, instance, mercadorias, servicos):
-        SimulacaoAnexoMercadoria.objects.filter(simulacao=instance).delete()
-        for item in mercadorias:
-            SimulacaoAnexoMercadoria.objects.create(
-                simulacao=instance,
-                anexo=item["anexo"],
-                valor=item["valor"],
+    @staticmethod
+    def _sincronizar_rateios(modelo, existentes, itens, instance):
+        """
+        Sincroniza as linhas de rateio por diferença: reaproveita as linhas já
+        gravadas (mesmo anexo primeiro), e grava com bulk_create/bulk_update e um
+        único delete. O número de queries não depende da quantidade de anexos.
+        """
+        por_anexo = {}
+        for linha in existentes:
+            por_anexo.setdefault(linha.anexo_id, []).append(linha)
+
+        pendentes = []
+        alterar = []
+        for item in itens:
+            candidatas = por_anexo.get(item["anexo"].pk)
+            if candidatas:
+                linha = candidatas.pop(0)
+                if linha.valor != item["valor"]:
+                    linha.valor = item["valor"]
+                    alterar.append(linha)
+            else:
+                pendentes.append(item)
+
+        sobras = [linha for linhas in por_anexo.values() for linha in linhas]
+        inserir = []
+        for item in pendentes:
+            if sobras:
+                linha = sobras.pop(0)
+                linha.anexo = item["anexo"]
+                linha.valor = item["valor"]
+                alterar.append(linha)
+            else:
+                inserir.append(modelo(simulacao=instance, anexo=item["anexo"], valor=item["valor"]))
+
+        if sobras:
+            modelo.objects.filter(pk__in=[linha.pk for linha in sobras]).delete()
+        if alterar:
+            modelo.objects.bulk_update(alterar, ["anexo", "valor"])
+        if inserir:
+            modelo.objects.bulk_create(inserir)
+
+    def _salvar_rateios(self, instance, mercadorias, servicos, *, novo=False):
+        with transaction.atomic():
+            self._sincronizar_rateios(
+                SimulacaoAnexoMercadoria,
+                [] if novo else instance.anexos_mercadoria.all(),
+                mercadorias,
+                instance,
             )
-
-        SimulacaoAnexoServico.objects.filter(simulacao=instance).delete()
-        for item in servicos:
-            SimulacaoAnexoServico.objects.create(
-                simulacao=instance,
-                anexo=item["anexo"],
-                valor=item["valor"],
+            self._sincronizar_rateios(
+                SimulacaoAnexoServico,
+                [] if novo else instance.anexos_servico.all(),
+                servicos,
+                instance,
             )
 
     def create(self, validated_data):
         anexos_mercadoria = validated_data.pop("anexos_mercadoria", [])
         anexos_servico = validated_data.pop("anexos_servico", [])
 
-        instance = super().create(validated_data)
-        self._salvar_rateios(instance, anexos_mercadoria, anexos_servico)
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            self._salvar_rateios(instance, anexos_mercadoria, anexos_servico, novo=True)
         return instance
 
     def update(self, instance, validated_data):
         anexos_mercadoria = validated_data.pop("anexos_mercadoria", None)
         anexos_servico = validated_data.pop("anexos_servico", None)
 
-        instance = super().update(instance, validated_data)
-        if anexos_mercadoria is not None or anexos_servico is not None:
-            self._salvar_rateios(
-                instance,
-                anexos_mercadoria or [],
-                anexos_servico or [],
-            )
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if anexos_mercadoria is not None or anexos_servico is not None:
+                self._salvar_rateios(
+                    instance,
+                    anexos_mercadoria or [],
+                    anexos_servico or [],
+                )
         return instance
 
 
+class _MapaRelatedField(serializers.Field):
+    """
+    Resolve a chave informada em um dicionário pré-carregado no contexto
+    (context[mapa]), evitando uma consulta por linha na importação em lote.
+    """
+
+    default_error_messages = {
+        "does_not_exist": "Registro '{value}' não encontrado.",
+    }
+
+    def __init__(self, mapa, **kwargs):
+        self.mapa = mapa
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        chave = str(data).strip()
+        obj = self.context.get(self.mapa, {}).get(chave)
+        if obj is None:
+            self.fail("does_not_exist", value=chave)
+        return obj
+
+    def to_representation(self, value):
+        return value.pk
+
+
+class RateioImportacaoSerializer(serializers.Serializer):
+    anexo = _MapaRelatedField(mapa="anexos")
+    valor = serializers.DecimalField(max_digits=15, decimal_places=2)
+
+
+class SimulacaoImportacaoSerializer(SimulacaoSerializer):
+    """
+    Mesmas regras do SimulacaoSerializer, com relações resolvidas a partir dos
+    mapas carregados uma única vez pela importação em lote.
+    """
+
+    empresa_id = _MapaRelatedField(mapa="empresas", source="empresa", write_only=True)
+    anexo_manual = _MapaRelatedField(mapa="anexos", required=False, allow_null=True)
+    anexos_mercadoria = RateioImportacaoSerializer(many=True, required=False)
+    anexos_servico = RateioImportacaoSerializer(many=True, required=False)
+
+    class Meta(SimulacaoSerializer.Meta):
+        pass
+
+
 # ------------------------
 # TABELAS AUXILIARES
 # ------------------------
@@ -363,6 +459,18 @@ class AliquotaFederalSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class VersaoTabelasSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VersaoTabelas
+        fields = ("id", "vigencia_inicio", "descricao", "snapshot", "criado_em")
+        read_only_fields = ("snapshot", "criado_em")
+
+
+class VersaoTabelasResumoSerializer(VersaoTabelasSerializer):
+    class Meta(VersaoTabelasSerializer.Meta):
+        fields = ("id", "vigencia_inicio", "descricao", "criado_em")
+
+
 class BalanceteDeParaItemSerializer(serializers.Serializer):
     id = serializers.CharField(read_only=True)
     parametro = serializers.CharField()
@@ -379,3 +487,91 @@ class BalanceteDeParaItemSerializer(serializers.Serializer):
     customKey = serializers.CharField(required=False, allow_blank=True, allow_null=True)
     ativo = serializers.BooleanField(required=False, default=True)
     descricao = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+    def validate(self, attrs):
+        # Regex inválida é recusada aqui, antes de chegar ao plano compilado do DE-PARA
+        if attrs.get("matchType") == "regex":
+            try:
+                PlanoDePara([{**attrs, "parametro": attrs.get("parametro") or "-"}])
+            except DeParaInvalido as exc:
+                raise serializers.ValidationError({"contas": str(exc)})
+        return attrs
+
+
+# ------------------------
+# PROJEÇÃO MENSAL
+# ------------------------
+def _decimal_mensal(**kwargs):
+    return serializers.DecimalField(max_digits=15, decimal_places=2, required=False, **kwargs)
+
+
+class ProjecaoMesSerializer(serializers.Serializer):
+    competencia = serializers.DateField(input_formats=["%Y-%m", "%Y-%m-%d"])
+    receita_mercadorias = _decimal_mensal()
+    receita_servicos = _decimal_mensal()
+    receita_exportacao = _decimal_mensal()
+    folha_total = _decimal_mensal()
+    inss_patronal = _decimal_mensal()
+    custo_mercadorias = _decimal_mensal()
+    custo_servicos = _decimal_mensal()
+    despesas_operacionais = _decimal_mensal()
+    outras_despesas = _decimal_mensal()
+    despesas_nao_dedutiveis = _decimal_mensal()
+    adicoes_fiscais = _decimal_mensal()
+    exclusoes_fiscais = _decimal_mensal()
+    creditos_pis = _decimal_mensal()
+    creditos_cofins = _decimal_mensal()
+    lucro_contabil = _decimal_mensal(allow_null=True)
+
+    def validate_competencia(self, value):
+        return value.replace(day=1)
+
+
+class ProjecaoSerializer(serializers.Serializer):
+    """Meses informados sobrescrevem a média mensal da simulação campo a campo."""
+    meses = ProjecaoMesSerializer(many=True, required=False)
+    quantidade = serializers.IntegerField(min_value=1, max_value=120, required=False, default=12)
+    meses_no_periodo = serializers.IntegerField(min_value=1, required=False, default=1)
+    historico_receitas = serializers.ListField(
+        child=serializers.DecimalField(max_digits=15, decimal_places=2),
+        max_length=12,
+        required=False,
+    )
+
+    def validate_meses(self, value):
+        competencias = [mes["competencia"] for mes in value]
+        if len(set(competencias)) != len(competencias):
+            raise serializers.ValidationError("Competências repetidas na projeção.")
+        return value
+
+
+# ------------------------
+# JOBS
+# ------------------------
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = (
+            "id",
+            "tipo",
+            "status",
+            "parametros",
+            "resultado",
+            "erro",
+            "progresso",
+            "mensagem",
+            "cancelamento_solicitado",
+            "tentativas",
+            "max_tentativas",
+            "criado_em",
+            "iniciado_em",
+            "concluido_em",
+        )
+        read_only_fields = [f for f in fields if f not in ("tipo", "parametros", "max_tentativas")]
+
+
+class JobResumoSerializer(JobSerializer):
+    """Listagem sem o resultado (pode ser grande)."""
+
+    class Meta(JobSerializer.Meta):
+        fields = tuple(f for f in JobSerializer.Meta.fields if f != "resultado")
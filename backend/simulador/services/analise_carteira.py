@@ -0,0 +1,180 @@
+import hashlib
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from django.core.cache import cache
+from django.db.models import (
+    Avg, Case, Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value, When,
+)
+
+from simulador.models import Empresa, ResumoSimulacao, Simulacao
+from simulador.services import versoes
+
+# Alterações em qualquer destes modelos (em qualquer worker) mudam a versão e
+# descartam os agregados em cache
+MODELOS_CARTEIRA = (Simulacao, ResumoSimulacao, Empresa)
+versoes.registrar(*MODELOS_CARTEIRA)
+
+_CACHE_TIMEOUT = None  # invalidado pela versão dos modelos
+
+AGRUPAMENTOS = {
+    "cnae": "simulacao__empresa__cnae_principal",
+    "uf": "simulacao__empresa__uf",
+}
+
+
+def _fmt(valor: Optional[Decimal]) -> str:
+    return f"{Decimal(valor or 0).quantize(Decimal('0.01')):.2f}"
+
+
+def _carga_atual():
+    return Case(
+        When(simulacao__regime_atual="Simples", then=F("carga_simples")),
+        When(simulacao__regime_atual="Presumido", then=F("carga_presumido")),
+        When(simulacao__regime_atual="Real", then=F("carga_real")),
+        default=Value(None),
+        output_field=DecimalField(max_digits=9, decimal_places=2),
+    )
+
+
+def _carga_vencedor():
+    return Case(
+        When(vencedor="Simples", then=F("carga_simples")),
+        When(vencedor="Presumido", then=F("carga_presumido")),
+        default=F("carga_real"),
+        output_field=DecimalField(max_digits=9, decimal_places=2),
+    )
+
+
+def _resumos_mais_recentes(
+    data_inicio=None,
+    data_fim=None,
+    regime: Optional[str] = None,
+    cnae: Optional[str] = None,
+):
+    """
+    Resumos da simulação processada mais recente de cada empresa (no período),
+    filtrados. O regime é filtrado depois de escolher a mais recente: uma empresa
+    que mudou de regime não entra pelo regime de uma simulação antiga.
+    """
+    simulacoes = Simulacao.objects.filter(resumo__isnull=False)
+    if data_inicio:
+        simulacoes = simulacoes.filter(data__gte=data_inicio)
+    if data_fim:
+        simulacoes = simulacoes.filter(data__lte=data_fim)
+    if cnae:
+        simulacoes = simulacoes.filter(empresa__cnae_principal__startswith=cnae)
+
+    ultima_por_empresa = (
+        simulacoes
+        .filter(empresa=OuterRef("simulacao__empresa"))
+        .order_by()
+        .values("empresa")
+        .annotate(ultima=Max("id"))
+        .values("ultima")
+    )
+    resumos = ResumoSimulacao.objects.filter(simulacao_id=Subquery(ultima_por_empresa))
+    if regime:
+        resumos = resumos.filter(simulacao__regime_atual=regime)
+    return resumos.annotate(carga_atual=_carga_atual(), carga_vencedor=_carga_vencedor())
+
+
+def _calcular(filtros: Dict[str, Any], agrupar_por: str) -> Dict[str, Any]:
+    resumos = _resumos_mais_recentes(**filtros)
+    migra = ~Q(vencedor=F("simulacao__regime_atual")) & Q(economia_potencial__gt=0)
+
+    geral = resumos.aggregate(
+        empresas=Count("id"),
+        empresas_com_economia=Count("id", filter=migra),
+        economia_total=Sum("economia_potencial", filter=migra),
+        carga_media_atual=Avg("carga_atual"),
+        carga_media_vencedor=Avg("carga_vencedor"),
+    )
+
+    migracoes = (
+        resumos.filter(migra)
+        .values("simulacao__regime_atual", "vencedor")
+        .annotate(empresas=Count("id"), economia=Sum("economia_potencial"))
+        .order_by("-economia")
+    )
+
+    campo = AGRUPAMENTOS[agrupar_por]
+    distribuicao = (
+        resumos
+        .values(campo)
+        .annotate(
+            empresas=Count("id"),
+            carga_media_atual=Avg("carga_atual"),
+            carga_media_vencedor=Avg("carga_vencedor"),
+            carga_media_simples=Avg("carga_simples"),
+            carga_media_presumido=Avg("carga_presumido"),
+            carga_media_real=Avg("carga_real"),
+            economia=Sum("economia_potencial", filter=migra),
+        )
+        .order_by(campo)
+    )
+
+    return {
+        "empresas": geral["empresas"],
+        "empresas_com_economia": geral["empresas_com_economia"],
+        "economia_total": _fmt(geral["economia_total"]),
+        "carga_media_atual": _fmt(geral["carga_media_atual"]),
+        "carga_media_vencedor": _fmt(geral["carga_media_vencedor"]),
+        "migracoes": [
+            {
+                "de": m["simulacao__regime_atual"],
+                "para": m["vencedor"],
+                "empresas": m["empresas"],
+                "economia": _fmt(m["economia"]),
+            }
+            for m in migracoes
+        ],
+        "agrupado_por": agrupar_por,
+        "distribuicao": [
+            {
+                agrupar_por: d[campo],
+                "empresas": d["empresas"],
+                "carga_media_atual": _fmt(d["carga_media_atual"]),
+                "carga_media_vencedor": _fmt(d["carga_media_vencedor"]),
+                "carga_media": {
+                    "Simples": _fmt(d["carga_media_simples"]),
+                    "Presumido": _fmt(d["carga_media_presumido"]),
+                    "Real": _fmt(d["carga_media_real"]),
+                },
+                "economia": _fmt(d["economia"]),
+            }
+            for d in distribuicao
+        ],
+    }
+
+
+def analisar_carteira(
+    data_inicio=None,
+    data_fim=None,
+    regime: Optional[str] = None,
+    cnae: Optional[str] = None,
+    agrupar_por: str = "uf",
+) -> Dict[str, Any]:
+    """
+    Agregados da carteira (última simulação processada por empresa).
+    O resultado fica em cache até a próxima alteração de simulação, resumo ou empresa.
+    """
+    if agrupar_por not in AGRUPAMENTOS:
+        raise ValueError(f"Agrupamento inválido: {agrupar_por}. Use 'cnae' ou 'uf'.")
+
+    filtros = {
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "regime": regime,
+        "cnae": cnae,
+    }
+    chave = "analise_carteira:" + hashlib.sha1("{}:{}:{}".format(
+        versoes.assinatura(*MODELOS_CARTEIRA),
+        agrupar_por,
+        ":".join(str(filtros[k] or "") for k in sorted(filtros)),
+    ).encode()).hexdigest()
+    dados = cache.get(chave)
+    if dados is None:
+        dados = _calcular(filtros, agrupar_por)
+        cache.set(chave, dados, _CACHE_TIMEOUT)
+    return dados
@@ -0,0 +1,184 @@
+"""
+Árvore do plano de contas a partir do BDCTALON das linhas do balancete
+(ex.: 03 > 03.1 > 03.1.1 > 03.1.1.01). Os totais de todos os nós são calculados
+em uma única passada pós-ordem; depois disso qualquer consulta por grupo é um
+acesso ao dicionário de nós.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+D = Decimal
+
+# Diferença tolerada entre o saldo informado da conta sintética e a soma das filhas
+TOLERANCIA = D("0.01")
+
+
+def chave_conta(codigo: Any) -> str:
+    """Código normalizado por segmento: '03.1.01' -> '3.1.1' (zeros à esquerda não importam)."""
+    segmentos = []
+    for parte in str(codigo or "").strip().replace(",", ".").split("."):
+        parte = parte.strip()
+        if not parte:
+            continue
+        digitos = "".join(ch for ch in parte if ch.isdigit())
+        segmentos.append(str(int(digitos)) if digitos and digitos == parte else parte)
+    return ".".join(segmentos)
+
+
+def _decimal(valor: Any) -> Optional[Decimal]:
+    if valor is None or valor == "":
+        return None
+    try:
+        return D(str(valor))
+    except InvalidOperation:
+        return None
+
+
+@dataclass
+class NoConta:
+    chave: str
+    codigo: str = ""
+    nome: str = ""
+    analitica: bool = False
+    informado: Optional[Decimal] = None  # saldo da linha do balancete (None: conta sem linha)
+    linha: Optional[Dict[str, Any]] = None
+    filhos: List["NoConta"] = field(default_factory=list)
+    total: Decimal = D("0")
+    divergencia: Optional[Decimal] = None
+
+    @property
+    def nivel(self) -> int:
+        return self.chave.count(".") + 1
+
+    def como_dict(self, profundidade: Optional[int] = None) -> Dict[str, Any]:
+        dados = {
+            "codigo": self.codigo or self.chave,
+            "nome": self.nome,
+            "analitica": self.analitica,
+            "informado": None if self.informado is None else str(self.informado),
+            "total": str(self.total),
+        }
+        if self.divergencia is not None:
+            dados["divergencia"] = str(self.divergencia)
+        if self.filhos:
+            if profundidade is None or profundidade > 1:
+                proxima = None if profundidade is None else profundidade - 1
+                dados["filhos"] = [filho.como_dict(proxima) for filho in self.filhos]
+            else:
+                dados["qtd_filhos"] = len(self.filhos)
+        return dados
+
+
+class ArvoreContas:
+    """
+    Totais por nó:
+    - folha: o saldo informado;
+    - conta sintética: soma dos totais das filhas (o saldo informado só é
+      comparado, e a diferença fica em `divergencia`);
+    - conta analítica com filhas: saldo próprio mais as filhas.
+    """
+
+    def __init__(
+        self,
+        linhas: Iterable[Dict[str, Any]],
+        campo: str = "bdsaldo_atual",
+        campo_codigo: str = "bdctalon",
+    ):
+        self.campo = campo
+        self.nos: Dict[str, NoConta] = {}
+        for linha in linhas:
+            chave = chave_conta(linha.get(campo_codigo))
+            if not chave:
+                continue
+            no = self._no(chave)
+            valor = _decimal(linha.get(campo))
+            no.informado = (no.informado or D("0")) + valor if valor is not None else no.informado
+            no.codigo = str(linha.get(campo_codigo)).strip()
+            no.nome = str(linha.get("bdnomcta") or "").strip()
+            no.analitica = conta_analitica(linha)
+            no.linha = linha
+        self.raizes = sorted(
+            (no for chave, no in self.nos.items() if "." not in chave),
+            key=lambda no: _ordem(no.chave),
+        )
+        self._acumular()
+
+    def _no(self, chave: str) -> NoConta:
+        """Nó da chave, criando os ancestrais ausentes (grupos sem linha no balancete)."""
+        no = self.nos.get(chave)
+        if no is not None:
+            return no
+        no = self.nos[chave] = NoConta(chave=chave)
+        if "." in chave:
+            self._no(chave.rsplit(".", 1)[0]).filhos.append(no)
+        return no
+
+    def _acumular(self) -> None:
+        # Pós-ordem iterativa: filhos antes do pai, sem recursão
+        pilha: List[Tuple[NoConta, bool]] = [(raiz, False) for raiz in reversed(self.raizes)]
+        while pilha:
+            no, visitado = pilha.pop()
+            if not visitado:
+                no.filhos.sort(key=lambda filho: _ordem(filho.chave))
+                pilha.append((no, True))
+                pilha.extend((filho, False) for filho in reversed(no.filhos))
+                continue
+            if not no.filhos:
+                no.total = no.informado or D("0")
+                continue
+            soma = sum((filho.total for filho in no.filhos), D("0"))
+            if no.analitica:
+                no.total = soma + (no.informado or D("0"))
+                continue
+            no.total = soma
+            if no.informado is not None and abs(no.informado - soma) > TOLERANCIA:
+                no.divergencia = no.informado - soma
+
+    # --------------------------
+    # CONSULTAS
+    # --------------------------
+    def no(self, codigo: Any) -> Optional[NoConta]:
+        return self.nos.get(chave_conta(codigo))
+
+    def total(self, codigo: Any) -> Decimal:
+        """Total do grupo (conta e todas as descendentes), sem dupla contagem."""
+        no = self.no(codigo)
+        return no.total if no is not None else D("0")
+
+    def soma(self, codigos: Sequence[Any]) -> Decimal:
+        """Soma dos grupos; um grupo contido em outro da lista não é somado de novo."""
+        chaves = sorted({chave_conta(c) for c in codigos if chave_conta(c)})
+        selecionadas: List[str] = []
+        for chave in chaves:
+            if any(chave.startswith(pai + ".") for pai in selecionadas):
+                continue
+            selecionadas.append(chave)
+        return sum((self.nos[chave].total for chave in selecionadas if chave in self.nos), D("0"))
+
+    def divergencias(self) -> List[Dict[str, str]]:
+        return [
+            {
+                "codigo": no.codigo or no.chave,
+                "nome": no.nome,
+                "informado": str(no.informado),
+                "soma_filhas": str(no.total),
+                "diferenca": str(no.divergencia),
+            }
+            for no in sorted(self.nos.values(), key=lambda no: _ordem(no.chave))
+            if no.divergencia is not None
+        ]
+
+    def como_dict(self, profundidade: Optional[int] = None) -> List[Dict[str, Any]]:
+        return [raiz.como_dict(profundidade) for raiz in self.raizes]
+
+
+def conta_analitica(linha: Dict[str, Any]) -> bool:
+    try:
+        return int(linha.get("bdtipcta") or 0) > 0
+    except (TypeError, ValueError):
+        return False
+
+
+def _ordem(chave: str) -> Tuple:
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in chave.split("."))
@@ -0,0 +1,114 @@
+"""
+Consulta do balancete em segundo plano (submeter e acompanhar). O estado fica
+na tabela Job (tarefa "balancete" de services/tarefas.py), visível a todos os
+workers. O worker HTTP reserva o job e o executa no pool dedicado ao fdb; se o
+processo cair no meio, o `jobs_worker` devolve o job à fila (recuperar_travados)
+e o executa.
+"""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from simulador.models import Job
+from simulador.services import jobs, tarefas  # noqa: F401 - tarefas registra o tipo "balancete"
+from simulador.services.firebird_balancete import chave_balancete
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+TIPO = "balancete"
+
+STATUS_PENDENTE = Job.STATUS_PENDENTE
+STATUS_EXECUTANDO = Job.STATUS_EXECUTANDO
+STATUS_CONCLUIDO = Job.STATUS_CONCLUIDO
+STATUS_ERRO = Job.STATUS_ERRO
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Pool dedicado às chamadas do fdb; limita quantas consultas rodam ao mesmo tempo."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=int(getattr(settings, "BALANCETE_MAX_CONCORRENCIA", 4)),
+                thread_name_prefix="balancete",
+            )
+        return _executor
+
+
+def _chave(params: Dict[str, Any]) -> str:
+    return hashlib.sha1(chave_balancete(**params).encode()).hexdigest()
+
+
+def _iso(instante) -> Optional[str]:
+    return instante.isoformat() if instante else None
+
+
+def _como_dict(job: Job) -> Dict[str, Any]:
+    dados = {
+        "id": job.pk,
+        "status": job.status,
+        "chave": job.chave,
+        "tentativas": job.tentativas,
+        "criado_em": _iso(job.criado_em),
+        "iniciado_em": _iso(job.iniciado_em),
+        "concluido_em": _iso(job.concluido_em),
+    }
+    if job.status == Job.STATUS_CONCLUIDO:
+        dados["resultado"] = job.resultado
+    elif job.status == Job.STATUS_ERRO:
+        # Falhas esperadas (BalanceteError) gravam só a mensagem; as inesperadas, também o traceback
+        detalhe, _, traceback = job.erro.partition("\n\n")
+        dados["detail"] = detalhe
+        dados["http_status"] = 500 if traceback else 400
+    return dados
+
+
+def obter_job(job_id) -> Optional[Dict[str, Any]]:
+    try:
+        job = Job.objects.get(pk=int(job_id), tipo=TIPO)
+    except (Job.DoesNotExist, TypeError, ValueError):
+        return None
+    return _como_dict(job)
+
+
+def submeter_balancete(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Grava o job e o agenda no pool dedicado. Se já houver um job pendente ou em
+    execução para a mesma consulta (em qualquer worker), devolve esse job.
+    """
+    chave = _chave(params)
+    existente = (
+        Job.objects
+        .filter(tipo=TIPO, chave=chave, status__in=(Job.STATUS_PENDENTE, Job.STATUS_EXECUTANDO))
+        .order_by("id")
+        .first()
+    )
+    if existente is not None:
+        return {**_como_dict(existente), "compartilhado": True}
+
+    job = jobs.enfileirar(TIPO, params, chave=chave)
+    # Reserva condicional: se o jobs_worker já pegou o job, ele executa
+    reservado = Job.objects.filter(pk=job.pk, status=Job.STATUS_PENDENTE).update(
+        status=Job.STATUS_EXECUTANDO,
+        worker=jobs.identificador_worker(),
+        iniciado_em=timezone.now(),
+    )
+    if reservado:
+        job.refresh_from_db()
+        _get_executor().submit(_executar, job.pk)
+    return _como_dict(job)
+
+
+def _executar(job_id: int) -> None:
+    # Thread do pool: conexão própria, fechada ao final (o request_finished não passa por aqui)
+    close_old_connections()
+    try:
+        jobs.executar(Job.objects.get(pk=job_id))
+    finally:
+        connection.close()
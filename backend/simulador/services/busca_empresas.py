@@ -0,0 +1,75 @@
+from typing import Any, Dict, List
+
+from django.db.models import Q
+
+from simulador.models import Empresa, normalizar_busca, somente_digitos
+from simulador.services import versoes
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 50
+
+# Campos devolvidos na busca (sem a consulta à planilha gerencial do serializer completo)
+CAMPOS_BUSCA = (
+    "id",
+    "codigo_sci",
+    "razao_social",
+    "cnpj",
+    "cnae_principal",
+    "municipio",
+    "uf",
+    "regime_tributario",
+)
+
+# O ETag da busca vem da versão das empresas
+versoes.registrar(Empresa)
+
+
+def _filtros(nome: str, digitos: str, *, prefixo: bool) -> Q:
+    sufixo = "istartswith" if prefixo else "icontains"
+    filtros = Q(**{f"razao_social_busca__{sufixo}": nome})
+    if digitos:
+        filtros |= Q(**{f"cnpj_digitos__{sufixo}": digitos})
+        if prefixo and digitos == nome.replace(" ", "") and len(digitos) <= 9:
+            filtros |= Q(codigo_sci=int(digitos))
+    return filtros
+
+
+def buscar_empresas(termo: str, limite: int = LIMITE_PADRAO) -> List[Dict[str, Any]]:
+    """
+    Busca por razão social, dígitos do CNPJ ou código SCI.
+    Primeiro os inícios de texto (índices das colunas de busca); só se faltarem
+    resultados para o limite é feita a busca por trecho, restrita ao que falta.
+    """
+    limite = max(1, min(int(limite), LIMITE_MAXIMO))
+    nome = normalizar_busca(termo)
+    base = Empresa.objects.order_by("razao_social_busca", "id").values(*CAMPOS_BUSCA)
+    if not nome:
+        return list(base[:limite])
+
+    digitos = somente_digitos(termo)
+    resultados = list(base.filter(_filtros(nome, digitos, prefixo=True))[:limite])
+    if len(resultados) < limite:
+        encontrados = [item["id"] for item in resultados]
+        resultados += list(
+            base.filter(_filtros(nome, digitos, prefixo=False))
+            .exclude(id__in=encontrados)[: limite - len(resultados)]
+        )
+    return resultados
+
+
+def reindexar_busca(tamanho_lote: int = 1000) -> int:
+    """Recalcula as colunas de busca de todas as empresas (cadastros anteriores às colunas)."""
+    atualizadas = 0
+    lote = []
+    for empresa in Empresa.objects.only("id", "razao_social", "cnpj").iterator(chunk_size=tamanho_lote):
+        empresa.razao_social_busca = normalizar_busca(empresa.razao_social)
+        empresa.cnpj_digitos = somente_digitos(empresa.cnpj)
+        lote.append(empresa)
+        if len(lote) >= tamanho_lote:
+            atualizadas += Empresa.objects.bulk_update(lote, ["razao_social_busca", "cnpj_digitos"])
+            lote = []
+    if lote:
+        atualizadas += Empresa.objects.bulk_update(lote, ["razao_social_busca", "cnpj_digitos"])
+    if atualizadas:
+        versoes.tocar(Empresa)  # bulk_update não dispara signals
+    return atualizadas
@@ -0,0 +1,179 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from simulador.models import ResultadoCalculoCache
+
+# A cada quantas gravações o tamanho da tabela é verificado
+_INTERVALO_PODA = 100
+
+
+class _LRU:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._itens: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+    def obter(self, chave: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave: str, valor: Dict[str, str], limite: int) -> int:
+        """Guarda o valor e devolve quantos itens foram descartados."""
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            descartados = 0
+            while len(self._itens) > limite:
+                self._itens.popitem(last=False)
+                descartados += 1
+            return descartados
+
+    def __len__(self):
+        return len(self._itens)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+
+class _Contadores:
+    NOMES = ("acertos_memoria", "acertos_banco", "falhas", "gravacoes", "descartes_memoria", "descartes_banco")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores = dict.fromkeys(self.NOMES, 0)
+
+    def incrementar(self, nome: str, quantidade: int = 1) -> int:
+        with self._lock:
+            self.valores[nome] += quantidade
+            return self.valores[nome]
+
+    def copia(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.valores)
+
+    def zerar(self) -> None:
+        with self._lock:
+            self.valores = dict.fromkeys(self.NOMES, 0)
+
+
+_memoria = _LRU()
+contadores = _Contadores()
+
+
+def _limite_memoria() -> int:
+    return max(1, int(getattr(settings, "RESULTADO_CACHE_MEMORIA", 2048)))
+
+
+def _limite_banco() -> int:
+    return max(1, int(getattr(settings, "RESULTADO_CACHE_BANCO", 50000)))
+
+
+def _chave(regime: str, impressao: str) -> str:
+    return f"{regime}:{impressao}"
+
+
+def obter_varios(impressoes: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """
+    regime -> impressão das entradas; devolve o detalhamento dos regimes já
+    calculados (memória, depois banco em uma única consulta por chave__in).
+    """
+    encontrados: Dict[str, Dict[str, str]] = {}
+    faltantes: Dict[str, str] = {}
+    for regime, impressao in impressoes.items():
+        chave = _chave(regime, impressao)
+        valor = _memoria.obter(chave)
+        if valor is None:
+            faltantes[chave] = regime
+        else:
+            encontrados[regime] = valor
+    if encontrados:
+        contadores.incrementar("acertos_memoria", len(encontrados))
+    if not faltantes:
+        return encontrados
+
+    do_banco = dict(
+        ResultadoCalculoCache.objects.filter(chave__in=list(faltantes)).values_list("chave", "detalhado")
+    )
+    if do_banco:
+        ResultadoCalculoCache.objects.filter(chave__in=list(do_banco)).update(
+            acessos=F("acessos") + 1,
+            ultimo_acesso=timezone.now(),
+        )
+        contadores.incrementar("acertos_banco", len(do_banco))
+        for chave, valor in do_banco.items():
+            _guardar_memoria(chave, valor)
+            encontrados[faltantes[chave]] = valor
+    if len(do_banco) < len(faltantes):
+        contadores.incrementar("falhas", len(faltantes) - len(do_banco))
+    return encontrados
+
+
+def guardar_varios(calculados: Dict[str, Tuple[str, Dict[str, str]]]) -> None:
+    """regime -> (impressão, detalhamento): grava tudo com um único INSERT (upsert pela chave)."""
+    if not calculados:
+        return
+    agora = timezone.now()
+    linhas = []
+    for regime, (impressao, detalhado) in calculados.items():
+        chave = _chave(regime, impressao)
+        _guardar_memoria(chave, detalhado)
+        linhas.append(ResultadoCalculoCache(chave=chave, regime=regime, detalhado=detalhado, ultimo_acesso=agora))
+    # MySQL (ON DUPLICATE KEY UPDATE) não aceita indicar a coluna única
+    alvo = ["chave"] if connection.features.supports_update_conflicts_with_target else None
+    ResultadoCalculoCache.objects.bulk_create(
+        linhas,
+        update_conflicts=True,
+        unique_fields=alvo,
+        update_fields=["regime", "detalhado", "ultimo_acesso"],
+    )
+    gravacoes = contadores.incrementar("gravacoes", len(linhas))
+    if gravacoes // _INTERVALO_PODA != (gravacoes - len(linhas)) // _INTERVALO_PODA:
+        podar_banco()
+
+
+def _guardar_memoria(chave: str, valor: Dict[str, str]) -> None:
+    descartados = _memoria.guardar(chave, valor, _limite_memoria())
+    if descartados:
+        contadores.incrementar("descartes_memoria", descartados)
+
+
+def podar_banco() -> int:
+    """Remove as entradas menos acessadas recentemente além do limite configurado."""
+    excedente = ResultadoCalculoCache.objects.count() - _limite_banco()
+    if excedente <= 0:
+        return 0
+    ids = list(
+        ResultadoCalculoCache.objects.order_by("ultimo_acesso", "id").values_list("id", flat=True)[:excedente]
+    )
+    removidos, _ = ResultadoCalculoCache.objects.filter(id__in=ids).delete()
+    contadores.incrementar("descartes_banco", removidos)
+    return removidos
+
+
+def metricas() -> Dict[str, Any]:
+    valores = contadores.copia()
+    acertos = valores["acertos_memoria"] + valores["acertos_banco"]
+    consultas = acertos + valores["falhas"]
+    return {
+        **valores,
+        "taxa_acerto": round(acertos / consultas, 4) if consultas else None,
+        "itens_memoria": len(_memoria),
+        "limite_memoria": _limite_memoria(),
+        "limite_banco": _limite_banco(),
+    }
+
+
+def limpar(banco: bool = False) -> None:
+    _memoria.limpar()
+    contadores.zerar()
+    if banco:
+        ResultadoCalculoCache.objects.all().delete()
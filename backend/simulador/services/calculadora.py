@@ -1,13 +1,16 @@
+import hashlib
+import json
+from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
 
 from django.db import transaction
-from simulador.models import (
-    Simulacao, Resultado,
-    CnaeImpedimento, FaixaSimples,
-    BasePresumido, AliquotaFixa, AliquotaFederal
-)
+from simulador.services import cache_resultados
+from simulador.services.metricas import medido
+from simulador.services.simples_tabela import ForaDoSimples
+from simulador.services.tabelas_versionadas import tabelas_para
+from simulador.models import Simulacao, Resultado, ResumoSimulacao
 
 D = Decimal  # atalho
 
@@ -19,22 +22,63 @@ def _q(v) -> Decimal:
     return D(str(v)).quantize(D("0.01"), rounding=ROUND_HALF_UP)
 
 
+REGIMES = ("Simples", "Presumido", "Real")
+
+# Incrementar quando as fórmulas mudarem: invalida os hashes gravados
+VERSAO_CALCULO = 2
+
+# Chave do detalhamento com o motivo de o regime não ser aplicável (fica fora dos totais e do vencedor)
+INELEGIVEL = "INELEGIVEL"
+
+_ENTRADAS_INSS = ("folha_total", "inss_patronal", "aliquota_inss_total")
+_ENTRADAS_ISS_ICMS = ("receita_mercadorias", "receita_servicos", "receita_exportacao", "aliquota_iss", "aliquota_icms")
+
+# Campos da Simulacao que influenciam cada regime. Alterações fora da lista de um
+# regime não o invalidam no reprocessamento incremental.
+DEPENDENCIAS_REGIME = {
+    "Simples": (
+        "receita_total", "receita_mercadorias", "receita_servicos", "receita_12_meses",
+    ),
+    "Presumido": (
+        "receita_total", "aliquota_pis", "aliquota_cofins",
+        "presumido_irpj_merc", "presumido_csll_merc", "presumido_irpj_serv", "presumido_csll_serv",
+    ) + _ENTRADAS_INSS + _ENTRADAS_ISS_ICMS,
+    "Real": (
+        "receita_total", "aliquota_pis", "aliquota_cofins",
+        "lucro_contabil", "custo_mercadorias", "custo_servicos", "despesas_operacionais", "outras_despesas",
+        "adicoes_fiscais", "exclusoes_fiscais", "despesas_nao_dedutiveis", "creditos_pis", "creditos_cofins",
+    ) + _ENTRADAS_INSS + _ENTRADAS_ISS_ICMS,
+}
+
+
+def _canonico(valor):
+    # int entra como número: o default 0 do modelo e o Decimal("0.0000") lido do banco têm o mesmo hash
+    if valor is None or isinstance(valor, (bool, str)):
+        return valor
+    return format(D(str(valor)).normalize(), "f")
+
+
 @dataclass
 class TotaisRegime:
     itens: Dict[str, Decimal]
     total: Decimal
+    inelegivel: str = ""  # motivo, quando o regime não se aplica à empresa
 
 
 class CalculadoraTributaria:
     """
     Calcula Simples, Presumido e Real para uma Simulacao e persiste em Resultado.
-    Parametrizações via tabelas auxiliares (Faixas, BasePresumido, Aliquotas, etc.).
+    Parametrizações via tabelas auxiliares (Faixas, BasePresumido, Aliquotas, etc.),
+    na versão vigente para a competência da simulação (ver tabelas_versionadas).
     """
 
     def __init__(self, simulacao: Simulacao, meses_no_periodo: int = 1):
         self.s = simulacao
         self.empresa = simulacao.empresa
         self.meses = max(1, int(meses_no_periodo))
+        # Tabelas auxiliares da competência (versão publicada ou as atuais)
+        self.competencia = self.s.competencia or self.s.data or date.today()
+        self.tabelas = tabelas_para(self.competencia)
 
         # atalhos (já em Decimal)
         self.receita_total = _q(self.s.receita_total)
@@ -85,43 +129,120 @@ class CalculadoraTributaria:
         self.receita_domestica = _q(self.receita_total - self.receita_exportacao)
         self.fator_r = _q(0 if self.receita_total == 0 else self.folha_total / self.receita_total)
 
+        # Linhas de Resultado do processamento, gravadas em lote ao final
+        self._pendentes: Dict[Tuple[str, str], Decimal] = {}
+
     # --------------------------
     # PÚBLICO
     # --------------------------
+    @medido("calculadora")
     @transaction.atomic
-    def processar(self):
-        """Processa os 3 regimes e salva na tabela Resultado."""
+    def processar(self, *, force: bool = False):
+        """
+        Processa os regimes e salva na tabela Resultado. Só recalcula os regimes
+        cujas entradas mudaram desde o último processamento (force=True recalcula todos).
+        Regimes com entradas já calculadas em outra simulação vêm do cache_resultados.
+        """
         if self.receita_12_meses <= 0:
             raise ValueError("Receita dos últimos 12 meses não informada para a simulação.")
 
-        Resultado.objects.filter(simulacao=self.s).delete()
-
-        simples = self._calcular_simples()
-        presumido = self._calcular_presumido()
-        real = self._calcular_real()
-
-        self._registrar("Simples", "TOTAL", simples.total)
-        self._registrar("Presumido", "TOTAL", presumido.total)
-        self._registrar("Real", "TOTAL", real.total)
+        hashes = self._hashes_entradas()
+        self._pendentes.clear()
+        anterior = ResumoSimulacao.objects.filter(simulacao=self.s).first()
+        regimes = {}
+        if anterior is not None and not force:
+            for regime in REGIMES:
+                salvo = anterior.detalhado.get(regime)
+                if salvo and anterior.hashes_entradas.get(regime) == hashes[regime]:
+                    regimes[regime] = self._totais_de_dict(salvo)
+        recalcular = [regime for regime in REGIMES if regime not in regimes]
+
+        if recalcular:
+            Resultado.objects.filter(simulacao=self.s, regime__in=recalcular).delete()
+        calculos = {
+            "Simples": self._calcular_simples,
+            "Presumido": self._calcular_presumido,
+            "Real": self._calcular_real,
+        }
+        em_cache = {} if force else cache_resultados.obter_varios({r: hashes[r] for r in recalcular})
+        do_cache, calculados = [], {}
+        for regime in recalcular:
+            if regime in em_cache:
+                # Entradas idênticas a um cálculo anterior (clone, re-gravação)
+                regimes[regime] = self._totais_de_dict(em_cache[regime])
+                self._registrar_itens(regime, regimes[regime])
+                do_cache.append(regime)
+                continue
+            regimes[regime] = calculos[regime]()
+            self._registrar(regime, "TOTAL", regimes[regime].total)
+            calculados[regime] = (hashes[regime], self._totais_para_dict(regimes[regime]))
+
+        self._gravar_resultados()
+        cache_resultados.guardar_varios(calculados)
+        regimes = {regime: regimes[regime] for regime in REGIMES}
+        self._registrar_resumo(anterior, regimes, hashes)
 
         return {
-            "simples": self._totais_para_dict(simples),
-            "presumido": self._totais_para_dict(presumido),
-            "real": self._totais_para_dict(real),
+            "simples": self._totais_para_dict(regimes["Simples"]),
+            "presumido": self._totais_para_dict(regimes["Presumido"]),
+            "real": self._totais_para_dict(regimes["Real"]),
+            "versao_tabelas": self.tabelas.versao_id,
+            "recalculados": recalcular,
+            "do_cache": do_cache,
+        }
+
+    def _hashes_entradas(self) -> Dict[str, str]:
+        """Hash, por regime, dos campos de DEPENDENCIAS_REGIME e dos demais insumos do regime."""
+        comuns = {
+            "versao_calculo": VERSAO_CALCULO,
+            "tabelas": self.tabelas.impressao_digital(),
+        }
+        extras = {
+            "Simples": {
+                "cnae": (self.empresa.cnae_principal or "").strip(),
+                "rateios_mercadoria": self._rateios_canonicos(self.rateios_mercadoria),
+                "rateios_servico": self._rateios_canonicos(self.rateios_servico),
+            },
+            "Presumido": {"meses": self.meses},
+            "Real": {"meses": self.meses},
         }
+        hashes = {}
+        for regime, campos in DEPENDENCIAS_REGIME.items():
+            dados = {campo: _canonico(getattr(self.s, campo)) for campo in campos}
+            dados.update(comuns)
+            dados.update(extras[regime])
+            conteudo = json.dumps(dados, sort_keys=True)
+            hashes[regime] = hashlib.sha256(conteudo.encode()).hexdigest()
+        return hashes
+
+    @staticmethod
+    def _rateios_canonicos(rateios) -> List:
+        return sorted(
+            [item.anexo.numero if item.anexo else None, _canonico(item.valor)]
+            for item in rateios
+        )
 
     # --------------------------
     # SIMPLES
     # --------------------------
     def _calcular_simples(self) -> TotaisRegime:
-        itens = {}
-
         cnae = (self.empresa.cnae_principal or "").strip()
-        if cnae and CnaeImpedimento.objects.filter(cnae=cnae).exists():
-            itens["DAS"] = D("0.00")
-            return TotaisRegime(itens=itens, total=_q(0))
+        if cnae and self.tabelas.cnae_impedido(cnae):
+            return self._simples_inelegivel(f"CNAE {cnae} impedido no Simples Nacional.")
 
         RBT12 = self.receita_12_meses if self.receita_12_meses > 0 else self.receita_total
+        try:
+            return self._calcular_das(RBT12)
+        except ForaDoSimples as exc:
+            return self._simples_inelegivel(str(exc))
+
+    def _simples_inelegivel(self, motivo: str) -> TotaisRegime:
+        """DAS zerado e o regime marcado como não aplicável (não concorre a vencedor)."""
+        self._registrar("Simples", "DAS", D("0.00"))
+        return TotaisRegime(itens={"DAS": D("0.00")}, total=_q(0), inelegivel=motivo)
+
+    def _calcular_das(self, RBT12: Decimal) -> TotaisRegime:
+        itens = {}
 
         das_merc = D("0.00")
         if self.receita_mercadorias > 0:
@@ -153,16 +274,7 @@ class CalculadoraTributaria:
         return TotaisRegime(itens=itens, total=_q(total))
 
     def _simples_parcela(self, RBT12: Decimal, receita_parcela: Decimal, *, anexo_num: int) -> Decimal:
-        faixa = FaixaSimples.objects.filter(
-            anexo__numero=anexo_num,
-            receita_de__lte=RBT12,
-            receita_ate__gte=RBT12
-        ).first()
-        if not faixa:
-            return D("0.00")
-        aliq_nom = _q(faixa.aliquota)
-        deducao = _q(faixa.deducao)
-        aliq_efetiva = (RBT12 * (aliq_nom / 100) - deducao) / (RBT12 if RBT12 > 0 else 1)
+        aliq_efetiva = self.tabelas.aliquota_efetiva_simples(anexo_num, RBT12)
         valor = receita_parcela * aliq_efetiva
         return _q(valor)
 
@@ -286,35 +398,84 @@ class CalculadoraTributaria:
         return D("0.00")
 
     def _aliquota_fixa(self, imposto: str, *, default: str) -> Decimal:
-        try:
-            return _q(AliquotaFixa.objects.get(imposto=imposto).aliquota)
-        except AliquotaFixa.DoesNotExist:
-            return _q(default)
+        aliquota = self.tabelas.aliquota_fixa(imposto)
+        return _q(default) if aliquota is None else aliquota
 
     def _aliquota_federal(self, imposto: str, base: str, *, default: str) -> Decimal:
-        try:
-            return _q(AliquotaFederal.objects.get(imposto=imposto, base_calculo__iexact=base).aliquota)
-        except AliquotaFederal.DoesNotExist:
-            return _q(default)
+        aliquota = self.tabelas.aliquota_federal(imposto, base)
+        return _q(default) if aliquota is None else aliquota
 
     def _fator_base_presumido(self, atividade: str, campo: str, default: str) -> Decimal:
-        try:
-            row = BasePresumido.objects.filter(atividade__icontains=atividade).first()
-            return _q(getattr(row, campo))
-        except Exception:
-            return _q(default)
+        fatores = self.tabelas.base_presumido(atividade)
+        return _q(default) if fatores is None else fatores[campo]
 
     def _registrar(self, regime: str, imposto: str, valor: Decimal):
-        Resultado.objects.update_or_create(
-            simulacao=self.s,
-            regime=regime,
-            imposto=imposto,
-            defaults={"valor": _q(valor)}
-        )
+        """Acumula a linha; processar grava todas de uma vez (_gravar_resultados)."""
+        self._pendentes[(regime, imposto)] = _q(valor)
+
+    def _registrar_itens(self, regime: str, totais: TotaisRegime) -> None:
+        """Detalhamento vindo do cache (as linhas do regime já foram removidas)."""
+        for imposto, valor in {**totais.itens, "TOTAL": totais.total}.items():
+            self._registrar(regime, imposto, valor)
+
+    def _gravar_resultados(self) -> None:
+        Resultado.objects.bulk_create([
+            Resultado(
+                simulacao=self.s,
+                regime=regime,
+                imposto=imposto,
+                valor=valor,
+                versao_tabelas_id=self.tabelas.versao_id,
+            )
+            for (regime, imposto), valor in self._pendentes.items()
+        ])
+        self._pendentes.clear()
+
+    def _registrar_resumo(
+        self, resumo: Optional[ResumoSimulacao], regimes: Dict[str, TotaisRegime], hashes: Dict[str, str]
+    ) -> ResumoSimulacao:
+        totais = {regime: t.total for regime, t in regimes.items()}
+        cargas = {
+            regime: _q(0) if self.receita_total == 0 else _q(total / self.receita_total * 100)
+            for regime, total in totais.items()
+        }
+        elegiveis = {regime: total for regime, total in totais.items() if not regimes[regime].inelegivel}
+        vencedor = min(elegiveis, key=lambda r: elegiveis[r])
+        atual = elegiveis.get(self.s.regime_atual)
+        economia = _q(max(D("0.00"), atual - totais[vencedor])) if atual is not None else _q(0)
+
+        campos = {
+            "receita_total": self.receita_total,
+            "total_simples": totais["Simples"],
+            "total_presumido": totais["Presumido"],
+            "total_real": totais["Real"],
+            "carga_simples": cargas["Simples"],
+            "carga_presumido": cargas["Presumido"],
+            "carga_real": cargas["Real"],
+            "vencedor": vencedor,
+            "economia_potencial": economia,
+            "detalhado": {regime: self._totais_para_dict(t) for regime, t in regimes.items()},
+            "hashes_entradas": hashes,
+        }
+        # Resumo já lido no início do processar: grava sem nova consulta
+        if resumo is None:
+            return ResumoSimulacao.objects.create(simulacao=self.s, **campos)
+        for campo, valor in campos.items():
+            setattr(resumo, campo, valor)
+        resumo.save()
+        return resumo
 
     @staticmethod
     def _totais_para_dict(t: TotaisRegime) -> Dict[str, str]:
-        return {
+        dados = {
             **{k: f"{v:.2f}" for k, v in t.itens.items()},
             "TOTAL": f"{t.total:.2f}",
         }
+        if t.inelegivel:
+            dados[INELEGIVEL] = t.inelegivel
+        return dados
+
+    @staticmethod
+    def _totais_de_dict(dados: Dict[str, str]) -> TotaisRegime:
+        itens = {k: D(v) for k, v in dados.items() if k not in ("TOTAL", INELEGIVEL)}
+        return TotaisRegime(itens=itens, total=D(dados["TOTAL"]), inelegivel=dados.get(INELEGIVEL, ""))
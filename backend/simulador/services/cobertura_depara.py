@@ -0,0 +1,206 @@
+"""
+Cobertura do DE-PARA sobre o plano de contas (BDCODPLAPADRAO): contas sem
+parâmetro, contas em mais de um parâmetro, códigos do DE-PARA que não existem no
+plano e diferenças para a planilha de referência (_docs). As contas do plano
+ficam em cache por plano; o DE-PARA usado é o plano compilado (depara_regras).
+"""
+import csv
+import threading
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from simulador.models import normalizar_busca
+from simulador.services.arvore_contas import conta_analitica
+from simulador.services.depara_regras import PlanoDePara
+from simulador.services.firebird_balancete import _rows_to_dicts, firebird_connection
+
+D = Decimal
+
+CAMPOS_CONTA = ("bdcodtpla", "bdctalon", "bdnomcta", "bdtipcta")
+
+_SQL_CONTAS = """
+    SELECT *
+    FROM PLANOS_TPLA
+    WHERE BDCODPLAPADRAO = ?
+    ORDER BY BDCTALON
+"""
+
+_COLUNA_CSV_CODIGO = "BDCODTPLA"
+_COLUNA_CSV_PARAMETRO = "PARÂMETRO DA SIMULAÇÃO CORRESPONDENTE"
+
+
+# --------------------------
+# CONTAS DO PLANO
+# --------------------------
+def contas_plano(plano: str) -> List[Dict[str, Any]]:
+    """Contas do plano padrão (só as colunas usadas na cobertura), em cache por plano."""
+    chave = f"depara:plano_contas:{plano}"
+    contas = cache.get(chave)
+    if contas is None:
+        with firebird_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_SQL_CONTAS, (plano,))
+            contas = [
+                {campo: linha[campo] for campo in CAMPOS_CONTA if campo in linha}
+                for linha in _rows_to_dicts(cursor, "str")
+            ]
+        cache.set(chave, contas, settings.PLANO_CONTAS_CACHE_TTL)
+    return contas
+
+
+# --------------------------
+# PLANILHA DE REFERÊNCIA (_docs)
+# --------------------------
+_csv_lock = threading.Lock()
+_csv_cache: Optional[Tuple[Tuple[str, int], Dict[str, str]]] = None
+
+
+def mapeamento_csv() -> Dict[str, str]:
+    """BDCODTPLA -> rótulo do parâmetro na planilha; relido quando o arquivo muda."""
+    global _csv_cache
+    caminho = Path(settings.DEPARA_CSV_FILE)
+    try:
+        assinatura = (str(caminho), caminho.stat().st_mtime_ns)
+    except OSError:
+        return {}
+    atual = _csv_cache
+    if atual is not None and atual[0] == assinatura:
+        return atual[1]
+    with _csv_lock:
+        if _csv_cache is None or _csv_cache[0] != assinatura:
+            with caminho.open("r", encoding="utf-8-sig", newline="") as arquivo:
+                mapa = {
+                    linha[_COLUNA_CSV_CODIGO].strip(): (linha.get(_COLUNA_CSV_PARAMETRO) or "").strip()
+                    for linha in csv.DictReader(arquivo)
+                    if (linha.get(_COLUNA_CSV_CODIGO) or "").strip()
+                }
+            _csv_cache = (assinatura, mapa)
+        return _csv_cache[1]
+
+
+def saldos_do_balancete(linhas: Iterable[Dict[str, Any]], campo: str = "bdsaldo_atual") -> Dict[str, Any]:
+    """BDCODTPLA -> saldo das contas analíticas do balancete."""
+    return {
+        str(linha.get("bdcodtpla")).strip(): linha.get(campo)
+        for linha in linhas
+        if linha.get("bdcodtpla") not in (None, "") and conta_analitica(linha)
+    }
+
+
+def _analitica(conta: Dict[str, Any]) -> bool:
+    # Sem BDTIPCTA no PLANOS_TPLA, todas as contas entram
+    return "bdtipcta" not in conta or conta_analitica(conta)
+
+
+def _parametros_por_rotulo(parametros: Iterable[str]) -> Dict[str, str]:
+    """'RECEITA SERVICOS' -> 'receita_servicos': rótulos da planilha para os parâmetros do DE-PARA."""
+    return {normalizar_busca(parametro.replace("_", " ")): parametro for parametro in parametros}
+
+
+def _decimal(valor: Any) -> Decimal:
+    if valor is None or valor == "":
+        return D("0")
+    try:
+        return D(str(valor))
+    except InvalidOperation:
+        return D("0")
+
+
+# --------------------------
+# COBERTURA
+# --------------------------
+def cobertura_depara(
+    plano: PlanoDePara,
+    contas: List[Dict[str, Any]],
+    saldos: Optional[Dict[str, Any]] = None,
+    referencia: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    `saldos` (BDCODTPLA -> saldo) restringe as contas sem parâmetro às que têm
+    saldo; sem ele, entram todas as analíticas sem parâmetro.
+    """
+    parametros_por_conta: Dict[str, Set[str]] = {}
+    for conta in contas:
+        codigo = str(conta.get("bdcodtpla") or "").strip()
+        if codigo:
+            parametros_por_conta[codigo] = {plano.regras[i].parametro for i in plano.regras_da_linha(conta)}
+    codigos_plano = set(parametros_por_conta)
+    contas_por_codigo = {str(conta.get("bdcodtpla") or "").strip(): conta for conta in contas}
+
+    def _conta(codigo: str, **extra) -> Dict[str, Any]:
+        conta = contas_por_codigo.get(codigo, {})
+        return {
+            "bdcodtpla": codigo,
+            "bdctalon": str(conta.get("bdctalon") or ""),
+            "bdnomcta": str(conta.get("bdnomcta") or ""),
+            **extra,
+        }
+
+    sem_parametro = {codigo for codigo, parametros in parametros_por_conta.items() if not parametros}
+    if saldos is not None:
+        nao_mapeadas = [
+            _conta(codigo, saldo=str(_decimal(saldos.get(codigo))))
+            for codigo in sorted(sem_parametro & set(saldos), key=_ordem_codigo)
+            if _decimal(saldos.get(codigo)) != 0
+        ]
+    else:
+        nao_mapeadas = [
+            _conta(codigo)
+            for codigo in sorted(sem_parametro, key=_ordem_codigo)
+            if _analitica(contas_por_codigo[codigo])
+        ]
+
+    duplicadas = [
+        _conta(codigo, parametros=sorted(parametros))
+        for codigo, parametros in sorted(parametros_por_conta.items(), key=lambda item: _ordem_codigo(item[0]))
+        if len(parametros) > 1
+    ]
+
+    # Códigos do DE-PARA sem conta correspondente no plano
+    exatos = plano.codigos_exatos("bdcodtpla")
+    orfaos = [
+        {"campo": "bdcodtpla", "codigo": codigo, "parametros": sorted(exatos[codigo])}
+        for codigo in sorted(set(exatos) - codigos_plano, key=_ordem_codigo)
+    ]
+    reduzidos = {str(conta.get("bdctalon") or "").strip() for conta in contas} - {""}
+    for codigo, parametros in sorted(plano.codigos_exatos("bdctalon").items()):
+        if codigo not in reduzidos:
+            orfaos.append({"campo": "bdctalon", "codigo": codigo, "parametros": sorted(parametros)})
+    for prefixo, parametros in sorted(plano.prefixos("bdctalon").items()):
+        if not any(reduzido.startswith(prefixo) for reduzido in reduzidos):
+            orfaos.append({"campo": "bdctalon", "codigo": prefixo, "parametros": sorted(parametros)})
+
+    # Planilha de referência: contas do plano com parâmetro diferente do DE-PARA
+    divergencias_planilha = []
+    por_rotulo = _parametros_por_rotulo(plano.parametros)
+    for codigo in sorted(codigos_plano & set(referencia or {}), key=_ordem_codigo):
+        rotulo = referencia[codigo]
+        esperado = por_rotulo.get(normalizar_busca(rotulo), rotulo) if rotulo else ""
+        atuais = parametros_por_conta[codigo]
+        if (esperado and esperado not in atuais) or (not esperado and atuais):
+            divergencias_planilha.append(_conta(codigo, planilha=esperado, depara=sorted(atuais)))
+
+    mapeadas = len(codigos_plano) - len(sem_parametro)
+    return {
+        "resumo": {
+            "contas": len(codigos_plano),
+            "mapeadas": mapeadas,
+            "percentual_mapeado": round(100 * mapeadas / len(codigos_plano), 2) if codigos_plano else 0,
+            "nao_mapeadas": len(nao_mapeadas),
+            "duplicadas": len(duplicadas),
+            "orfaos": len(orfaos),
+            "divergencias_planilha": len(divergencias_planilha),
+        },
+        "nao_mapeadas": nao_mapeadas,
+        "duplicadas": duplicadas,
+        "orfaos": orfaos,
+        "divergencias_planilha": divergencias_planilha,
+    }
+
+
+def _ordem_codigo(codigo: str) -> Tuple[int, str]:
+    return (int(codigo), "") if codigo.isdigit() else (1 << 62, codigo)
@@ -0,0 +1,236 @@
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from simulador.services.arvore_contas import ArvoreContas, conta_analitica
+from simulador.services.depara_storage import list_entries
+
+D = Decimal
+
+
+def _valor(linha: Dict[str, Any], campo: str) -> Decimal:
+    valor = linha.get(campo or "bdsaldo_atual")
+    if valor is None or valor == "":
+        return D("0")
+    try:
+        return D(str(valor))
+    except InvalidOperation:
+        return D("0")
+
+
+def _codigos(linha: Dict[str, Any], match_field: str) -> List[str]:
+    campos = [c.strip().lower() for c in (match_field or "bdcodtpla").split("|") if c.strip()]
+    codigos = []
+    for campo in campos:
+        valor = linha.get(campo)
+        if valor is not None and valor != "":
+            codigos.append(str(valor).strip())
+    return codigos
+
+
+def _casa(codigo: str, contas: List[str], match_type: str) -> bool:
+    if match_type == "prefix":
+        return any(codigo.startswith(conta) for conta in contas)
+    if match_type == "regex":
+        return any(re.fullmatch(conta, codigo) for conta in contas)
+    return codigo in contas
+
+
+def _reduzir(valores: List[Decimal], reducer: str) -> Decimal:
+    if reducer == "count":
+        return D(len(valores))
+    if not valores:
+        return D("0")
+    if reducer == "max":
+        return max(valores)
+    if reducer == "min":
+        return min(valores)
+    return sum(valores, D("0"))
+
+
+def consolidar_balancete(
+    linhas: Iterable[Dict[str, Any]],
+    entradas: Optional[List[Dict[str, Any]]] = None,
+    *,
+    somente_analiticas: bool = False,
+) -> Dict[str, Decimal]:
+    """
+    Aplica o DE-PARA (entradas ativas) às linhas do balancete e devolve o valor
+    de cada parâmetro da simulação. Implementação de referência, linha a linha.
+    """
+    if entradas is None:
+        entradas = list_entries()
+    linhas = [linha for linha in linhas if not somente_analiticas or conta_analitica(linha)]
+
+    resultado: Dict[str, Decimal] = {}
+    for entrada in entradas:
+        if not entrada.get("ativo", True):
+            continue
+        contas = [str(c).strip() for c in entrada.get("contas") or [] if str(c).strip()]
+        match_type = entrada.get("matchType") or "exact"
+        campo = entrada.get("campo") or "bdsaldo_atual"
+        valores = [
+            _valor(linha, campo)
+            for linha in linhas
+            if any(_casa(codigo, contas, match_type) for codigo in _codigos(linha, entrada.get("matchField")))
+        ]
+        parametro = entrada["parametro"]
+        resultado[parametro] = resultado.get(parametro, D("0")) + _reduzir(valores, entrada.get("reducer") or "sum")
+    return resultado
+
+
+def consolidar_por_arvore(
+    linhas: Iterable[Dict[str, Any]],
+    entradas: Optional[List[Dict[str, Any]]] = None,
+) -> Dict[str, Decimal]:
+    """
+    DE-PARA avaliado sobre a árvore de contas. Regras de prefixo só em BDCTALON
+    (redutor soma) usam o total do grupo: por segmento ('04.2.1' não inclui
+    '04.2.10') e sem somar a sintética junto com as analíticas. Contas exatas são
+    buscadas por índice; as demais regras seguem consolidar_balancete.
+    """
+    if entradas is None:
+        entradas = list_entries()
+    linhas = list(linhas)
+    arvores: Dict[str, ArvoreContas] = {}
+    indices: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    def indice(campo: str) -> Dict[str, List[Dict[str, Any]]]:
+        if campo not in indices:
+            mapa: Dict[str, List[Dict[str, Any]]] = {}
+            for linha in linhas:
+                valor = linha.get(campo)
+                if valor is not None and valor != "":
+                    mapa.setdefault(str(valor).strip(), []).append(linha)
+            indices[campo] = mapa
+        return indices[campo]
+
+    resultado: Dict[str, Decimal] = {}
+    for entrada in entradas:
+        if not entrada.get("ativo", True):
+            continue
+        contas = [str(c).strip() for c in entrada.get("contas") or [] if str(c).strip()]
+        match_type = entrada.get("matchType") or "exact"
+        campo = entrada.get("campo") or "bdsaldo_atual"
+        reducer = entrada.get("reducer") or "sum"
+        campos = [c.strip().lower() for c in (entrada.get("matchField") or "bdcodtpla").split("|") if c.strip()]
+
+        if match_type == "prefix" and campos == ["bdctalon"] and reducer == "sum":
+            if campo not in arvores:
+                arvores[campo] = ArvoreContas(linhas, campo=campo)
+            valor = arvores[campo].soma(contas)
+        elif match_type == "exact":
+            casadas = {
+                id(linha): linha
+                for nome in campos
+                for conta in contas
+                for linha in indice(nome).get(conta, ())
+            }
+            valor = _reduzir([_valor(linha, campo) for linha in casadas.values()], reducer)
+        else:
+            valor = consolidar_balancete(linhas, [entrada]).get(entrada["parametro"], D("0"))
+        parametro = entrada["parametro"]
+        resultado[parametro] = resultado.get(parametro, D("0")) + valor
+    return resultado
+
+
+# --------------------------
+# CONSOLIDAÇÃO EM SQL
+# --------------------------
+# Limite de itens em IN (...) do Firebird
+_MAX_ITENS_IN = 1500
+_IDENTIFICADOR = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+
+class ConsolidacaoSQLIndisponivel(ValueError):
+    """O DE-PARA tem regras que não podem ser avaliadas em SQL (ex.: regex)."""
+
+
+def _literal(valor: str) -> str:
+    return "'" + valor.replace("'", "''") + "'"
+
+
+def literal_prefixo_sql(valor: str) -> str:
+    escapado = valor.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return _literal(escapado + "%")
+
+
+def _coluna(nome: str, alias: str) -> str:
+    nome = (nome or "").strip().lower()
+    if not _IDENTIFICADOR.match(nome):
+        raise ConsolidacaoSQLIndisponivel(f"Nome de coluna inválido no DE-PARA: {nome!r}")
+    return f"{alias}.{nome.upper()}"
+
+
+def _condicao(entrada: Dict[str, Any], colunas: Sequence[str], alias: str) -> Optional[str]:
+    contas = [str(c).strip() for c in entrada.get("contas") or [] if str(c).strip()]
+    match_type = entrada.get("matchType") or "exact"
+    if match_type == "regex":
+        raise ConsolidacaoSQLIndisponivel("Regras com matchType 'regex' só são avaliadas em Python.")
+
+    campos = [c.strip().lower() for c in (entrada.get("matchField") or "bdcodtpla").split("|") if c.strip()]
+    campos = [c for c in campos if c in colunas]  # campos ausentes não casam (como em _codigos)
+    if not contas or not campos:
+        return None
+
+    termos = []
+    for campo in campos:
+        codigo = f"TRIM(CAST({_coluna(campo, alias)} AS VARCHAR(60)))"
+        if match_type == "prefix":
+            termos += [f"{codigo} LIKE {literal_prefixo_sql(conta)} ESCAPE '\\'" for conta in contas]
+        else:
+            for inicio in range(0, len(contas), _MAX_ITENS_IN):
+                bloco = ", ".join(_literal(conta) for conta in contas[inicio:inicio + _MAX_ITENS_IN])
+                termos.append(f"{codigo} IN ({bloco})")
+    return "(" + " OR ".join(termos) + ")"
+
+
+def gerar_sql_consolidacao(
+    fonte: str,
+    colunas: Sequence[str],
+    entradas: Optional[List[Dict[str, Any]]] = None,
+    *,
+    somente_analiticas: bool = False,
+    alias: str = "B",
+) -> Tuple[str, List[str]]:
+    """
+    Um único SELECT sobre `fonte` (tabela ou chamada da stored procedure) com um
+    SUM/MAX/MIN(CASE WHEN ...) por entrada ativa do DE-PARA: só a linha agregada
+    sai do banco. Devolve (sql, parâmetro de cada coluna do resultado); entradas do
+    mesmo parâmetro são somadas por `parametros_da_linha`, como em consolidar_balancete.
+    """
+    if entradas is None:
+        entradas = list_entries()
+    colunas = [c.lower() for c in colunas]
+
+    expressoes, parametros = [], []
+    for entrada in entradas:
+        if not entrada.get("ativo", True):
+            continue
+        condicao = _condicao(entrada, colunas, alias) or "1 = 0"
+        campo = (entrada.get("campo") or "bdsaldo_atual").strip().lower()
+        valor = f"COALESCE({_coluna(campo, alias)}, 0)" if campo in colunas else "0"
+        reducer = entrada.get("reducer") or "sum"
+        if reducer == "count":
+            expressao = f"SUM(CASE WHEN {condicao} THEN 1 ELSE 0 END)"
+        elif reducer in ("max", "min"):
+            expressao = f"{reducer.upper()}(CASE WHEN {condicao} THEN {valor} END)"
+        else:
+            expressao = f"SUM(CASE WHEN {condicao} THEN {valor} ELSE 0 END)"
+        expressoes.append(f"{expressao} AS P{len(expressoes)}")
+        parametros.append(entrada["parametro"])
+
+    if not expressoes:
+        return "", []
+    filtro = f" WHERE {alias}.BDTIPCTA > 0" if somente_analiticas and "bdtipcta" in colunas else ""
+    sql = "SELECT\n    " + ",\n    ".join(expressoes) + f"\nFROM {fonte} {alias}{filtro}"
+    return sql, parametros
+
+
+def parametros_da_linha(linha: Sequence[Any], parametros: Sequence[str]) -> Dict[str, Decimal]:
+    """Soma as colunas agregadas por parâmetro (vazio/NULL conta como zero)."""
+    resultado: Dict[str, Decimal] = {}
+    for parametro, valor in zip(parametros, linha or [None] * len(parametros)):
+        valor = D("0") if valor is None else D(str(valor))
+        resultado[parametro] = resultado.get(parametro, D("0")) + valor
+    return resultado
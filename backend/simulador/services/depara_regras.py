@@ -0,0 +1,279 @@
+"""
+DE-PARA compilado: as entradas ativas viram um plano imutável de avaliação.
+- códigos exatos: dicionário código -> entradas;
+- prefixos: trie por caractere (um percurso do código acha todos os prefixos);
+- regex: uma alternação pré-compilada com grupos nomeados, usada como filtro
+  (se nenhuma casa, nenhuma regex é testada individualmente).
+O resultado é o mesmo de consolidacao.consolidar_balancete.
+"""
+import re
+import threading
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Pattern, Sequence, Set, Tuple
+
+from simulador.services.consolidacao import _reduzir, _valor
+from simulador.services.depara_storage import assinatura_arquivo, list_entries
+
+D = Decimal
+
+_FIM = ""  # chave do nó da trie que guarda as entradas do prefixo
+
+
+class DeParaInvalido(ValueError):
+    """Regra do DE-PARA que não pode ser compilada (ex.: regex inválida)."""
+
+
+@dataclass(frozen=True)
+class RegraCompilada:
+    indice: int
+    id: str
+    parametro: str
+    campo: str
+    reducer: str
+
+
+class _Trie:
+    def __init__(self):
+        self.raiz: Dict[str, Any] = {}
+
+    def inserir(self, prefixo: str, indice: int) -> None:
+        no = self.raiz
+        for ch in prefixo:
+            no = no.setdefault(ch, {})
+        no.setdefault(_FIM, set()).add(indice)
+
+    def congelar(self) -> None:
+        pilha = [self.raiz]
+        while pilha:
+            no = pilha.pop()
+            for chave, filho in no.items():
+                if chave == _FIM:
+                    no[_FIM] = frozenset(filho)
+                else:
+                    pilha.append(filho)
+
+    def prefixos_de(self, codigo: str) -> Iterable[FrozenSet[int]]:
+        no = self.raiz
+        for ch in codigo:
+            no = no.get(ch)
+            if no is None:
+                return
+            if _FIM in no:
+                yield no[_FIM]
+
+    def itens(self) -> Iterable[Tuple[str, FrozenSet[int]]]:
+        pilha = [("", self.raiz)]
+        while pilha:
+            prefixo, no = pilha.pop()
+            for chave, filho in no.items():
+                if chave == _FIM:
+                    yield prefixo, filho
+                else:
+                    pilha.append((prefixo + chave, filho))
+
+
+# Referências numeradas mudam de número dentro da alternação: essas regras ficam fora do filtro
+_REFERENCIA_NUMERADA = re.compile(r"\\\d|\(\?P=")
+
+
+class _Regexes:
+    """
+    Regras regex de uma coluna. As compatíveis entram em uma única alternação
+    `(?P<r0>...)|(?P<r1>...)`: um fullmatch só descarta o código que não casa com
+    nenhuma; quando casa, basta testar a regra do grupo vencedor e as seguintes.
+    """
+
+    def __init__(self, padroes: List[Tuple[str, int]]):
+        self.combinaveis: List[Tuple[Pattern, int]] = []
+        self.avulsas: List[Tuple[Pattern, int]] = []
+        for padrao, indice in padroes:
+            try:
+                rx = re.compile(padrao)
+            except re.error as exc:
+                raise DeParaInvalido(f"Regex inválida no DE-PARA: {padrao!r} ({exc})") from exc
+            destino = self.avulsas if _REFERENCIA_NUMERADA.search(padrao) else self.combinaveis
+            destino.append((rx, indice))
+        self.combinada: Optional[Pattern] = None
+        self.ativas = bool(padroes)
+        if self.combinaveis:
+            try:
+                self.combinada = re.compile(
+                    "|".join(f"(?P<r{posicao}>{rx.pattern})" for posicao, (rx, _) in enumerate(self.combinaveis))
+                )
+            except re.error:  # ex.: o mesmo grupo nomeado em duas regras; testa uma a uma
+                self.avulsas = self.combinaveis + self.avulsas
+                self.combinaveis = []
+
+    def casadas(self, codigo: str) -> Set[int]:
+        encontradas = {indice for rx, indice in self.avulsas if rx.fullmatch(codigo)}
+        if self.combinada is not None:
+            achado = self.combinada.fullmatch(codigo)
+            if achado is not None:
+                inicio = int(achado.lastgroup[1:])
+                encontradas.add(self.combinaveis[inicio][1])
+                encontradas |= {
+                    indice for rx, indice in self.combinaveis[inicio + 1:] if rx.fullmatch(codigo)
+                }
+        return encontradas
+
+
+class _IndiceCampo:
+    """Estruturas de uma coluna de código (bdcodtpla, bdctalon, ...)."""
+
+    def __init__(self):
+        self.exatos: Dict[str, Set[int]] = {}
+        self.prefixos = _Trie()
+        self.regex: List[Tuple[str, int]] = []
+
+    def congelar(self) -> None:
+        self.exatos = {codigo: frozenset(indices) for codigo, indices in self.exatos.items()}
+        self.prefixos.congelar()
+        self.regexes = _Regexes(self.regex)
+
+    def casadas(self, codigo: str, encontradas: Set[int]) -> None:
+        exatos = self.exatos.get(codigo)
+        if exatos:
+            encontradas |= exatos
+        for indices in self.prefixos.prefixos_de(codigo):
+            encontradas |= indices
+        if self.regexes.ativas:
+            encontradas |= self.regexes.casadas(codigo)
+
+
+class PlanoDePara:
+    """Plano de avaliação das entradas ativas do DE-PARA (não muda depois de compilado)."""
+
+    def __init__(self, entradas: Sequence[Dict[str, Any]]):
+        self.regras: List[RegraCompilada] = []
+        self.campos: Dict[str, _IndiceCampo] = {}
+        for entrada in entradas:
+            if not entrada.get("ativo", True):
+                continue
+            regra = RegraCompilada(
+                indice=len(self.regras),
+                id=str(entrada.get("id") or ""),
+                parametro=entrada["parametro"],
+                campo=entrada.get("campo") or "bdsaldo_atual",
+                reducer=entrada.get("reducer") or "sum",
+            )
+            self.regras.append(regra)
+            contas = [str(c).strip() for c in entrada.get("contas") or [] if str(c).strip()]
+            match_type = entrada.get("matchType") or "exact"
+            campos = [c.strip().lower() for c in (entrada.get("matchField") or "bdcodtpla").split("|") if c.strip()]
+            for campo in campos:
+                indice = self.campos.setdefault(campo, _IndiceCampo())
+                for conta in contas:
+                    if match_type == "prefix":
+                        indice.prefixos.inserir(conta, regra.indice)
+                    elif match_type == "regex":
+                        indice.regex.append((conta, regra.indice))
+                    else:
+                        indice.exatos.setdefault(conta, set()).add(regra.indice)
+        for indice in self.campos.values():
+            indice.congelar()
+        self.parametros = tuple(dict.fromkeys(regra.parametro for regra in self.regras))
+
+    # --------------------------
+    # AVALIAÇÃO
+    # --------------------------
+    def regras_da_linha(self, linha: Dict[str, Any]) -> Set[int]:
+        encontradas: Set[int] = set()
+        for campo, indice in self.campos.items():
+            valor = linha.get(campo)
+            if valor is None or valor == "":
+                continue
+            indice.casadas(str(valor).strip(), encontradas)
+        return encontradas
+
+    def avaliar(self, linhas: Iterable[Dict[str, Any]]) -> Dict[str, Decimal]:
+        valores: List[List[Decimal]] = [[] for _ in self.regras]
+        for linha in linhas:
+            for indice in self.regras_da_linha(linha):
+                valores[indice].append(_valor(linha, self.regras[indice].campo))
+        resultado: Dict[str, Decimal] = {}
+        for regra in self.regras:
+            resultado[regra.parametro] = resultado.get(regra.parametro, D("0")) + _reduzir(
+                valores[regra.indice], regra.reducer
+            )
+        return resultado
+
+    # --------------------------
+    # CÓDIGOS DAS REGRAS
+    # --------------------------
+    def codigos_exatos(self, campo: str) -> Dict[str, Set[str]]:
+        """Código exato -> parâmetros, para a coluna informada."""
+        indice = self.campos.get(campo)
+        if indice is None:
+            return {}
+        return {codigo: {self.regras[i].parametro for i in indices} for codigo, indices in indice.exatos.items()}
+
+    def prefixos(self, campo: str) -> Dict[str, Set[str]]:
+        """Prefixo -> parâmetros, para a coluna informada."""
+        indice = self.campos.get(campo)
+        if indice is None:
+            return {}
+        return {prefixo: {self.regras[i].parametro for i in indices} for prefixo, indices in indice.prefixos.itens()}
+
+    # --------------------------
+    # CONFLITOS
+    # --------------------------
+    def conflitos(self, linhas: Iterable[Dict[str, Any]], campo_codigo: str = "bdctalon") -> List[Dict[str, Any]]:
+        """Contas do balancete reivindicadas por mais de um parâmetro."""
+        conflitos = []
+        for linha in linhas:
+            parametros = sorted({self.regras[i].parametro for i in self.regras_da_linha(linha)})
+            if len(parametros) > 1:
+                conflitos.append({
+                    "conta": str(linha.get(campo_codigo) or linha.get("bdcodtpla") or ""),
+                    "nome": str(linha.get("bdnomcta") or ""),
+                    "parametros": parametros,
+                })
+        return conflitos
+
+    def conflitos_estaticos(self) -> List[Dict[str, Any]]:
+        """
+        Sobreposições visíveis nas próprias regras (sem balancete): o mesmo código
+        exato ou um prefixo que cobre código/prefixo de outro parâmetro. Regex não
+        entra aqui (só na verificação contra as linhas).
+        """
+        conflitos = []
+        for campo, indice in sorted(self.campos.items()):
+            prefixos = sorted(indice.prefixos.itens())
+            for codigo, indices in sorted(indice.exatos.items()):
+                parametros = {self.regras[i].parametro for i in indices}
+                for cobertos in indice.prefixos.prefixos_de(codigo):
+                    parametros |= {self.regras[i].parametro for i in cobertos}
+                if len(parametros) > 1:
+                    conflitos.append({"campo": campo, "codigo": codigo, "tipo": "exact", "parametros": sorted(parametros)})
+            for prefixo, indices in prefixos:
+                parametros = {self.regras[i].parametro for i in indices}
+                for outros in indice.prefixos.prefixos_de(prefixo):
+                    parametros |= {self.regras[i].parametro for i in outros}
+                if len(parametros) > 1:
+                    conflitos.append({"campo": campo, "codigo": prefixo, "tipo": "prefix", "parametros": sorted(parametros)})
+        return conflitos
+
+
+# --------------------------
+# CACHE (recompila quando o arquivo do DE-PARA muda)
+# --------------------------
+_lock = threading.Lock()
+_plano_cache: Optional[Tuple[str, PlanoDePara]] = None
+
+
+def plano_depara() -> PlanoDePara:
+    global _plano_cache
+    assinatura, _ = assinatura_arquivo()
+    atual = _plano_cache
+    if atual is not None and atual[0] == assinatura:
+        return atual[1]
+    with _lock:
+        if _plano_cache is None or _plano_cache[0] != assinatura:
+            _plano_cache = (assinatura, PlanoDePara(list_entries()))
+        return _plano_cache[1]
+
+
+def compilar(entradas: Optional[Sequence[Dict[str, Any]]] = None) -> PlanoDePara:
+    """Plano das entradas informadas ou, sem elas, o plano em cache do arquivo."""
+    return plano_depara() if entradas is None else PlanoDePara(entradas)
@@ -1,8 +1,9 @@
 import json
 import uuid
+from datetime import datetime, timezone
 from pathlib import Path
 from threading import Lock
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from django.conf import settings
 
@@ -17,6 +18,12 @@ def _file_path() -> Path:
     return path
 
 
+def assinatura_arquivo() -> Tuple[str, datetime]:
+    """(identificador, data de modificação) do arquivo, para ETag/Last-Modified."""
+    stat = _file_path().stat()
+    return f"{stat.st_mtime_ns}-{stat.st_size}", datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+
+
 def _load_raw() -> List[Dict]:
     path = _file_path()
     try:
@@ -0,0 +1,166 @@
+"""
+Espelho local do cadastro de empresas do SCI (EmpresaSCI).
+Uma única consulta em streaming traz a referência mais recente de cada empresa;
+na sincronização incremental só entram as empresas com BDREFEMP posterior à
+maior referência já espelhada.
+"""
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from simulador.models import Empresa, EmpresaSCI
+from simulador.services.firebird_balancete import (
+    campos_espelho, empresa_info_da_linha, firebird_connection, info_da_empresa,
+)
+
+TAMANHO_LOTE = 1000
+
+_SQL_EMPRESAS = """
+    SELECT
+        A.BDCODEMP,
+        TR.BDNOMEMP,
+        A.BDCNPJEMP,
+        TR.BDCODCNAE,
+        TR.BDCODCID,
+        CID.BDNOMCID,
+        TR.BDREFEMP
+    FROM TEMPRESAS A
+    INNER JOIN (
+        SELECT BDCODEMP, MAX(BDREFEMP) AS MXREF
+        FROM TEMPRESAS_REF
+        {filtro}
+        GROUP BY BDCODEMP
+    ) C
+        ON C.BDCODEMP = A.BDCODEMP
+    INNER JOIN TEMPRESAS_REF TR
+        ON TR.BDCODEMP = C.BDCODEMP
+       AND TR.BDREFEMP = C.MXREF
+    LEFT JOIN TCIDADE CID ON CID.BDCODCID = TR.BDCODCID
+"""
+
+_CAMPOS_ATUALIZADOS = (
+    "referencia", "razao_social", "cnpj", "cnpj_digitos", "cnae", "cod_cidade", "municipio", "sincronizado_em",
+)
+
+
+def _referencia_parametro(texto: str) -> Any:
+    """Converte a referência gravada (ISO ou número) de volta para o tipo do Firebird."""
+    try:
+        return date.fromisoformat(texto)
+    except ValueError:
+        pass
+    try:
+        return int(texto)
+    except ValueError:
+        return texto
+
+
+def ultima_referencia() -> Optional[Any]:
+    referencias = [
+        _referencia_parametro(texto)
+        for texto in EmpresaSCI.objects.exclude(referencia="").values_list("referencia", flat=True).distinct()
+    ]
+    try:
+        return max(referencias) if referencias else None
+    except TypeError:  # referências de tipos mistos: sem base segura para o incremental
+        return None
+
+
+def _gravar_lote(linhas: List[Dict[str, Any]]) -> Dict[str, int]:
+    agora = timezone.now()
+    existentes = EmpresaSCI.objects.in_bulk([info["codigo"] for info in linhas])
+    novos, alterados = [], []
+    for info in linhas:
+        campos = campos_espelho(info)
+        atual = existentes.get(info["codigo"])
+        if atual is None:
+            novos.append(EmpresaSCI(codigo=info["codigo"], sincronizado_em=agora, **campos))
+        elif any(getattr(atual, nome) != valor for nome, valor in campos.items()):
+            for nome, valor in campos.items():
+                setattr(atual, nome, valor)
+            atual.sincronizado_em = agora
+            alterados.append(atual)
+    with transaction.atomic():
+        EmpresaSCI.objects.bulk_create(novos)
+        EmpresaSCI.objects.bulk_update(alterados, _CAMPOS_ATUALIZADOS)
+    return {"criadas": len(novos), "atualizadas": len(alterados)}
+
+
+def gravar_linhas(linhas: Iterable[Dict[str, Any]], tamanho_lote: int = TAMANHO_LOTE) -> Dict[str, int]:
+    """Grava empresa_detalhes no espelho em lotes (um SELECT + bulk_create/bulk_update por lote)."""
+    totais = {"lidas": 0, "criadas": 0, "atualizadas": 0}
+    lote: List[Dict[str, Any]] = []
+    for info in linhas:
+        if info.get("codigo") is None:
+            continue
+        lote.append(info)
+        totais["lidas"] += 1
+        if len(lote) >= tamanho_lote:
+            for chave, valor in _gravar_lote(lote).items():
+                totais[chave] += valor
+            lote = []
+    if lote:
+        for chave, valor in _gravar_lote(lote).items():
+            totais[chave] += valor
+    return totais
+
+
+def sincronizar_empresas_sci(*, completo: bool = False, tamanho_lote: int = TAMANHO_LOTE) -> Dict[str, Any]:
+    """
+    Atualiza o espelho a partir do SCI. Sem `completo`, traz só as empresas com
+    referência nova; alterações em TEMPRESAS sem nova referência exigem `completo`.
+    """
+    referencia = None if completo else ultima_referencia()
+    filtro, params = ("WHERE BDREFEMP > ?", (referencia,)) if referencia is not None else ("", ())
+
+    with firebird_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_SQL_EMPRESAS.format(filtro=filtro), params)
+
+        def linhas():
+            while True:
+                bloco = cursor.fetchmany(tamanho_lote)
+                if not bloco:
+                    return
+                for row in bloco:
+                    yield empresa_info_da_linha(row)
+
+        totais = gravar_linhas(linhas(), tamanho_lote)
+
+    return {**totais, "incremental": referencia is not None, "desde": "" if referencia is None else str(referencia)}
+
+
+def localizar_empresa(codigo: int) -> Tuple[Optional[EmpresaSCI], Optional[Empresa]]:
+    """
+    (registro do espelho, empresa cadastrada) para o código do SCI. Fora do
+    espelho, a empresa é consultada uma vez no SCI e gravada no espelho. A empresa
+    é procurada pelo código e depois pelo CNPJ; achada pelo CNPJ, recebe o código.
+    """
+    espelho = EmpresaSCI.objects.filter(codigo=codigo).first()
+    if espelho is None:
+        with firebird_connection() as conn:
+            if info_da_empresa(conn.cursor(), codigo).get("codigo") is None:
+                return None, None
+        espelho = EmpresaSCI.objects.get(codigo=codigo)
+
+    empresa = Empresa.objects.filter(codigo_sci=codigo).order_by("id").first()
+    if empresa is None and espelho.cnpj_digitos:
+        empresa = Empresa.objects.filter(cnpj_digitos=espelho.cnpj_digitos).order_by("id").first()
+        if empresa is not None and empresa.codigo_sci is None:
+            empresa.codigo_sci = codigo
+            empresa.save(update_fields=["codigo_sci"])
+    return espelho, empresa
+
+
+def dados_empresa(espelho: EmpresaSCI) -> Dict[str, Any]:
+    """Dados para cadastrar a Empresa a partir do espelho."""
+    return {
+        "codigo_sci": espelho.codigo,
+        "razao_social": espelho.razao_social,
+        "cnpj": espelho.cnpj_digitos or espelho.cnpj,
+        "cnae_principal": espelho.cnae,
+        "municipio": espelho.municipio,
+        "uf": "",
+    }
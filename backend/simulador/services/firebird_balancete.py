@@ -1,8 +1,21 @@
 import os
 import contextlib
-from datetime import datetime, date
-from decimal import Decimal
-from typing import Any, Dict, List, Optional, Sequence
+from datetime import datetime, date, time as dt_time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from simulador.models import EmpresaSCI, somente_digitos
+from simulador.services.arvore_contas import conta_analitica
+from simulador.services.consolidacao import (
+    ConsolidacaoSQLIndisponivel, gerar_sql_consolidacao, literal_prefixo_sql,
+    parametros_da_linha,
+)
+from simulador.services.depara_regras import DeParaInvalido, compilar
+from simulador.services.depara_storage import list_entries
+from simulador.services.metricas import medido
+from simulador.services.single_flight import executar_compartilhado
 
 try:  # pragma: no cover - depende de binários externos
     import fdb  # type: ignore
@@ -69,10 +82,10 @@ def _normalize_date(value: str) -> str:
     raise BalanceteError(f"Formato de data inválido: {value}")
 
 
-def _convert(value: Any) -> Any:
+def _convert(value: Any, decimais: str = "float") -> Any:
     """Normaliza tipos para JSON serializável."""
     if isinstance(value, Decimal):
-        return float(value)
+        return _conversor_decimal(decimais)(value)
     if isinstance(value, (datetime, date)):
         return value.isoformat()
     if isinstance(value, bytes):
@@ -108,6 +121,7 @@ def _fetch_plan_code(cursor, empresa: int) -> str:
 def _fetch_empresa_info(cursor, empresa: int) -> Dict[str, Any]:
     """
     Busca os dados básicos da empresa no SCI utilizando TEMPRESAS, TEMPRESAS_REF e TCIDADE.
+    Usado só quando a empresa ainda não está no espelho local (EmpresaSCI).
     """
     sql = """
         SELECT
@@ -116,7 +130,8 @@ def _fetch_empresa_info(cursor, empresa: int) -> Dict[str, Any]:
             A.BDCNPJEMP,
             B.BDCODCNAE,
             B.BDCODCID,
-            CID.BDNOMCID
+            CID.BDNOMCID,
+            B.BDREFEMP
         FROM TEMPRESAS A
         INNER JOIN (
             SELECT
@@ -129,6 +144,7 @@ def _fetch_empresa_info(cursor, empresa: int) -> Dict[str, Any]:
             INNER JOIN (
                 SELECT BDCODEMP, MAX(BDREFEMP) AS MXREF
                 FROM TEMPRESAS_REF
+                WHERE BDCODEMP = ?
                 GROUP BY BDCODEMP
             ) C
                 ON TR.BDCODEMP = C.BDCODEMP
@@ -139,22 +155,64 @@ def _fetch_empresa_info(cursor, empresa: int) -> Dict[str, Any]:
         WHERE A.BDCODEMP = ?
     """
 
-    cursor.execute(sql, (empresa,))
+    cursor.execute(sql, (empresa, empresa))
     row = cursor.fetchone()
     if not row:
         return {}
+    return empresa_info_da_linha(row)
+
 
-    codigo, nome, cnpj, cnae, cod_cidade, nome_cidade = row
+def empresa_info_da_linha(row: Sequence[Any]) -> Dict[str, Any]:
+    """(BDCODEMP, BDNOMEMP, BDCNPJEMP, BDCODCNAE, BDCODCID, BDNOMCID, BDREFEMP) -> empresa_detalhes."""
+    codigo, nome, cnpj, cnae, cod_cidade, nome_cidade, referencia = row
     return {
         "codigo": int(codigo) if codigo is not None else None,
-        "razao_social": _convert(nome),
+        "razao_social": str(_convert(nome) or "").strip(),
         "cnpj": str(_convert(cnpj) or "").strip(),
         "cnae": str(_convert(cnae) or "").strip(),
         "cod_cidade": _convert(cod_cidade),
-        "municipio": _convert(nome_cidade),
+        "municipio": str(_convert(nome_cidade) or "").strip(),
+        "referencia": "" if referencia is None else str(_convert(referencia, "str")),
+    }
+
+
+def campos_espelho(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos de EmpresaSCI a partir de empresa_detalhes."""
+    cod_cidade = info.get("cod_cidade")
+    return {
+        "referencia": info.get("referencia") or "",
+        "razao_social": info.get("razao_social") or "",
+        "cnpj": info.get("cnpj") or "",
+        "cnpj_digitos": somente_digitos(info.get("cnpj"))[:14],
+        "cnae": (info.get("cnae") or "")[:10],
+        "cod_cidade": int(cod_cidade) if str(cod_cidade or "").isdigit() else None,
+        "municipio": info.get("municipio") or "",
+    }
+
+
+def info_do_espelho(espelho: EmpresaSCI) -> Dict[str, Any]:
+    return {
+        "codigo": espelho.codigo,
+        "razao_social": espelho.razao_social,
+        "cnpj": espelho.cnpj,
+        "cnae": espelho.cnae,
+        "cod_cidade": espelho.cod_cidade,
+        "municipio": espelho.municipio,
+        "referencia": espelho.referencia,
     }
 
 
+def info_da_empresa(cursor, empresa: int) -> Dict[str, Any]:
+    """Dados da empresa pelo espelho local; sem registro, consulta o SCI e grava no espelho."""
+    espelho = EmpresaSCI.objects.filter(codigo=empresa).first()
+    if espelho is not None:
+        return info_do_espelho(espelho)
+    info = _fetch_empresa_info(cursor, empresa)
+    if info.get("codigo") is not None:
+        EmpresaSCI.objects.update_or_create(codigo=info["codigo"], defaults=campos_espelho(info))
+    return info
+
+
 def _fetch_limits(cursor, plano: str) -> Dict[str, int]:
     min_sql = """
         SELECT FIRST 1 BDCODTPLA
@@ -186,26 +244,213 @@ def _normalize_account(code: Any) -> int:
     return int(digits) if digits else 0
 
 
-def _rows_to_dicts(cursor) -> List[Dict[str, Any]]:
+DECIMAIS_MODOS = ("float", "str", "centavos")
+
+
+def _decimal_para_centavos(value: Decimal) -> int:
+    return int((value * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _conversor_decimal(modo: str) -> Callable[[Decimal], Any]:
+    if modo == "str":
+        return str
+    if modo == "centavos":
+        return _decimal_para_centavos
+    return float
+
+
+def _conversor_coluna(type_code: Any, decimais: str) -> Optional[Callable[[Any], Any]]:
+    """
+    Conversor direto para uma coluna a partir do type_code do cursor.description
+    (o fdb informa o tipo Python). None significa que o valor já é serializável.
+    Os conversores não recebem None: o teste é feito na função compilada da linha.
+    """
+    if type_code in (int, str, float, bool):
+        return None
+    if type_code is Decimal:
+        return _conversor_decimal(decimais)
+    if type_code in (datetime, date, dt_time):
+        return type_code.isoformat
+    if type_code is bytes:
+        return lambda v: v.decode("utf-8", errors="ignore")
+    # tipo desconhecido: volta para o despacho genérico
+    return lambda v: _convert(v, decimais)
+
+
+def _compilar_conversor(description, decimais: str = "float", como_dict: bool = True) -> Callable[[Sequence[Any]], Any]:
+    """
+    Compila, uma vez por consulta, uma função que converte a linha inteira sem
+    despacho por tipo: as colunas que já são serializáveis são copiadas e as
+    demais passam direto pelo conversor da coluna.
+    """
+    if decimais not in DECIMAIS_MODOS:
+        raise BalanceteError(f"Modo de decimais inválido: {decimais}. Use {', '.join(DECIMAIS_MODOS)}.")
+
+    namespace: Dict[str, Any] = {}
+    expressoes = []
+    for idx, col in enumerate(description):
+        conv = _conversor_coluna(col[1] if len(col) > 1 else None, decimais)
+        if conv is None:
+            expressoes.append(f"r[{idx}]")
+        else:
+            namespace[f"c{idx}"] = conv
+            expressoes.append(f"(None if r[{idx}] is None else c{idx}(r[{idx}]))")
+
+    if como_dict:
+        colunas = [col[0].lower() for col in description]
+        corpo = "{" + ", ".join(f"{nome!r}: {expr}" for nome, expr in zip(colunas, expressoes)) + "}"
+    else:
+        corpo = "[" + ", ".join(expressoes) + "]"
+    return eval(f"lambda r: {corpo}", namespace)  # noqa: S307 - código gerado localmente
+
+
+def _rows_to_dicts(cursor, decimais: str = "float") -> List[Dict[str, Any]]:
+    converter = _compilar_conversor(cursor.description, decimais, como_dict=True)
+    return [converter(row) for row in cursor.fetchall()]
+
+
+def _rows_to_tuples(cursor, decimais: str = "float") -> Tuple[List[str], List[List[Any]]]:
+    """Variante sem dict por linha: (colunas, linhas como listas)."""
     columns = [col[0].lower() for col in cursor.description]
-    results: List[Dict[str, Any]] = []
-    for row in cursor.fetchall():
-        results.append({
-            columns[idx]: _convert(value)
-            for idx, value in enumerate(row)
-        })
-    return results
+    converter = _compilar_conversor(cursor.description, decimais, como_dict=False)
+    return columns, [converter(row) for row in cursor.fetchall()]
+
+
+PROCEDURE_BALANCETE = """VSUC_SP_RETORNA_BALANCETE(
+    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+)"""
 
 
+def _parametros_procedure(
+    empresa: int,
+    data_inicio_fmt: str,
+    data_fim_fmt: str,
+    competencia_ref: str,
+    limites: Dict[str, int],
+) -> List[Any]:
+    conta_inicial = limites["inicio"] or 0
+    conta_final = limites["fim"] or 0
+    return [
+        int(empresa),
+        data_inicio_fmt,
+        data_fim_fmt,
+        1,
+        conta_inicial,
+        conta_final,
+        0,
+        "",
+        competencia_ref,
+        0,
+        1,
+        1,
+        1,
+        1,
+        1,
+        1,
+        "1,2,3,4,5,6,7,8,9,10,11,12",
+        0,
+        0,
+        1,
+        1,
+        0,
+        0,
+        0,
+        0,
+        2,
+        1,
+    ]
+
+
+# Colunas devolvidas pela stored procedure (lidas uma vez por processo no prepare)
+_colunas_procedure: Optional[List[str]] = None
+
+
+def _colunas_balancete(cursor) -> List[str]:
+    global _colunas_procedure
+    if _colunas_procedure is None:
+        preparado = cursor.prep(f"SELECT * FROM {PROCEDURE_BALANCETE}")
+        _colunas_procedure = [col[0].lower() for col in preparado.description]
+    return _colunas_procedure
+
+
+# Colunas de valor da VSUC_SP_RETORNA_BALANCETE consideradas no filtro de contas
+# zeradas (layout em _docs/1) -- DADOS DE ACESSO AO BANCO DE DADOS .sql)
+COLUNAS_VALOR = (
+    "bdsaldo_anterior", "bdsaldo_ant_deb", "bdsaldo_ant_cre",
+    "bdsaldo_deb", "bdsaldo_cre", "bdsaldo_atual", "bdmovimento",
+)
+
+
+def _sql_balancete(
+    cursor,
+    prefixos: Sequence[str] = (),
+    somente_analiticas: bool = False,
+    nao_zeradas: bool = False,
+    colunas: Sequence[str] = (),
+) -> Tuple[str, Optional[List[str]]]:
+    """
+    SELECT sobre a stored procedure com os filtros e a projeção aplicados no
+    Firebird. Devolve (sql, colunas selecionadas ou None para todas).
+    Colunas pedidas que a procedure não devolve são ignoradas; um filtro sem as
+    colunas de que depende gera BalanceteError.
+    """
+    if not (prefixos or somente_analiticas or nao_zeradas or colunas):
+        return f"SELECT * FROM {PROCEDURE_BALANCETE}", None
+
+    disponiveis = _colunas_balancete(cursor)
+    selecionadas = None
+    if colunas:
+        selecionadas = [c for c in dict.fromkeys(c.lower() for c in colunas) if c in disponiveis]
+        if not selecionadas:
+            raise BalanceteError(f"Nenhuma das colunas pedidas existe no balancete: {', '.join(colunas)}.")
+
+    filtros = []
+    if prefixos:
+        if "bdctalon" not in disponiveis:
+            raise BalanceteError("O balancete não tem a coluna BDCTALON para filtrar por conta.")
+        filtros.append("(" + " OR ".join(
+            f"B.BDCTALON LIKE {literal_prefixo_sql(p)} ESCAPE '\\'" for p in prefixos
+        ) + ")")
+    if somente_analiticas:
+        if "bdtipcta" not in disponiveis:
+            raise BalanceteError("O balancete não tem a coluna BDTIPCTA para filtrar as contas analíticas.")
+        filtros.append("B.BDTIPCTA > 0")
+    if nao_zeradas:
+        valores = [c for c in COLUNAS_VALOR if c in disponiveis]
+        if not valores:
+            raise BalanceteError("O balancete não tem colunas de saldo para filtrar as contas zeradas.")
+        filtros.append("(" + " OR ".join(f"COALESCE(B.{c.upper()}, 0) <> 0" for c in valores) + ")")
+
+    lista = ", ".join(f"B.{c.upper()}" for c in selecionadas) if selecionadas else "B.*"
+    sql = f"SELECT {lista} FROM {PROCEDURE_BALANCETE} B"
+    if filtros:
+        sql += " WHERE " + " AND ".join(filtros)
+    return sql, selecionadas
+
+
+@medido("firebird")
 def obter_balancete(
     empresa: int,
     data_inicio: str,
     data_fim: str,
     competencia_ref: str,
+    decimais: str = "float",
+    formato: str = "dict",
+    prefixos: Sequence[str] = (),
+    somente_analiticas: bool = False,
+    nao_zeradas: bool = False,
+    colunas: Sequence[str] = (),
 ) -> Dict[str, Any]:
     """
     Consulta o balancete via stored procedure VSUC_SP_RETORNA_BALANCETE e retorna JSON.
+
+    decimais: "float" (padrão), "str" (Decimal exato em texto) ou "centavos" (inteiro).
+    formato: "dict" (uma chave por coluna) ou "tuplas" ("colunas" + linhas como listas).
+    prefixos/somente_analiticas/nao_zeradas/colunas: filtros e projeção aplicados no
+    SQL em volta da stored procedure (só as linhas e colunas pedidas trafegam).
     """
+    if formato not in ("dict", "tuplas"):
+        raise BalanceteError(f"Formato inválido: {formato}. Use dict ou tuplas.")
     data_inicio_fmt = _normalize_date(data_inicio)
     data_fim_fmt = _normalize_date(data_fim)
     competencia_ref = str(competencia_ref)
@@ -215,53 +460,22 @@ def obter_balancete(
 
         plano = _fetch_plan_code(cursor, empresa)
         limites = _fetch_limits(cursor, plano)
-        empresa_info = _fetch_empresa_info(cursor, empresa)
+        empresa_info = info_da_empresa(cursor, empresa)
 
-        sql = """
-            SELECT *
-            FROM VSUC_SP_RETORNA_BALANCETE(
-                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
-            )
-        """
-        conta_inicial = limites["inicio"] or 0
-        conta_final = limites["fim"] or 0
-        params = [
-            int(empresa),
-            data_inicio_fmt,
-            data_fim_fmt,
-            1,
-            conta_inicial,
-            conta_final,
-            0,
-            "",
-            competencia_ref,
-            0,
-            1,
-            1,
-            1,
-            1,
-            1,
-            1,
-            "1,2,3,4,5,6,7,8,9,10,11,12",
-            0,
-            0,
-            1,
-            1,
-            0,
-            0,
-            0,
-            0,
-            2,
-            1,
-        ]
+        sql, _ = _sql_balancete(cursor, prefixos, somente_analiticas, nao_zeradas, colunas)
+        params = _parametros_procedure(empresa, data_inicio_fmt, data_fim_fmt, competencia_ref, limites)
 
         try:
             cursor.execute(sql, params)
         except Exception as exc:  # pragma: no cover - erro externo
             raise BalanceteError("Falha ao executar a stored procedure do balancete.") from exc
 
-        data = _rows_to_dicts(cursor)
-        return {
+        nomes_colunas = None
+        if formato == "tuplas":
+            nomes_colunas, data = _rows_to_tuples(cursor, decimais)
+        else:
+            data = _rows_to_dicts(cursor, decimais)
+        resultado = {
             "empresa": empresa,
             "empresa_detalhes": empresa_info,
             "plano_contas": plano,
@@ -272,5 +486,120 @@ def obter_balancete(
                 "referencia": competencia_ref,
             },
             "total_registros": len(data),
+            "decimais": decimais,
             "dados": data,
         }
+        if nomes_colunas is not None:
+            resultado["colunas"] = nomes_colunas
+        if prefixos or somente_analiticas or nao_zeradas or colunas:
+            resultado["filtros"] = {
+                "prefixos": list(prefixos),
+                "somente_analiticas": somente_analiticas,
+                "nao_zeradas": nao_zeradas,
+                "colunas": list(colunas),
+            }
+        return resultado
+
+
+@medido("firebird")
+def obter_parametros_balancete(
+    empresa: int,
+    data_inicio: str,
+    data_fim: str,
+    competencia_ref: str,
+    entradas: Optional[List[Dict[str, Any]]] = None,
+    somente_analiticas: bool = False,
+) -> Dict[str, Any]:
+    """
+    Parâmetros da simulação consolidados pelo DE-PARA dentro do Firebird: um SELECT
+    agregado sobre a stored procedure devolve uma única linha em vez das contas.
+    Com regras que não cabem em SQL (regex), as linhas são lidas e avaliadas pelo
+    DE-PARA compilado (depara_regras).
+    """
+    entradas_informadas = entradas
+    if entradas is None:
+        entradas = list_entries()
+    data_inicio_fmt = _normalize_date(data_inicio)
+    data_fim_fmt = _normalize_date(data_fim)
+    competencia_ref = str(competencia_ref)
+
+    with firebird_connection() as conn:
+        cursor = conn.cursor()
+
+        plano = _fetch_plan_code(cursor, empresa)
+        limites = _fetch_limits(cursor, plano)
+        empresa_info = info_da_empresa(cursor, empresa)
+        params = _parametros_procedure(empresa, data_inicio_fmt, data_fim_fmt, competencia_ref, limites)
+
+        try:
+            sql, colunas_resultado = gerar_sql_consolidacao(
+                PROCEDURE_BALANCETE,
+                _colunas_balancete(cursor),
+                entradas,
+                somente_analiticas=somente_analiticas,
+            )
+            modo = "sql"
+        except ConsolidacaoSQLIndisponivel:
+            sql, modo = f"SELECT * FROM {PROCEDURE_BALANCETE}", "python"
+            try:
+                regras = compilar(entradas_informadas)
+            except DeParaInvalido as exc:
+                raise BalanceteError(str(exc)) from exc
+
+        try:
+            if sql:
+                cursor.execute(sql, params)
+        except Exception as exc:  # pragma: no cover - erro externo
+            raise BalanceteError("Falha ao executar a stored procedure do balancete.") from exc
+
+        if not sql:
+            valores: Dict[str, Decimal] = {}
+        elif modo == "sql":
+            valores = parametros_da_linha(cursor.fetchone(), colunas_resultado)
+        else:
+            linhas = _rows_to_dicts(cursor, "str")
+            if somente_analiticas:
+                linhas = [linha for linha in linhas if conta_analitica(linha)]
+            valores = regras.avaliar(linhas)
+
+    return {
+        "empresa": empresa,
+        "empresa_detalhes": empresa_info,
+        "plano_contas": plano,
+        "periodo": {
+            "inicio": data_inicio_fmt,
+            "fim": data_fim_fmt,
+            "referencia": competencia_ref,
+        },
+        "modo": modo,
+        "somente_analiticas": somente_analiticas,
+        "parametros": {parametro: f"{valor:.2f}" for parametro, valor in valores.items()},
+    }
+
+
+def chave_balancete(empresa: int, data_inicio: str, data_fim: str, competencia_ref: str, **opcoes) -> str:
+    """Identifica consultas equivalentes do balancete (datas normalizadas)."""
+    partes = [
+        str(int(empresa)),
+        _normalize_date(data_inicio),
+        _normalize_date(data_fim),
+        str(competencia_ref),
+    ]
+    for nome in sorted(opcoes):
+        valor = opcoes[nome]
+        if isinstance(valor, (list, tuple)):
+            valor = ",".join(str(item) for item in valor)
+        partes.append(f"{nome}={valor}")
+    return "|".join(partes)
+
+
+def obter_balancete_compartilhado(**params) -> Dict[str, Any]:
+    """
+    obter_balancete com single-flight: chamadas concorrentes para a mesma
+    (empresa, data_inicio, data_fim, comp_ref) executam a stored procedure uma vez.
+    """
+    return executar_compartilhado(
+        f"balancete:{chave_balancete(**params)}",
+        lambda: obter_balancete(**params),
+        timeout=getattr(settings, "BALANCETE_SINGLE_FLIGHT_TIMEOUT", 120),
+    )
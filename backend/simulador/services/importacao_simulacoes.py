@@ -0,0 +1,239 @@
+import csv
+import io
+import zipfile
+from decimal import InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from django.db import connection, models, transaction
+
+from simulador.models import (
+    AnexoSimples, Empresa, Simulacao,
+    SimulacaoAnexoMercadoria, SimulacaoAnexoServico,
+)
+from simulador.serializers import SimulacaoImportacaoSerializer
+from simulador.services.calculadora import CalculadoraTributaria
+
+try:  # pragma: no cover - dependência opcional (somente para .xlsx)
+    import openpyxl  # type: ignore
+    from openpyxl.utils.exceptions import InvalidFileException  # type: ignore
+except ImportError:  # pragma: no cover
+    openpyxl = None  # type: ignore
+    InvalidFileException = ValueError  # type: ignore
+
+TAMANHO_LOTE = 500
+
+_CAMPOS_DECIMAIS = {
+    f.name for f in Simulacao._meta.get_fields() if isinstance(f, models.DecimalField)
+}
+
+
+class ImportacaoError(Exception):
+    """Erro de leitura do arquivo de importação."""
+
+
+def _somente_digitos(valor: Any) -> str:
+    return "".join(ch for ch in str(valor or "") if ch.isdigit())
+
+
+def _normalizar_decimal(valor: str) -> str:
+    """Aceita '1.234,56' (formato brasileiro) além de '1234.56'."""
+    if "," in valor:
+        return valor.replace(".", "").replace(",", ".")
+    return valor
+
+
+def _parse_rateios(texto: str) -> List[Dict[str, str]]:
+    """
+    Converte '1=60000;3=40000' (número do anexo = valor) na lista esperada
+    pelo serializer.
+    """
+    itens = []
+    for parte in (texto or "").split(";"):
+        parte = parte.strip()
+        if not parte:
+            continue
+        anexo, sep, valor = parte.partition("=")
+        if not sep:
+            raise ValueError(f"Rateio inválido: '{parte}'. Use 'anexo=valor;anexo=valor'.")
+        itens.append({"anexo": anexo.strip(), "valor": _normalizar_decimal(valor.strip())})
+    return itens
+
+
+def _linhas_csv(arquivo) -> Iterator[Dict[str, Any]]:
+    texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+    numero = 1
+    try:
+        amostra = texto.readline()
+        if not amostra:
+            return
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=";,\t")
+        except csv.Error:
+            raise ImportacaoError("Não foi possível identificar o separador do CSV (use ';', ',' ou tabulação).")
+        colunas = next(csv.reader([amostra], dialeto))
+        for numero, linha in enumerate(csv.reader(texto, dialeto), start=2):
+            yield dict(zip(colunas, linha))
+    except UnicodeDecodeError:
+        raise ImportacaoError(f"Arquivo CSV não está em UTF-8 (linha {numero + 1}).")
+    except csv.Error as exc:
+        raise ImportacaoError(f"CSV inválido na linha {numero + 1}: {exc}") from exc
+
+
+def _linhas_xlsx(arquivo) -> Iterator[Dict[str, Any]]:
+    if openpyxl is None:
+        raise ImportacaoError("Biblioteca 'openpyxl' indisponível. Instale com 'pip install openpyxl'.")
+    try:
+        planilha = openpyxl.load_workbook(arquivo, read_only=True, data_only=True).active
+    except (InvalidFileException, zipfile.BadZipFile, KeyError) as exc:
+        raise ImportacaoError(f"Planilha XLSX inválida: {exc}") from exc
+    linhas = planilha.iter_rows(values_only=True)
+    colunas = [str(c or "").strip() for c in next(linhas, [])]
+    for linha in linhas:
+        yield {
+            col: ("" if valor is None else str(valor))
+            for col, valor in zip(colunas, linha)
+        }
+
+
+def ler_linhas(arquivo, nome: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lê o arquivo em streaming (CSV ou XLSX), uma linha por simulação. Linhas
+    vazias também são devolvidas, para manter a numeração do relatório.
+    """
+    if nome.lower().endswith((".xlsx", ".xlsm")):
+        return _linhas_xlsx(arquivo)
+    return _linhas_csv(arquivo)
+
+
+def _mapas_referencia() -> Dict[str, Dict[str, Any]]:
+    """Carrega empresas e anexos uma única vez para validar todas as linhas."""
+    empresas: Dict[str, Empresa] = {}
+    for empresa in Empresa.objects.all():
+        empresas[str(empresa.pk)] = empresa
+        empresas.setdefault(f"cnpj:{_somente_digitos(empresa.cnpj)}", empresa)
+
+    anexos: Dict[str, AnexoSimples] = {}
+    for anexo in AnexoSimples.objects.order_by("id"):
+        anexos.setdefault(str(anexo.numero), anexo)
+    return {"empresas": empresas, "anexos": anexos}
+
+
+def _preparar(linha: Dict[str, Any]) -> Dict[str, Any]:
+    dados: Dict[str, Any] = {}
+    for coluna, valor in linha.items():
+        coluna = (coluna or "").strip()
+        valor = (valor or "").strip() if isinstance(valor, str) else valor
+        if not coluna or valor in (None, ""):
+            continue
+        if coluna in ("anexos_mercadoria", "anexos_servico"):
+            dados[coluna] = _parse_rateios(valor)
+        elif coluna == "cnpj":
+            dados.setdefault("empresa_id", f"cnpj:{_somente_digitos(valor)}")
+        elif coluna in _CAMPOS_DECIMAIS:
+            dados[coluna] = _normalizar_decimal(valor)
+        else:
+            dados[coluna] = valor
+    return dados
+
+
+def _inserir_simulacoes(simulacoes: List[Simulacao]) -> None:
+    """bulk_create com as PKs preenchidas (necessárias para os rateios)."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        Simulacao.objects.bulk_create(simulacoes)
+        return
+    # MySQL não devolve as PKs. Um INSERT de várias linhas com quantidade conhecida
+    # recebe ids consecutivos em qualquer innodb_autoinc_lock_mode, e LAST_INSERT_ID()
+    # devolve o primeiro; por isso o lote vai num único INSERT.
+    Simulacao.objects.bulk_create(simulacoes, batch_size=len(simulacoes))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT LAST_INSERT_ID(), @@auto_increment_increment")
+        primeiro, incremento = cursor.fetchone()
+    for deslocamento, sim in enumerate(simulacoes):
+        sim.pk = primeiro + deslocamento * incremento
+
+
+def _gravar_lote(lote: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, Simulacao]]:
+    simulacoes = []
+    rateios: List[Tuple[Simulacao, type, Dict[str, Any]]] = []
+    for _, dados in lote:
+        mercadorias = dados.pop("anexos_mercadoria", [])
+        servicos = dados.pop("anexos_servico", [])
+        sim = Simulacao(**dados)
+        simulacoes.append(sim)
+        rateios.extend((sim, SimulacaoAnexoMercadoria, item) for item in mercadorias)
+        rateios.extend((sim, SimulacaoAnexoServico, item) for item in servicos)
+
+    with transaction.atomic():
+        _inserir_simulacoes(simulacoes)
+
+        por_modelo: Dict[type, List[models.Model]] = {
+            SimulacaoAnexoMercadoria: [],
+            SimulacaoAnexoServico: [],
+        }
+        for sim, modelo, item in rateios:
+            por_modelo[modelo].append(modelo(simulacao=sim, anexo=item["anexo"], valor=item["valor"]))
+        for modelo, objetos in por_modelo.items():
+            modelo.objects.bulk_create(objetos, batch_size=TAMANHO_LOTE)
+
+    return [(numero, sim) for (numero, _), sim in zip(lote, simulacoes)]
+
+
+def importar_simulacoes(
+    linhas: Iterable[Dict[str, Any]],
+    *,
+    processar: bool = False,
+    meses_no_periodo: int = 1,
+    tamanho_lote: int = TAMANHO_LOTE,
+) -> Dict[str, Any]:
+    """
+    Valida (mesmas regras do SimulacaoSerializer) e grava simulações em lotes.
+
+    Colunas: nomes dos campos de Simulacao, 'empresa_id' ou 'cnpj' e
+    'anexos_mercadoria'/'anexos_servico' no formato '1=60000;3=40000'.
+    Linhas inválidas não interrompem a importação e são listadas em 'erros'.
+    """
+    contexto = _mapas_referencia()
+    erros: List[Dict[str, Any]] = []
+    criadas: List[int] = []
+    lote: List[Tuple[int, Dict[str, Any]]] = []
+    total = 0
+
+    def descarregar():
+        for numero, sim in _gravar_lote(lote):
+            criadas.append(sim.pk)
+            if processar:
+                try:
+                    CalculadoraTributaria(sim, meses_no_periodo=meses_no_periodo).processar()
+                except ValueError as exc:
+                    erros.append({"linha": numero, "simulacao_id": sim.pk, "erros": {"processar": [str(exc)]}})
+        lote.clear()
+
+    # linha 1 é o cabeçalho
+    for numero, linha in enumerate(linhas, start=2):
+        if not any(str(valor or "").strip() for valor in linha.values()):
+            continue
+        total += 1
+        try:
+            dados = _preparar(linha)
+        except (ValueError, InvalidOperation) as exc:
+            erros.append({"linha": numero, "erros": {"arquivo": [str(exc)]}})
+            continue
+
+        serializer = SimulacaoImportacaoSerializer(data=dados, context=contexto)
+        if not serializer.is_valid():
+            erros.append({"linha": numero, "erros": serializer.errors})
+            continue
+
+        lote.append((numero, dict(serializer.validated_data)))
+        if len(lote) >= tamanho_lote:
+            descarregar()
+
+    if lote:
+        descarregar()
+
+    return {
+        "total_linhas": total,
+        "importadas": len(criadas),
+        "simulacoes": criadas,
+        "erros": erros,
+    }
@@ -0,0 +1,207 @@
+import logging
+import os
+import socket
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db.models import F
+from django.utils import timezone
+
+from simulador.models import Job
+
+logger = logging.getLogger("simulador.jobs")
+
+# Espera antes de uma nova tentativa: BACKOFF_BASE * 2^(tentativas - 1)
+BACKOFF_BASE = timedelta(seconds=5)
+
+_INTERROMPIDO = "Execução interrompida (o worker parou)."
+
+
+class JobCancelado(Exception):
+    """Levantada pela tarefa quando o cancelamento é solicitado."""
+
+
+class JobFalhaDefinitiva(Exception):
+    """Erro que não deve gerar nova tentativa (ex.: parâmetros inválidos)."""
+
+
+@dataclass
+class Tarefa:
+    nome: str
+    executar: Callable[["ContextoJob", Dict[str, Any]], Any]
+    validar: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+
+
+TAREFAS: Dict[str, Tarefa] = {}
+
+
+def tarefa(nome: str, *, validar=None):
+    """Registra uma função como tarefa executável pela fila de jobs."""
+    def decorator(func):
+        TAREFAS[nome] = Tarefa(nome=nome, executar=func, validar=validar)
+        return func
+    return decorator
+
+
+class ContextoJob:
+    """Interface da tarefa com o job: progresso e verificação de cancelamento."""
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def progresso(self, percentual: int, mensagem: str = "") -> None:
+        percentual = max(0, min(100, int(percentual)))
+        Job.objects.filter(pk=self.job.pk).update(progresso=percentual, mensagem=mensagem[:255])
+        self.job.progresso = percentual
+        self.job.mensagem = mensagem
+
+    def cancelado(self) -> bool:
+        return Job.objects.filter(pk=self.job.pk, cancelamento_solicitado=True).exists()
+
+    def verificar_cancelamento(self) -> None:
+        if self.cancelado():
+            raise JobCancelado()
+
+
+def identificador_worker() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enfileirar(
+    tipo: str, parametros: Optional[Dict[str, Any]] = None, *, max_tentativas: int = 3, chave: str = ""
+) -> Job:
+    """Valida os parâmetros da tarefa e grava o job como pendente."""
+    definicao = TAREFAS.get(tipo)
+    if definicao is None:
+        raise ValueError(f"Tipo de job desconhecido: {tipo}. Disponíveis: {', '.join(sorted(TAREFAS))}.")
+    parametros = dict(parametros or {})
+    if definicao.validar:
+        parametros = definicao.validar(parametros)
+    return Job.objects.create(
+        tipo=tipo,
+        parametros=parametros,
+        chave=chave,
+        max_tentativas=max(1, int(max_tentativas)),
+        disponivel_em=timezone.now(),
+    )
+
+
+def cancelar(job: Job) -> Job:
+    """Pendentes são cancelados na hora; em execução, a tarefa é avisada."""
+    if job.status == Job.STATUS_PENDENTE:
+        atualizados = Job.objects.filter(pk=job.pk, status=Job.STATUS_PENDENTE).update(
+            status=Job.STATUS_CANCELADO,
+            cancelamento_solicitado=True,
+            concluido_em=timezone.now(),
+        )
+        if atualizados:
+            job.refresh_from_db()
+            return job
+    if job.status in (Job.STATUS_PENDENTE, Job.STATUS_EXECUTANDO):
+        Job.objects.filter(pk=job.pk).update(cancelamento_solicitado=True)
+    job.refresh_from_db()
+    return job
+
+
+def reservar_proximo(worker: str) -> Optional[Job]:
+    """
+    Reserva o próximo job disponível. A reserva é um UPDATE condicional no
+    status, então dois workers nunca executam o mesmo job.
+    """
+    agora = timezone.now()
+    candidatos = (
+        Job.objects
+        .filter(status=Job.STATUS_PENDENTE, disponivel_em__lte=agora)
+        .order_by("disponivel_em", "id")
+        .values_list("id", flat=True)[:10]
+    )
+    for job_id in candidatos:
+        reservado = Job.objects.filter(pk=job_id, status=Job.STATUS_PENDENTE).update(
+            status=Job.STATUS_EXECUTANDO,
+            worker=worker,
+            iniciado_em=agora,
+            progresso=0,
+        )
+        if reservado:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def executar(job: Job) -> Job:
+    """Executa um job já reservado e registra resultado, erro ou nova tentativa."""
+    definicao = TAREFAS.get(job.tipo)
+    job.tentativas += 1
+    Job.objects.filter(pk=job.pk).update(tentativas=job.tentativas)
+
+    try:
+        if definicao is None:
+            raise JobFalhaDefinitiva(f"Tipo de job desconhecido: {job.tipo}")
+        contexto = ContextoJob(job)
+        contexto.verificar_cancelamento()
+        resultado = definicao.executar(contexto, job.parametros)
+    except JobCancelado:
+        _finalizar(job, Job.STATUS_CANCELADO, mensagem="Cancelado")
+    except Exception as exc:
+        definitiva = isinstance(exc, JobFalhaDefinitiva) or job.tentativas >= job.max_tentativas
+        logger.warning("Job %s (%s) falhou na tentativa %s: %s", job.pk, job.tipo, job.tentativas, exc)
+        if isinstance(exc, JobFalhaDefinitiva):
+            _finalizar(job, Job.STATUS_ERRO, erro=str(exc))  # erro esperado: só a mensagem
+        elif definitiva:
+            _finalizar(job, Job.STATUS_ERRO, erro=f"{exc}\n\n{traceback.format_exc()}".strip())
+        else:
+            espera = BACKOFF_BASE * (2 ** (job.tentativas - 1))
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_PENDENTE,
+                disponivel_em=timezone.now() + espera,
+                erro=str(exc),
+                worker="",
+            )
+    else:
+        _finalizar(job, Job.STATUS_CONCLUIDO, resultado=resultado, progresso=100)
+    job.refresh_from_db()
+    return job
+
+
+def _finalizar(job: Job, status: str, *, resultado=None, erro: str = "", mensagem: str = None, progresso=None) -> None:
+    campos = {
+        "status": status,
+        "resultado": resultado,
+        "erro": erro,
+        "concluido_em": timezone.now(),
+    }
+    if mensagem is not None:
+        campos["mensagem"] = mensagem
+    if progresso is not None:
+        campos["progresso"] = progresso
+    Job.objects.filter(pk=job.pk).update(**campos)
+
+
+def recuperar_travados(limite: timedelta) -> Tuple[int, int]:
+    """
+    Trata jobs 'executando' há mais tempo que o limite (worker morreu). Cada
+    execução interrompida já contou como tentativa: com tentativas esgotadas o
+    job termina em erro (um job que derruba o worker não volta para sempre);
+    com cancelamento solicitado, é cancelado; os demais voltam à fila.
+    Devolve (devolvidos à fila, finalizados).
+    """
+    agora = timezone.now()
+    travados = Job.objects.filter(status=Job.STATUS_EXECUTANDO, iniciado_em__lt=agora - limite)
+    cancelados = travados.filter(cancelamento_solicitado=True).update(
+        status=Job.STATUS_CANCELADO,
+        mensagem="Cancelado",
+        concluido_em=agora,
+    )
+    esgotados = travados.filter(tentativas__gte=F("max_tentativas")).update(
+        status=Job.STATUS_ERRO,
+        erro=f"{_INTERROMPIDO}\n\nTentativas esgotadas.",
+        concluido_em=agora,
+    )
+    devolvidos = travados.update(
+        status=Job.STATUS_PENDENTE,
+        disponivel_em=agora,
+        erro=_INTERROMPIDO,
+        worker="",
+    )
+    return devolvidos, cancelados + esgotados
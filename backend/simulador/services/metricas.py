@@ -0,0 +1,174 @@
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional
+
+# Coleta da requisição corrente (None quando a instrumentação está desligada)
+_coleta: contextvars.ContextVar[Optional["ColetaRequisicao"]] = contextvars.ContextVar(
+    "simulador_coleta", default=None
+)
+
+AMOSTRAS_POR_ENDPOINT = 500
+
+
+class ColetaRequisicao:
+    """Acumula tempos e contagem de queries de uma requisição."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.tempos: Dict[str, float] = defaultdict(float)
+        self.queries: Dict[str, int] = defaultdict(int)
+        self.tempo_queries: Dict[str, float] = defaultdict(float)
+
+    def registrar_query(self, alias: str, duracao: float) -> None:
+        self.queries[alias] += 1
+        self.tempo_queries[alias] += duracao
+
+    def adicionar(self, nome: str, duracao: float) -> None:
+        self.tempos[nome] += duracao
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.inicio) * 1000
+
+
+def iniciar_coleta() -> contextvars.Token:
+    return _coleta.set(ColetaRequisicao())
+
+
+def coleta_atual() -> Optional[ColetaRequisicao]:
+    return _coleta.get()
+
+
+def encerrar_coleta(token: contextvars.Token) -> None:
+    _coleta.reset(token)
+
+
+@contextlib.contextmanager
+def medir(nome: str):
+    """Soma o tempo do bloco em `nome` na coleta corrente (no-op se desligada)."""
+    coleta = _coleta.get()
+    if coleta is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        coleta.adicionar(nome, time.perf_counter() - inicio)
+
+
+def medido(nome: str):
+    """Decorator equivalente a `medir`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with medir(nome):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def contador_queries(alias: str):
+    """execute_wrapper do Django que registra cada query na coleta corrente."""
+    def wrapper(execute, sql, params, many, context):
+        coleta = _coleta.get()
+        if coleta is None:
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            coleta.registrar_query(alias, time.perf_counter() - inicio)
+    return wrapper
+
+
+# --------------------------
+# Serialização (viewsets do DRF)
+# --------------------------
+class _DadosMedidos:
+    """Base acrescentada à classe do serializer para medir `.data`."""
+
+    @property
+    def data(self):
+        with medir("serializacao"):
+            return super().data
+
+
+@functools.lru_cache(maxsize=None)
+def _classe_medida(classe: type) -> type:
+    return type(classe.__name__, (_DadosMedidos, classe), {"__module__": classe.__module__})
+
+
+class SerializacaoMedidaMixin:
+    """
+    Mede `serializer.data` (to_representation) dos serializers do viewset. O DRF
+    serializa dentro da view, antes da renderização que o middleware mede.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if _coleta.get() is not None:
+            serializer.__class__ = _classe_medida(type(serializer))
+        return serializer
+
+
+# --------------------------
+# Agregação em memória (por processo)
+# --------------------------
+_lock = threading.Lock()
+_amostras: Dict[str, deque] = {}
+
+
+def registrar_amostra(endpoint: str, amostra: Dict[str, Any]) -> None:
+    with _lock:
+        fila = _amostras.get(endpoint)
+        if fila is None:
+            fila = _amostras[endpoint] = deque(maxlen=AMOSTRAS_POR_ENDPOINT)
+        fila.append(amostra)
+
+
+def percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    idx = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[idx]
+
+
+def _resumir_serie(valores: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(percentil(valores, 50), 2),
+        "p95": round(percentil(valores, 95), 2),
+        "p99": round(percentil(valores, 99), 2),
+        "max": round(max(valores), 2) if valores else 0.0,
+    }
+
+
+def resumo_metricas() -> Dict[str, Any]:
+    """Percentis por endpoint das últimas amostras deste processo."""
+    with _lock:
+        copia = {endpoint: list(fila) for endpoint, fila in _amostras.items()}
+
+    resultado = {}
+    for endpoint, amostras in sorted(copia.items()):
+        series: Dict[str, List[float]] = defaultdict(list)
+        for amostra in amostras:
+            series["total_ms"].append(amostra["total_ms"])
+            for alias, qtd in amostra["queries"].items():
+                series[f"queries.{alias}"].append(qtd)
+                series[f"db_ms.{alias}"].append(amostra["db_ms"][alias])
+            for nome, ms in amostra["tempos_ms"].items():
+                series[f"{nome}_ms"].append(ms)
+        resultado[endpoint] = {
+            "amostras": len(amostras),
+            **{nome: _resumir_serie(valores) for nome, valores in sorted(series.items())},
+        }
+    return resultado
+
+
+def limpar_metricas() -> None:
+    with _lock:
+        _amostras.clear()
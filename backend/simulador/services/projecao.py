@@ -0,0 +1,290 @@
+from bisect import bisect_right
+from collections import deque
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from simulador.models import Simulacao, VersaoTabelas
+from simulador.services.calculadora import REGIMES, _q
+from simulador.services.simples_tabela import ForaDoSimples
+from simulador.services.tabelas_versionadas import TabelasVigentes, snapshot_por_id
+
+D = Decimal
+
+# Valores mensais aceitos na projeção (mesmos nomes dos campos da Simulacao)
+CAMPOS_MENSAIS = (
+    "receita_mercadorias",
+    "receita_servicos",
+    "receita_exportacao",
+    "folha_total",
+    "inss_patronal",
+    "custo_mercadorias",
+    "custo_servicos",
+    "despesas_operacionais",
+    "outras_despesas",
+    "despesas_nao_dedutiveis",
+    "adicoes_fiscais",
+    "exclusoes_fiscais",
+    "creditos_pis",
+    "creditos_cofins",
+)
+
+LIMITE_ADICIONAL_MENSAL = D("20000")
+
+
+def _proximo_mes(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def meses_da_simulacao(simulacao: Simulacao, quantidade: int = 12, *, meses_no_periodo: int = 1) -> List[Dict[str, Any]]:
+    """Sequência de meses iguais à média mensal da simulação (sem entradas mensais informadas)."""
+    divisor = D(max(1, int(meses_no_periodo)))
+    inicio = simulacao.competencia or simulacao.data or date.today()
+    competencia = date(inicio.year, inicio.month, 1)
+    base = {campo: _q(D(getattr(simulacao, campo) or 0) / divisor) for campo in CAMPOS_MENSAIS}
+    if simulacao.lucro_contabil is not None:
+        base["lucro_contabil"] = _q(simulacao.lucro_contabil / divisor)
+    meses = []
+    for _ in range(max(1, int(quantidade))):
+        meses.append({"competencia": competencia, **base})
+        competencia = _proximo_mes(competencia)
+    return meses
+
+
+class _Trimestre:
+    """Acumula as bases do trimestre em curso (IRPJ/CSLL são apurados trimestralmente)."""
+
+    def __init__(self):
+        self.meses = 0
+        self.base_irpj_presumido = D("0.00")
+        self.base_csll_presumido = D("0.00")
+        self.lucro_real = D("0.00")
+
+    def fechar(self, aliq_irpj_real: Decimal, aliq_csll_real: Decimal) -> Dict[str, Dict[str, Decimal]]:
+        limite = LIMITE_ADICIONAL_MENSAL * self.meses
+
+        excedente = self.base_irpj_presumido - limite
+        presumido = {
+            "IRPJ": _q(self.base_irpj_presumido * D("0.15") + (excedente * D("0.10") if excedente > 0 else 0)),
+            "CSLL": _q(self.base_csll_presumido * D("0.09")),
+        }
+
+        lucro = _q(max(D("0.00"), self.lucro_real))
+        excedente = lucro - limite
+        real = {
+            "IRPJ": _q(lucro * (aliq_irpj_real / 100) + (excedente * D("0.10") if excedente > 0 else 0)),
+            "CSLL": _q(lucro * (aliq_csll_real / 100)),
+        }
+        return {"Presumido": presumido, "Real": real}
+
+
+class ProjecaoTributaria:
+    """
+    Projeta os três regimes mês a mês a partir dos parâmetros da simulação.
+    - Simples: RBT12 móvel (12 meses anteriores), recalculando a faixa a cada mês;
+      meses com RBT12 acima do limite (ou CNAE impedido) deixam o Simples fora do vencedor.
+    - Presumido/Real: IRPJ/CSLL apurados por trimestre e lançados no mês de fechamento.
+    O estado (janela do RBT12, bases do trimestre) é acumulado ao longo da sequência.
+    """
+
+    def __init__(
+        self,
+        simulacao: Simulacao,
+        meses: Sequence[Dict[str, Any]],
+        *,
+        historico_receitas: Optional[Sequence[Decimal]] = None,
+    ):
+        if not meses:
+            raise ValueError("Informe ao menos um mês para a projeção.")
+        self.s = simulacao
+        self.meses = sorted(meses, key=lambda m: m["competencia"])
+        self.cnae = (simulacao.empresa.cnae_principal or "").strip()
+
+        self.aliq_pis = _q(simulacao.aliquota_pis or 0)
+        self.aliq_cofins = _q(simulacao.aliquota_cofins or 0)
+        self.aliq_iss = _q(simulacao.aliquota_iss or 0)
+        self.aliq_icms = _q(simulacao.aliquota_icms or 0)
+        self.aliq_inss_total = _q(simulacao.aliquota_inss_total or 0)
+        self.pres_irpj_merc = _q(simulacao.presumido_irpj_merc or 0)
+        self.pres_csll_merc = _q(simulacao.presumido_csll_merc or 0)
+        self.pres_irpj_serv = _q(simulacao.presumido_irpj_serv or 0)
+        self.pres_csll_serv = _q(simulacao.presumido_csll_serv or 0)
+
+        self.fracoes_mercadoria = self._fracoes(simulacao.anexos_mercadoria.select_related("anexo"), "mercadorias")
+        self.fracoes_servico = self._fracoes(simulacao.anexos_servico.select_related("anexo"), "serviços")
+
+        if historico_receitas is None:
+            media = _q(D(simulacao.receita_12_meses or 0) / 12)
+            historico_receitas = [media] * 12
+        self.janela_rbt12 = deque((_q(v) for v in historico_receitas), maxlen=12)
+
+        # Versões das tabelas carregadas uma vez; cada mês escolhe por bisseção
+        versoes = list(
+            VersaoTabelas.objects.order_by("vigencia_inicio").values_list("vigencia_inicio", "id")
+        )
+        self._vigencias = [vigencia for vigencia, _ in versoes]
+        self._versao_ids = [versao_id for _, versao_id in versoes]
+        self._vigentes = TabelasVigentes()
+
+    @staticmethod
+    def _fracoes(rateios, descricao: str) -> List[tuple]:
+        rateios = list(rateios)
+        total = sum(_q(item.valor) for item in rateios)
+        fracoes = []
+        for item in rateios:
+            if not item.anexo:
+                raise ValueError(f"Anexo inválido na distribuição de {descricao}.")
+            if total > 0:
+                fracoes.append((item.anexo.numero, _q(item.valor) / total))
+        return fracoes
+
+    def _tabelas(self, competencia: date):
+        idx = bisect_right(self._vigencias, competencia)
+        if idx == 0:
+            return self._vigentes
+        return snapshot_por_id(self._versao_ids[idx - 1])
+
+    # --------------------------
+    # PÚBLICO
+    # --------------------------
+    def calcular(self) -> Dict[str, Any]:
+        resultado_meses = []
+        totais = {regime: D("0.00") for regime in REGIMES}
+        simples_inelegivel = []
+        trimestre = _Trimestre()
+        tabelas = None
+
+        for posicao, mes in enumerate(self.meses):
+            competencia = mes["competencia"]
+            tabelas = self._tabelas(competencia)
+            valores = {campo: _q(mes.get(campo) or 0) for campo in CAMPOS_MENSAIS}
+            receita = _q(valores["receita_mercadorias"] + valores["receita_servicos"])
+            rbt12 = _q(sum(self.janela_rbt12))
+
+            comuns = self._tributos_comuns(valores)
+            simples, motivo = self._simples(tabelas, valores, rbt12 if rbt12 > 0 else receita)
+            linha = {
+                "competencia": f"{competencia:%Y-%m}",
+                "receita_total": receita,
+                "rbt12": rbt12,
+                "Simples": simples,
+                "Presumido": {**comuns["Presumido"]},
+                "Real": {**comuns["Real"]},
+            }
+            if motivo:
+                linha["simples_inelegivel"] = motivo
+                simples_inelegivel.append(linha["competencia"])
+
+            self._acumular_trimestre(trimestre, valores, mes.get("lucro_contabil"), receita)
+            ultimo = posicao == len(self.meses) - 1
+            if competencia.month % 3 == 0 or ultimo:
+                apurado = trimestre.fechar(
+                    self._aliquota_fixa(tabelas, "IRPJ", "15.00"),
+                    self._aliquota_fixa(tabelas, "CSLL", "9.00"),
+                )
+                for regime, tributos in apurado.items():
+                    linha[regime].update(tributos)
+                trimestre = _Trimestre()
+
+            for regime in REGIMES:
+                linha[regime]["TOTAL"] = _q(sum(v for k, v in linha[regime].items() if k != "TOTAL"))
+                totais[regime] += linha[regime]["TOTAL"]
+            resultado_meses.append(linha)
+            self.janela_rbt12.append(receita)
+
+        candidatos = [regime for regime in REGIMES if regime != "Simples" or not simples_inelegivel]
+        vencedor = min(candidatos, key=lambda r: totais[r])
+        return {
+            "simulacao_id": self.s.id,
+            "versao_tabelas": tabelas.versao_id if tabelas else None,
+            "meses": [self._formatar(linha) for linha in resultado_meses],
+            "totais": {regime: f"{_q(total):.2f}" for regime, total in totais.items()},
+            "vencedor": vencedor,
+            "simples_inelegivel": simples_inelegivel,
+        }
+
+    # --------------------------
+    # REGIMES
+    # --------------------------
+    def _simples(self, tabelas, valores: Dict[str, Decimal], rbt12: Decimal) -> Tuple[Dict[str, Decimal], str]:
+        """DAS do mês e, quando o Simples não se aplica, o motivo (DAS zerado)."""
+        if self.cnae and tabelas.cnae_impedido(self.cnae):
+            return {"DAS": D("0.00")}, f"CNAE {self.cnae} impedido no Simples Nacional."
+        das = D("0.00")
+        for receita, fracoes, descricao in (
+            (valores["receita_mercadorias"], self.fracoes_mercadoria, "mercadorias"),
+            (valores["receita_servicos"], self.fracoes_servico, "serviços"),
+        ):
+            if receita <= 0:
+                continue
+            if not fracoes:
+                raise ValueError(f"Distribua a receita de {descricao} por anexo do Simples.")
+            for anexo_num, fracao in fracoes:
+                parcela = _q(receita * fracao)
+                try:
+                    das += _q(parcela * tabelas.aliquota_efetiva_simples(anexo_num, rbt12))
+                except ForaDoSimples as exc:
+                    return {"DAS": D("0.00")}, str(exc)
+        return {"DAS": _q(das)}, ""
+
+    def _tributos_comuns(self, valores: Dict[str, Decimal]) -> Dict[str, Dict[str, Decimal]]:
+        receita_total = valores["receita_mercadorias"] + valores["receita_servicos"]
+        receita_domestica = _q(receita_total - valores["receita_exportacao"])
+        receita_merc_dom = _q(max(D("0.00"), valores["receita_mercadorias"] - valores["receita_exportacao"]))
+
+        iss = _q(valores["receita_servicos"] * (self.aliq_iss / 100))
+        icms = _q(receita_merc_dom * (self.aliq_icms / 100))
+        if valores["inss_patronal"] > 0:
+            inss = valores["inss_patronal"]
+        elif self.aliq_inss_total > 0:
+            inss = _q(valores["folha_total"] * (self.aliq_inss_total / 100))
+        else:
+            inss = D("0.00")
+
+        pis = receita_domestica * (self.aliq_pis / 100)
+        cofins = receita_domestica * (self.aliq_cofins / 100)
+        return {
+            "Presumido": {
+                "PIS": _q(pis), "COFINS": _q(cofins), "ISS": iss, "ICMS": icms, "INSS": inss,
+            },
+            "Real": {
+                "PIS": _q(pis - valores["creditos_pis"]),
+                "COFINS": _q(cofins - valores["creditos_cofins"]),
+                "INSS": inss, "ISS": iss, "ICMS": icms,
+            },
+        }
+
+    def _acumular_trimestre(self, trimestre: _Trimestre, valores, lucro_contabil, receita: Decimal) -> None:
+        merc, serv = valores["receita_mercadorias"], valores["receita_servicos"]
+        trimestre.meses += 1
+        trimestre.base_irpj_presumido += _q(merc * (self.pres_irpj_merc / 100) + serv * (self.pres_irpj_serv / 100))
+        trimestre.base_csll_presumido += _q(merc * (self.pres_csll_merc / 100) + serv * (self.pres_csll_serv / 100))
+
+        if lucro_contabil is not None:
+            lucro = _q(lucro_contabil)
+        else:
+            lucro = receita - (
+                valores["custo_mercadorias"]
+                + valores["custo_servicos"]
+                + valores["despesas_operacionais"]
+                + valores["outras_despesas"]
+            )
+        trimestre.lucro_real += lucro + valores["adicoes_fiscais"] + valores["despesas_nao_dedutiveis"] - valores["exclusoes_fiscais"]
+
+    @staticmethod
+    def _aliquota_fixa(tabelas, imposto: str, default: str) -> Decimal:
+        aliquota = tabelas.aliquota_fixa(imposto)
+        return _q(default) if aliquota is None else aliquota
+
+    @staticmethod
+    def _formatar(linha: Dict[str, Any]) -> Dict[str, Any]:
+        formatada = {
+            "competencia": linha["competencia"],
+            "receita_total": f"{linha['receita_total']:.2f}",
+            "rbt12": f"{linha['rbt12']:.2f}",
+        }
+        for regime in REGIMES:
+            formatada[regime] = {k: f"{v:.2f}" for k, v in linha[regime].items()}
+        if "simples_inelegivel" in linha:
+            formatada["simples_inelegivel"] = linha["simples_inelegivel"]
+        return formatada
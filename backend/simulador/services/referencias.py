@@ -0,0 +1,57 @@
+from typing import Any, Dict, Tuple
+
+from django.core.cache import cache
+
+from simulador.models import (
+    AliquotaFederal, AliquotaFixa, AnexoSimples, BasePresumido, CnaeAnexo, CnaeImpedimento, FaixaSimples,
+)
+from simulador.services import versoes
+
+MODELOS_REFERENCIA = (
+    AnexoSimples, FaixaSimples, CnaeAnexo, CnaeImpedimento,
+    BasePresumido, AliquotaFixa, AliquotaFederal,
+)
+versoes.registrar(*MODELOS_REFERENCIA)
+
+_CACHE_TIMEOUT = 60 * 60 * 24  # a chave muda com a versão; o timeout só limpa versões antigas
+
+
+def _montar() -> Dict[str, Any]:
+    return {
+        "anexos_simples": list(AnexoSimples.objects.order_by("numero", "id").values("id", "numero", "atividade")),
+        "faixas_simples": [
+            {**faixa, "receita_de": str(faixa["receita_de"]), "receita_ate": str(faixa["receita_ate"]),
+             "aliquota": str(faixa["aliquota"]), "deducao": str(faixa["deducao"])}
+            for faixa in FaixaSimples.objects.order_by("anexo_id", "receita_de")
+            .values("id", "anexo_id", "receita_de", "receita_ate", "aliquota", "deducao")
+        ],
+        "cnae_anexos": list(CnaeAnexo.objects.order_by("cnae").values("id", "cnae", "anexo_id")),
+        "cnae_impedimentos": list(CnaeImpedimento.objects.order_by("cnae").values("id", "cnae", "descricao")),
+        "base_presumido": [
+            {**base, "fator_irpj": str(base["fator_irpj"]), "fator_csll": str(base["fator_csll"])}
+            for base in BasePresumido.objects.order_by("id").values("id", "atividade", "fator_irpj", "fator_csll")
+        ],
+        "aliquotas_fixas": [
+            {**item, "aliquota": str(item["aliquota"])}
+            for item in AliquotaFixa.objects.order_by("id").values("id", "imposto", "aliquota")
+        ],
+        "aliquotas_federais": [
+            {**item, "aliquota": str(item["aliquota"])}
+            for item in AliquotaFederal.objects.order_by("id").values("id", "imposto", "aliquota", "base_calculo")
+        ],
+    }
+
+
+def etag_referencias() -> str:
+    return versoes.etag(MODELOS_REFERENCIA)
+
+
+def obter_referencias() -> Tuple[str, Dict[str, Any]]:
+    """(etag, payload) das tabelas de referência; o payload é montado uma vez por versão."""
+    etag = etag_referencias()
+    chave = f"referencias:{etag.strip(chr(34))}"
+    dados = cache.get(chave)
+    if dados is None:
+        dados = _montar()
+        cache.set(chave, dados, _CACHE_TIMEOUT)
+    return etag, dados
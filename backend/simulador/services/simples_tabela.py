@@ -0,0 +1,140 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from simulador.models import FaixaSimples
+
+D = Decimal
+
+_TAMANHO_CACHE = 4096
+# Faixas consecutivas: receita_de da próxima = receita_ate da anterior + 1 centavo
+_CENTAVO = D("0.01")
+
+
+class TabelaSimplesInvalida(ValueError):
+    """Faixas do anexo com lacuna, sobreposição ou ausentes."""
+
+
+class ForaDoSimples(ValueError):
+    """RBT12 acima da última faixa do anexo: a empresa não pode optar pelo Simples."""
+
+
+def _q(v) -> Decimal:
+    return D(str(v)).quantize(_CENTAVO, rounding=ROUND_HALF_UP)
+
+
+@dataclass(frozen=True)
+class TabelaSimples:
+    """Faixas de um anexo ordenadas, com alíquota nominal (fração) e dedução prontas."""
+    anexo_num: int
+    inicios: Tuple[Decimal, ...]
+    limites: Tuple[Decimal, ...]
+    aliquotas: Tuple[Decimal, ...]
+    deducoes: Tuple[Decimal, ...]
+
+    def aliquota_efetiva(self, rbt12: Decimal) -> Decimal:
+        idx = bisect_left(self.limites, rbt12)
+        if idx == len(self.limites):
+            raise ForaDoSimples(
+                f"RBT12 {rbt12:.2f} acima do limite do Anexo {self.anexo_num} do Simples ({self.limites[-1]:.2f})."
+            )
+        if rbt12 < self.inicios[idx]:
+            raise TabelaSimplesInvalida(
+                f"RBT12 {rbt12:.2f} fora das faixas do Anexo {self.anexo_num} do Simples."
+            )
+        base = rbt12 if rbt12 > 0 else 1
+        return (rbt12 * self.aliquotas[idx] - self.deducoes[idx]) / base
+
+
+def compilar_tabela(anexo_num: int) -> TabelaSimples:
+    """Carrega as faixas vigentes do anexo e compila a tabela."""
+    faixas = (
+        FaixaSimples.objects
+        .filter(anexo__numero=anexo_num)
+        .values_list("receita_de", "receita_ate", "aliquota", "deducao")
+    )
+    return compilar_faixas(anexo_num, faixas)
+
+
+def compilar_faixas(anexo_num: int, faixas: Iterable[Tuple[Decimal, Decimal, Decimal, Decimal]]) -> TabelaSimples:
+    """
+    Compila (receita_de, receita_ate, aliquota, deducao) do anexo, validando a
+    continuidade das faixas (sem lacunas/sobreposições).
+    """
+    faixas = sorted((tuple(D(v) for v in faixa) for faixa in faixas), key=lambda f: (f[0], f[1]))
+    if not faixas:
+        raise TabelaSimplesInvalida(f"Nenhuma faixa cadastrada para o Anexo {anexo_num} do Simples.")
+
+    anterior = None
+    for de, ate, _, _ in faixas:
+        if ate < de:
+            raise TabelaSimplesInvalida(
+                f"Anexo {anexo_num}: faixa {de:.2f} a {ate:.2f} com limite inferior maior que o superior."
+            )
+        if anterior is None:
+            if de > _CENTAVO:
+                raise TabelaSimplesInvalida(
+                    f"Anexo {anexo_num}: a primeira faixa começa em {de:.2f}; deveria começar em 0,00."
+                )
+        elif de <= anterior:
+            raise TabelaSimplesInvalida(
+                f"Anexo {anexo_num}: faixa iniciando em {de:.2f} sobrepõe a anterior (até {anterior:.2f})."
+            )
+        elif de - anterior > _CENTAVO:
+            raise TabelaSimplesInvalida(
+                f"Anexo {anexo_num}: lacuna entre {anterior:.2f} e {de:.2f} nas faixas do Simples."
+            )
+        anterior = ate
+
+    return TabelaSimples(
+        anexo_num=anexo_num,
+        inicios=tuple(de for de, _, _, _ in faixas),
+        limites=tuple(ate for _, ate, _, _ in faixas),
+        aliquotas=tuple(_q(aliq) / 100 for _, _, aliq, _ in faixas),
+        deducoes=tuple(_q(ded) for _, _, _, ded in faixas),
+    )
+
+
+# --------------------------
+# CACHE (por processo, descartado quando a versão das tabelas muda)
+# --------------------------
+_tabelas: Dict[int, TabelaSimples] = {}
+_versao_local: Optional[str] = None
+
+
+def sincronizar(versao: str) -> None:
+    """
+    Descarta as tabelas compiladas se a versão informada (lida do banco uma vez
+    por cálculo, ver TabelasVigentes) difere da usada para compilá-las.
+    """
+    global _versao_local
+    if versao != _versao_local:
+        invalidar_cache()
+        _versao_local = versao
+
+
+def tabela_simples(anexo_num: int) -> TabelaSimples:
+    tabela = _tabelas.get(anexo_num)
+    if tabela is None:
+        tabela = _tabelas[anexo_num] = compilar_tabela(anexo_num)
+    return tabela
+
+
+@lru_cache(maxsize=_TAMANHO_CACHE)
+def _aliquota_efetiva_memo(anexo_num: int, rbt12: Decimal) -> Decimal:
+    return tabela_simples(anexo_num).aliquota_efetiva(rbt12)
+
+
+def aliquota_efetiva(anexo_num: int, rbt12: Decimal) -> Decimal:
+    """Alíquota efetiva do Simples (fração) para o anexo e RBT12, memorizada por (anexo, RBT12)."""
+    return _aliquota_efetiva_memo(int(anexo_num), rbt12)
+
+
+def invalidar_cache() -> None:
+    """Descarta as tabelas compiladas deste processo."""
+    global _versao_local
+    _tabelas.clear()
+    _aliquota_efetiva_memo.cache_clear()
+    _versao_local = None
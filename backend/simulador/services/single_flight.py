@@ -0,0 +1,177 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from simulador.models import ExecucaoCompartilhada
+
+# Cada espera é uma consulta ao banco
+_INTERVALO_ESPERA = 0.2
+
+
+class _Chamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor: Any = None
+        self.erro: BaseException = None
+
+
+class _Contadores:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores: Dict[str, int] = {
+            "chamadas": 0,
+            "executadas": 0,
+            "deduplicadas_local": 0,
+            "deduplicadas_distribuidas": 0,
+            "timeouts_distribuidos": 0,
+        }
+
+    def incrementar(self, nome: str) -> None:
+        with self._lock:
+            self.valores[nome] += 1
+
+    def copia(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.valores)
+
+
+contadores = _Contadores()
+
+
+class SingleFlight:
+    """
+    Coalescência em processo: chamadas concorrentes com a mesma chave esperam a
+    primeira em andamento e recebem o mesmo resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento: Dict[str, _Chamada] = {}
+
+    def executar(self, chave: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _Chamada()
+
+        if not lider:
+            contadores.incrementar("deduplicadas_local")
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.valor
+
+        try:
+            chamada.valor = func()
+            return chamada.valor
+        except BaseException as exc:
+            chamada.erro = exc
+            raise
+        finally:
+            with self._lock:
+                self._em_andamento.pop(chave, None)
+            chamada.evento.set()
+
+
+def executar_distribuido(chave: str, func: Callable[[], Any], *, timeout: float = 120, ttl_resultado: float = 30) -> Any:
+    """
+    Coalescência entre workers: o lease fica no banco (ExecucaoCompartilhada) e o
+    resultado, em JSON, no cache, numa chave do dono do lease. Os demais aguardam
+    o lease ser liberado e leem o resultado do cache; se ele não estiver lá (cache
+    por processo, resultado não serializável, erro do dono) ou o tempo esgotar, a
+    chamada é executada localmente. Deve ser chamada fora de transação, senão os
+    outros workers não enxergam o lease.
+    """
+    chave = hashlib.sha1(chave.encode()).hexdigest()
+    token = uuid.uuid4().hex
+    if _adquirir(chave, token, timeout):
+        return _executar_como_dono(chave, token, func, ttl_resultado)
+    return _aguardar(chave, func, timeout)
+
+
+def _chave_resultado(chave: str, dono: str) -> str:
+    return f"single_flight:resultado:{chave}:{dono}"
+
+
+def _adquirir(chave: str, token: str, timeout: float) -> bool:
+    agora = timezone.now()
+    expira_em = agora + timedelta(seconds=timeout)
+    try:
+        with transaction.atomic():
+            ExecucaoCompartilhada.objects.create(chave=chave, dono=token, expira_em=expira_em)
+        return True
+    except IntegrityError:
+        pass
+    # Linha existente: assume só se o lease expirou (dono terminou ou sumiu)
+    return bool(
+        ExecucaoCompartilhada.objects
+        .filter(chave=chave, expira_em__lte=agora)
+        .update(dono=token, expira_em=expira_em)
+    )
+
+
+def _executar_como_dono(chave: str, token: str, func: Callable[[], Any], ttl_resultado: float) -> Any:
+    try:
+        valor = _executar_e_contar(func)
+        _publicar(chave, token, valor, ttl_resultado)
+        return valor
+    finally:
+        _liberar(chave, token)
+
+
+def _publicar(chave: str, token: str, valor: Any, ttl_resultado: float) -> None:
+    try:
+        texto = json.dumps(valor)
+    except (TypeError, ValueError):  # não serializável: quem espera executa por conta própria
+        return
+    cache.set(_chave_resultado(chave, token), texto, ttl_resultado)
+
+
+def _liberar(chave: str, token: str) -> None:
+    agora = timezone.now()
+    ExecucaoCompartilhada.objects.filter(chave=chave, dono=token).update(expira_em=agora)
+    ExecucaoCompartilhada.objects.filter(expira_em__lt=agora).exclude(chave=chave).delete()
+
+
+def _aguardar(chave: str, func: Callable[[], Any], timeout: float) -> Any:
+    limite = time.monotonic() + timeout
+    dono = None
+    while time.monotonic() < limite:
+        linha = ExecucaoCompartilhada.objects.filter(chave=chave).values_list("dono", "expira_em").first()
+        if linha is not None and dono is None:
+            dono = linha[0]
+        # O resultado fica na chave do dono aguardado: um novo dono não o apaga
+        texto = cache.get(_chave_resultado(chave, dono)) if dono else None
+        if texto is not None:
+            contadores.incrementar("deduplicadas_distribuidas")
+            return json.loads(texto)
+        if linha is None or linha[0] != dono or linha[1] <= timezone.now():
+            # lease liberado sem resultado compartilhado
+            break
+        time.sleep(_INTERVALO_ESPERA)
+    else:
+        contadores.incrementar("timeouts_distribuidos")
+    return _executar_e_contar(func)
+
+
+def _executar_e_contar(func: Callable[[], Any]) -> Any:
+    contadores.incrementar("executadas")
+    return func()
+
+
+_local = SingleFlight()
+
+
+def executar_compartilhado(chave: str, func: Callable[[], Any], *, timeout: float = 120) -> Any:
+    """Single-flight em dois níveis: threads do processo e, depois, workers via banco."""
+    contadores.incrementar("chamadas")
+    return _local.executar(chave, lambda: executar_distribuido(chave, func, timeout=timeout))
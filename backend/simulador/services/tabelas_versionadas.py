@@ -0,0 +1,217 @@
+import hashlib
+import json
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from simulador.models import (
+    AliquotaFederal, AliquotaFixa, AnexoSimples, BasePresumido, CnaeImpedimento, FaixaSimples,
+    VersaoTabelas,
+)
+from simulador.services import simples_tabela, versoes
+from simulador.services.simples_tabela import TabelaSimples, TabelaSimplesInvalida, compilar_faixas
+
+D = Decimal
+
+
+def _q(v) -> Decimal:
+    return D(str(v)).quantize(D("0.01"), rounding=ROUND_HALF_UP)
+
+
+# --------------------------
+# PUBLICAÇÃO
+# --------------------------
+def gerar_snapshot() -> Dict[str, Any]:
+    """Copia as tabelas auxiliares atuais para o formato gravado em VersaoTabelas."""
+    return {
+        "faixas_simples": [
+            {
+                "anexo": numero,
+                "receita_de": str(de),
+                "receita_ate": str(ate),
+                "aliquota": str(aliq),
+                "deducao": str(ded),
+            }
+            for numero, de, ate, aliq, ded in FaixaSimples.objects.order_by("anexo__numero", "receita_de")
+            .values_list("anexo__numero", "receita_de", "receita_ate", "aliquota", "deducao")
+        ],
+        "aliquotas_fixas": [
+            {"imposto": imposto, "aliquota": str(aliq)}
+            for imposto, aliq in AliquotaFixa.objects.order_by("id").values_list("imposto", "aliquota")
+        ],
+        "aliquotas_federais": [
+            {"imposto": imposto, "base_calculo": base, "aliquota": str(aliq)}
+            for imposto, base, aliq in AliquotaFederal.objects.order_by("id")
+            .values_list("imposto", "base_calculo", "aliquota")
+        ],
+        "base_presumido": [
+            {"atividade": atividade, "fator_irpj": str(irpj), "fator_csll": str(csll)}
+            for atividade, irpj, csll in BasePresumido.objects.order_by("id")
+            .values_list("atividade", "fator_irpj", "fator_csll")
+        ],
+        "cnae_impedimentos": sorted(CnaeImpedimento.objects.values_list("cnae", flat=True)),
+    }
+
+
+def publicar_versao(vigencia_inicio: date, descricao: str = "") -> VersaoTabelas:
+    """Valida e grava uma nova versão imutável com as tabelas atuais."""
+    if VersaoTabelas.objects.filter(vigencia_inicio=vigencia_inicio).exists():
+        raise ValueError(f"Já existe uma versão com vigência em {vigencia_inicio:%d/%m/%Y}.")
+    snapshot = gerar_snapshot()
+    TabelasSnapshot(None, snapshot)  # lacunas/sobreposições nas faixas levantam TabelaSimplesInvalida
+    return VersaoTabelas.objects.create(vigencia_inicio=vigencia_inicio, descricao=descricao, snapshot=snapshot)
+
+
+# --------------------------
+# TABELAS USADAS PELA CALCULADORA
+# --------------------------
+# Tabelas que compõem as tabelas atuais; as versões (contadores no banco) são
+# compartilhadas entre os workers, então uma alteração em qualquer processo muda
+# a impressão digital em todos.
+MODELOS_VIGENTES = (FaixaSimples, AnexoSimples, AliquotaFixa, AliquotaFederal, BasePresumido, CnaeImpedimento)
+versoes.registrar(*MODELOS_VIGENTES)
+
+_impressao_vigentes: Optional[Tuple[str, str]] = None
+
+
+class TabelasVigentes:
+    """
+    Tabelas auxiliares atuais (sem versão publicada para a competência). As
+    versões são lidas do banco uma vez, na construção (uma instância por cálculo).
+    """
+
+    versao_id: Optional[int] = None
+
+    def __init__(self):
+        self._assinatura = versoes.assinatura(*MODELOS_VIGENTES)
+        self._impressao: Optional[str] = None
+        simples_tabela.sincronizar(self._assinatura)
+
+    def impressao_digital(self) -> str:
+        """Hash do conteúdo atual das tabelas (recalculado quando a versão de alguma muda)."""
+        global _impressao_vigentes
+        if self._impressao is None:
+            atual = _impressao_vigentes
+            if atual is None or atual[0] != self._assinatura:
+                conteudo = json.dumps(gerar_snapshot(), sort_keys=True)
+                atual = _impressao_vigentes = (
+                    self._assinatura, "vigentes:" + hashlib.sha256(conteudo.encode()).hexdigest()
+                )
+            self._impressao = atual[1]
+        return self._impressao
+
+    def cnae_impedido(self, cnae: str) -> bool:
+        return CnaeImpedimento.objects.filter(cnae=cnae).exists()
+
+    def aliquota_efetiva_simples(self, anexo_num: int, rbt12: Decimal) -> Decimal:
+        return simples_tabela.aliquota_efetiva(anexo_num, rbt12)
+
+    def aliquota_fixa(self, imposto: str) -> Optional[Decimal]:
+        try:
+            return _q(AliquotaFixa.objects.get(imposto=imposto).aliquota)
+        except AliquotaFixa.DoesNotExist:
+            return None
+
+    def aliquota_federal(self, imposto: str, base: str) -> Optional[Decimal]:
+        try:
+            return _q(AliquotaFederal.objects.get(imposto=imposto, base_calculo__iexact=base).aliquota)
+        except AliquotaFederal.DoesNotExist:
+            return None
+
+    def base_presumido(self, atividade: str) -> Optional[Dict[str, Decimal]]:
+        row = BasePresumido.objects.filter(atividade__icontains=atividade).first()
+        if row is None:
+            return None
+        return {"fator_irpj": _q(row.fator_irpj), "fator_csll": _q(row.fator_csll)}
+
+
+class TabelasSnapshot:
+    """Versão publicada já compilada; imutável, portanto cacheável indefinidamente."""
+
+    def __init__(self, versao_id: Optional[int], snapshot: Dict[str, Any]):
+        self.versao_id = versao_id
+        self.cnaes_impedidos = frozenset(snapshot.get("cnae_impedimentos", []))
+
+        self.aliquotas_fixas: Dict[str, Decimal] = {}
+        for item in snapshot.get("aliquotas_fixas", []):
+            self.aliquotas_fixas.setdefault(item["imposto"], _q(item["aliquota"]))
+
+        self.aliquotas_federais: Dict[Tuple[str, str], Decimal] = {}
+        for item in snapshot.get("aliquotas_federais", []):
+            chave = (item["imposto"], item["base_calculo"].lower())
+            self.aliquotas_federais.setdefault(chave, _q(item["aliquota"]))
+
+        self.bases_presumido = tuple(
+            (item["atividade"].lower(), {"fator_irpj": _q(item["fator_irpj"]), "fator_csll": _q(item["fator_csll"])})
+            for item in snapshot.get("base_presumido", [])
+        )
+
+        faixas_por_anexo: Dict[int, list] = {}
+        for item in snapshot.get("faixas_simples", []):
+            faixas_por_anexo.setdefault(int(item["anexo"]), []).append(
+                (item["receita_de"], item["receita_ate"], item["aliquota"], item["deducao"])
+            )
+        self.tabelas_simples: Dict[int, TabelaSimples] = {
+            anexo: compilar_faixas(anexo, faixas) for anexo, faixas in faixas_por_anexo.items()
+        }
+
+    def impressao_digital(self) -> str:
+        return f"versao:{self.versao_id}"
+
+    def cnae_impedido(self, cnae: str) -> bool:
+        return cnae in self.cnaes_impedidos
+
+    def aliquota_efetiva_simples(self, anexo_num: int, rbt12: Decimal) -> Decimal:
+        return _aliquota_efetiva_versao(self.versao_id, int(anexo_num), rbt12)
+
+    def aliquota_fixa(self, imposto: str) -> Optional[Decimal]:
+        return self.aliquotas_fixas.get(imposto)
+
+    def aliquota_federal(self, imposto: str, base: str) -> Optional[Decimal]:
+        return self.aliquotas_federais.get((imposto, base.lower()))
+
+    def base_presumido(self, atividade: str) -> Optional[Dict[str, Decimal]]:
+        atividade = atividade.lower()
+        for nome, fatores in self.bases_presumido:
+            if atividade in nome:
+                return fatores
+        return None
+
+
+@lru_cache(maxsize=64)
+def snapshot_por_id(versao_id: int) -> TabelasSnapshot:
+    return TabelasSnapshot(versao_id, VersaoTabelas.objects.values_list("snapshot", flat=True).get(pk=versao_id))
+
+
+@lru_cache(maxsize=simples_tabela._TAMANHO_CACHE)
+def _aliquota_efetiva_versao(versao_id: int, anexo_num: int, rbt12: Decimal) -> Decimal:
+    tabela = snapshot_por_id(versao_id).tabelas_simples.get(anexo_num)
+    if tabela is None:
+        raise TabelaSimplesInvalida(
+            f"Nenhuma faixa do Anexo {anexo_num} do Simples na versão {versao_id} das tabelas."
+        )
+    return tabela.aliquota_efetiva(rbt12)
+
+
+def tabelas_para(competencia: date):
+    """Tabelas aplicáveis à competência: a versão publicada vigente ou, sem versão, as atuais."""
+    versao_id = (
+        VersaoTabelas.objects
+        .filter(vigencia_inicio__lte=competencia)
+        .order_by("-vigencia_inicio")
+        .values_list("id", flat=True)
+        .first()
+    )
+    if versao_id is None:
+        return TabelasVigentes()
+    return snapshot_por_id(versao_id)
+
+
+@receiver(post_delete, sender=VersaoTabelas)
+def _versao_removida(sender, **kwargs):
+    snapshot_por_id.cache_clear()
+    _aliquota_efetiva_versao.cache_clear()
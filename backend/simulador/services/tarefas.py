@@ -0,0 +1,93 @@
+"""
+Tarefas executáveis pela fila de jobs (services/jobs.py).
+"""
+from typing import Any, Dict
+
+from simulador.models import Simulacao
+from simulador.services.calculadora import CalculadoraTributaria
+from simulador.services.espelho_sci import sincronizar_empresas_sci
+from simulador.services.firebird_balancete import (
+    BalanceteError, chave_balancete, obter_balancete_compartilhado,
+)
+from simulador.services.jobs import ContextoJob, JobFalhaDefinitiva, tarefa
+
+
+# --------------------------
+# BALANCETE
+# --------------------------
+def _validar_balancete(params: Dict[str, Any]) -> Dict[str, Any]:
+    obrigatorios = ("empresa", "data_inicio", "data_fim", "competencia_ref")
+    faltando = [nome for nome in obrigatorios if not params.get(nome)]
+    if faltando:
+        raise ValueError(f"Parâmetros obrigatórios ausentes: {', '.join(faltando)}")
+    try:
+        params["empresa"] = int(params["empresa"])
+    except (TypeError, ValueError):
+        raise ValueError("O parâmetro 'empresa' deve ser numérico.")
+    try:
+        chave_balancete(**params)
+    except BalanceteError as exc:
+        raise ValueError(str(exc))
+    return params
+
+
+@tarefa("balancete", validar=_validar_balancete)
+def importar_balancete(ctx: ContextoJob, params: Dict[str, Any]):
+    ctx.progresso(10, "Consultando o balancete no SCI")
+    try:
+        return obter_balancete_compartilhado(**params)
+    except BalanceteError as exc:
+        raise JobFalhaDefinitiva(str(exc)) from exc
+
+
+@tarefa("sincronizar_empresas_sci")
+def sincronizar_espelho_sci(ctx: ContextoJob, params: Dict[str, Any]):
+    ctx.progresso(10, "Lendo o cadastro de empresas do SCI")
+    try:
+        return sincronizar_empresas_sci(completo=bool(params.get("completo", False)))
+    except BalanceteError as exc:
+        raise JobFalhaDefinitiva(str(exc)) from exc
+
+
+# --------------------------
+# PROCESSAMENTO
+# --------------------------
+def _validar_processar(params: Dict[str, Any]) -> Dict[str, Any]:
+    ids = params.get("simulacao_ids")
+    if ids is None and params.get("simulacao_id") is not None:
+        ids = [params["simulacao_id"]]
+    try:
+        ids = [int(i) for i in ids or []]
+    except (TypeError, ValueError):
+        raise ValueError("Informe 'simulacao_id' ou 'simulacao_ids' numéricos.")
+    if not ids:
+        raise ValueError("Informe 'simulacao_id' ou 'simulacao_ids'.")
+    existentes = set(Simulacao.objects.filter(pk__in=ids).values_list("pk", flat=True))
+    faltando = [i for i in ids if i not in existentes]
+    if faltando:
+        raise ValueError(f"Simulações não encontradas: {', '.join(map(str, faltando))}")
+    return {
+        "simulacao_ids": ids,
+        "meses": max(1, int(params.get("meses", 1))),
+        "force": bool(params.get("force", False)),
+    }
+
+
+@tarefa("processar", validar=_validar_processar)
+def processar_simulacoes(ctx: ContextoJob, params: Dict[str, Any]):
+    ids = params["simulacao_ids"]
+    resultados, erros = {}, {}
+    simulacoes = Simulacao.objects.filter(pk__in=ids).select_related("empresa").in_bulk()
+    for posicao, sim_id in enumerate(ids, start=1):
+        ctx.verificar_cancelamento()
+        sim = simulacoes.get(sim_id)
+        if sim is None:
+            erros[str(sim_id)] = "Simulação não encontrada."
+        else:
+            try:
+                calc = CalculadoraTributaria(sim, meses_no_periodo=params["meses"])
+                resultados[str(sim_id)] = calc.processar(force=params.get("force", False))
+            except ValueError as exc:
+                erros[str(sim_id)] = str(exc)
+        ctx.progresso(posicao * 100 // len(ids), f"{posicao} de {len(ids)} simulações processadas")
+    return {"resultados": resultados, "erros": erros}
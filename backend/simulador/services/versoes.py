@@ -0,0 +1,128 @@
+"""
+Versões por modelo para validação condicional (ETag) e caches derivados.
+Cada modelo registrado tem um contador no banco (VersaoModelo), incrementado
+após gravações/remoções (signals), uma vez por transação, no commit. Como o contador
+é compartilhado, todos os workers montam o mesmo ETag e invalidam juntos os caches
+derivados. O instante da última alteração é usado como Last-Modified.
+"""
+import hashlib
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from simulador.models import VersaoModelo
+
+_registrados = set()
+
+
+def _rotulo(modelo) -> str:
+    return modelo if isinstance(modelo, str) else modelo._meta.label_lower
+
+
+def _estado(modelos: Iterable) -> Dict[str, Tuple[int, Optional[datetime]]]:
+    """rótulo -> (versão, alterado_em) dos modelos, em uma consulta; sem linha = (0, None)."""
+    rotulos = [_rotulo(m) for m in modelos]
+    estado = dict.fromkeys(rotulos, (0, None))
+    if rotulos:
+        for rotulo, numero, alterado_em in VersaoModelo.objects.filter(rotulo__in=rotulos).values_list(
+            "rotulo", "versao", "alterado_em"
+        ):
+            estado[rotulo] = (numero, alterado_em)
+    return estado
+
+
+def _token(numero: int, alterado_em: Optional[datetime]) -> str:
+    # O instante entra no token: um contador recriado do zero não repete um ETag antigo
+    return f"{int(alterado_em.timestamp() * 1000) if alterado_em else 0}-{numero}"
+
+
+def versao(modelo) -> str:
+    return _token(*_estado((modelo,))[_rotulo(modelo)])
+
+
+def assinatura(*modelos) -> str:
+    """Token combinado das versões dos modelos (muda quando qualquer um é alterado)."""
+    estado = _estado(modelos)
+    return "|".join(f"{rotulo}={_token(*estado[rotulo])}" for rotulo in sorted(estado))
+
+
+def ultima_alteracao(*modelos) -> Optional[datetime]:
+    """Instante da alteração mais recente entre os modelos."""
+    instantes = [alterado_em for _, alterado_em in _estado(modelos).values() if alterado_em is not None]
+    return max(instantes) if instantes else None
+
+
+def validadores(modelos: Iterable, *partes) -> Tuple[str, Optional[datetime]]:
+    """ETag e Last-Modified dos modelos com uma única leitura dos contadores."""
+    modelos = list(modelos)
+    estado = _estado(modelos)
+    conteudo = "|".join([_token(*estado[_rotulo(m)]) for m in modelos] + [str(p) for p in partes])
+    instantes = [alterado_em for _, alterado_em in estado.values() if alterado_em is not None]
+    return '"' + hashlib.sha1(conteudo.encode()).hexdigest() + '"', (max(instantes) if instantes else None)
+
+
+def etag(modelos: Iterable, *partes) -> str:
+    return validadores(modelos, *partes)[0]
+
+
+def tocar(modelo) -> None:
+    """
+    Marca o modelo como alterado (usar também após bulk_create/update, que não
+    disparam signals). Dentro de uma transação, o incremento é feito uma única vez
+    por modelo e bloco atomic, no commit: edições em lote não disputam a linha do
+    contador a cada gravação, e um rollback não muda a versão.
+    """
+    conexao = transaction.get_connection()
+    if not conexao.in_atomic_block:
+        _incrementar(_rotulo(modelo))
+        return
+    # Reaproveita o callback do mesmo bloco; o Django descarta os de savepoints desfeitos.
+    # None marca um atomic(savepoint=False), que só é desfeito junto com o bloco externo.
+    bloco = set(conexao.savepoint_ids) - {None}
+    for savepoints, func, _ in reversed(conexao.run_on_commit):
+        if isinstance(func, _Pendentes) and savepoints - {None} == bloco:
+            pendentes = func
+            break
+    else:
+        pendentes = _Pendentes()
+        transaction.on_commit(pendentes)
+    pendentes.rotulos.add(_rotulo(modelo))
+
+
+class _Pendentes:
+    """Rótulos alterados na transação corrente, incrementados no commit."""
+
+    def __init__(self):
+        self.rotulos = set()
+
+    def __call__(self):
+        for rotulo in sorted(self.rotulos):
+            _incrementar(rotulo)
+
+
+def _incrementar(rotulo: str) -> None:
+    agora = timezone.now()
+    if VersaoModelo.objects.filter(rotulo=rotulo).update(versao=F("versao") + 1, alterado_em=agora):
+        return
+    try:
+        with transaction.atomic():
+            VersaoModelo.objects.create(rotulo=rotulo, versao=1, alterado_em=agora)
+    except IntegrityError:  # outro worker criou a linha no meio-tempo
+        VersaoModelo.objects.filter(rotulo=rotulo).update(versao=F("versao") + 1, alterado_em=agora)
+
+
+def _alterado(sender, **kwargs):
+    tocar(sender)
+
+
+def registrar(*modelos) -> None:
+    for modelo in modelos:
+        if modelo in _registrados:
+            continue
+        post_save.connect(_alterado, sender=modelo, weak=False)
+        post_delete.connect(_alterado, sender=modelo, weak=False)
+        _registrados.add(modelo)
@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import contextlib
+import hashlib
+import io
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from benchmarks import fake_fdb
+from simulador.models import (
+    AliquotaFederal, AliquotaFixa, AnexoSimples, CnaeAnexo, CnaeImpedimento, Empresa, EmpresaSCI, ExecucaoCompartilhada, FaixaSimples,
+    Job, Resultado, ResultadoCalculoCache, ResumoSimulacao, Simulacao, SimulacaoAnexoMercadoria, SimulacaoAnexoServico,
+    VersaoModelo, VersaoTabelas,
+)
+from simulador.serializers import SimulacaoSerializer
+from simulador.services import (
+    balancete_jobs, cache_resultados, firebird_balancete, importacao_simulacoes, jobs, single_flight, tarefas, versoes,
+)
+from simulador.services.analise_carteira import analisar_carteira
+from simulador.services.arvore_contas import ArvoreContas
+from simulador.services.busca_empresas import buscar_empresas, reindexar_busca
+from simulador.services.calculadora import CalculadoraTributaria
+from simulador.services.cobertura_depara import cobertura_depara, saldos_do_balancete
+from simulador.services.consolidacao import (
+    ConsolidacaoSQLIndisponivel, consolidar_balancete, gerar_sql_consolidacao, parametros_da_linha,
+)
+from simulador.services.depara_regras import DeParaInvalido, PlanoDePara
+from simulador.services.depara_storage import list_entries
+from simulador.services.espelho_sci import gravar_linhas, localizar_empresa
+from simulador.services.firebird_balancete import (
+    DECIMAIS_MODOS, BalanceteError, _compilar_conversor, _rows_to_dicts, _rows_to_tuples, info_da_empresa,
+)
+from simulador.services.projecao import ProjecaoTributaria
+from simulador.services.simples_tabela import TabelaSimplesInvalida, compilar_faixas
+from simulador.services.tabelas_versionadas import TabelasVigentes, publicar_versao
+from simulador.views import SimulacaoViewSet
+
+D = Decimal
+
+COLUNAS_BALANCETE = ("bdcodtpla", "bdctalon", "bdnomcta", "bdtipcta", "bdsaldo_anterior", "bdsaldo_atual")
+
+
+def _linhas_balancete():
+    """Plano sintético com contas sintéticas (BDTIPCTA = 0) e analíticas, saldos em centavos."""
+    linhas = []
+    codigo = 0
+    for grupo in ("01", "03", "04"):
+        for n2 in range(1, 4):
+            for n3 in range(1, 6):
+                for conta, analitica in ((f"{grupo}.{n2}.{n3}", False), (f"{grupo}.{n2}.{n3}.01", True)):
+                    codigo += 1
+                    linhas.append({
+                        "bdcodtpla": codigo,
+                        "bdctalon": conta,
+                        "bdnomcta": f"CONTA {conta}",
+                        "bdtipcta": 1 if analitica else 0,
+                        "bdsaldo_anterior": D(codigo * 7 % 500) / 100,
+                        "bdsaldo_atual": D(codigo * 1379 % 100003) / 100 * (1 if codigo % 4 else -1),
+                    })
+    linhas.append({
+        "bdcodtpla": 999, "bdctalon": "03.9", "bdnomcta": "SEM SALDO", "bdtipcta": 1,
+        "bdsaldo_anterior": None, "bdsaldo_atual": None,
+    })
+    return linhas
+
+
+ENTRADAS = [
+    {"parametro": "receita_total", "contas": ["3", "17", "999"], "matchField": "bdcodtpla|bdcodcta"},
+    {"parametro": "receita_total", "contas": ["03.2"], "matchType": "prefix", "matchField": "bdctalon"},
+    {"parametro": "custo", "contas": ["04.1", "04.3.5"], "matchType": "prefix", "matchField": "bdctalon"},
+    {"parametro": "anterior", "contas": ["01"], "matchType": "prefix", "matchField": "bdctalon",
+     "campo": "bdsaldo_anterior"},
+    {"parametro": "qtd_contas", "contas": ["03"], "matchType": "prefix", "matchField": "bdctalon", "reducer": "count"},
+    {"parametro": "maior", "contas": ["04"], "matchType": "prefix", "matchField": "bdctalon", "reducer": "max"},
+    {"parametro": "menor", "contas": ["04"], "matchType": "prefix", "matchField": "bdctalon", "reducer": "min"},
+    {"parametro": "vazio", "contas": ["05"], "matchType": "prefix", "matchField": "bdctalon", "reducer": "max"},
+    {"parametro": "aspas", "contas": ["0'3", "03_1%"], "matchType": "prefix", "matchField": "bdctalon"},
+    {"parametro": "inativo", "contas": ["3"], "ativo": False},
+]
+
+
+class ConsolidacaoSQLTests(TestCase):
+    """A consolidação em SQL (push-down no Firebird) deve bater com consolidar_balancete."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.linhas = _linhas_balancete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE BALANCETE_TESTE (BDCODTPLA INTEGER, BDCTALON VARCHAR(40), "
+                "BDNOMCTA VARCHAR(100), BDTIPCTA INTEGER, BDSALDO_ANTERIOR NUMERIC(18, 2), "
+                "BDSALDO_ATUAL NUMERIC(18, 2))"
+            )
+            cursor.executemany(
+                "INSERT INTO BALANCETE_TESTE VALUES (%s, %s, %s, %s, %s, %s)",
+                [
+                    tuple(None if linha[c] is None else str(linha[c]) if isinstance(linha[c], D) else linha[c]
+                          for c in COLUNAS_BALANCETE)
+                    for linha in cls.linhas
+                ],
+            )
+
+    def _consolidar_sql(self, entradas, **opcoes):
+        sql, parametros = gerar_sql_consolidacao("BALANCETE_TESTE", COLUNAS_BALANCETE, entradas, **opcoes)
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return parametros_da_linha(cursor.fetchone(), parametros)
+
+    def _comparar(self, entradas, **opcoes):
+        esperado = consolidar_balancete(self.linhas, entradas, **opcoes)
+        obtido = self._consolidar_sql(entradas, **opcoes)
+        self.assertEqual(set(obtido), set(esperado))
+        for parametro, valor in esperado.items():
+            self.assertEqual(obtido[parametro].quantize(D("0.01")), valor.quantize(D("0.01")), parametro)
+        return obtido
+
+    def test_mesmo_resultado_da_consolidacao_em_python(self):
+        obtido = self._comparar(ENTRADAS)
+        self.assertNotIn("inativo", obtido)
+        self.assertEqual(obtido["qtd_contas"], D(31))
+        self.assertEqual(obtido["vazio"], D(0))
+
+    def test_somente_analiticas(self):
+        self._comparar(ENTRADAS, somente_analiticas=True)
+
+    def test_depara_do_projeto(self):
+        self._comparar(list_entries())
+
+    def test_regex_fica_na_consolidacao_em_python(self):
+        with self.assertRaises(ConsolidacaoSQLIndisponivel):
+            gerar_sql_consolidacao(
+                "BALANCETE_TESTE", COLUNAS_BALANCETE, [{"parametro": "x", "contas": ["03.*"], "matchType": "regex"}]
+            )
+
+    def test_coluna_invalida_nao_entra_no_sql(self):
+        with self.assertRaises(ConsolidacaoSQLIndisponivel):
+            gerar_sql_consolidacao(
+                "BALANCETE_TESTE", COLUNAS_BALANCETE + ("x; drop",),
+                [{"parametro": "x", "contas": ["1"], "campo": "x; drop"}],
+            )
+
+
+class ArvoreContasTests(TestCase):
+    def test_totais_por_grupo_sem_dupla_contagem(self):
+        linhas = _linhas_balancete()
+        arvore = ArvoreContas(linhas)
+        analiticas_031 = sum(
+            linha["bdsaldo_atual"] for linha in linhas
+            if linha["bdtipcta"] and f"{linha['bdctalon']}.".startswith("03.1.")
+        )
+        self.assertEqual(arvore.total("03.1"), analiticas_031)
+        self.assertEqual(arvore.total("3.1"), analiticas_031)
+        self.assertEqual(arvore.soma(["03.1", "03.1.2", "03"]), arvore.total("03"))
+
+    def test_divergencia_da_conta_sintetica(self):
+        linhas = [
+            {"bdctalon": "03", "bdtipcta": 0, "bdsaldo_atual": "30.00"},
+            {"bdctalon": "03.1", "bdtipcta": 0, "bdsaldo_atual": "25.00"},
+            {"bdctalon": "03.1.01", "bdtipcta": 1, "bdsaldo_atual": "10.00"},
+            {"bdctalon": "03.1.02", "bdtipcta": 1, "bdsaldo_atual": "20.00"},
+        ]
+        arvore = ArvoreContas(linhas)
+        self.assertEqual(arvore.total("03"), D("30.00"))
+        self.assertEqual([item["codigo"] for item in arvore.divergencias()], ["03.1"])
+
+
+class PlanoDeParaTests(TestCase):
+    """O DE-PARA compilado deve devolver o mesmo que consolidar_balancete."""
+
+    ENTRADAS_REGEX = ENTRADAS + [
+        {"parametro": "regex", "contas": [r"03\.1\.\d", r"04\.(2|3)\.1\.01"], "matchType": "regex",
+         "matchField": "bdctalon"},
+        {"parametro": "regex", "contas": [r"(0)\1\.2\.5"], "matchType": "regex", "matchField": "bdctalon"},
+        {"parametro": "custo", "contas": [r"04\.3\.\d\.01"], "matchType": "regex", "matchField": "bdctalon",
+         "reducer": "count"},
+    ]
+
+    def test_mesmo_resultado_da_consolidacao_em_python(self):
+        linhas = _linhas_balancete()
+        for entradas in (self.ENTRADAS_REGEX, list_entries()):
+            esperado = consolidar_balancete(linhas, entradas)
+            self.assertEqual(PlanoDePara(entradas).avaliar(linhas), esperado)
+        self.assertNotEqual(esperado, {})
+
+    def test_conflitos(self):
+        plano = PlanoDePara(self.ENTRADAS_REGEX)
+        estaticos = {(c["codigo"], tuple(c["parametros"])) for c in plano.conflitos_estaticos()}
+        self.assertIn(("04", ("maior", "menor")), estaticos)
+        self.assertIn(("04.1", ("custo", "maior", "menor")), estaticos)
+        contas = {c["conta"]: c["parametros"] for c in plano.conflitos(_linhas_balancete())}
+        self.assertEqual(contas["03.1.2"], ["qtd_contas", "regex"])
+        self.assertNotIn("01.1.1", contas)
+
+    def test_regex_invalida(self):
+        with self.assertRaises(DeParaInvalido):
+            PlanoDePara([{"parametro": "x", "contas": ["03.(1"], "matchType": "regex"}])
+
+
+class CoberturaDeParaTests(TestCase):
+    def test_cobertura(self):
+        plano = PlanoDePara([
+            {"parametro": "receita_total", "contas": ["10", "11", "99"], "matchField": "bdcodtpla|bdcodcta"},
+            {"parametro": "receita_servicos", "contas": ["11"], "matchField": "bdcodtpla|bdcodcta"},
+            {"parametro": "custo", "contas": ["04.1", "05"], "matchType": "prefix", "matchField": "bdctalon"},
+        ])
+        contas = [
+            {"bdcodtpla": "1", "bdctalon": "03", "bdnomcta": "RECEITAS", "bdtipcta": "0"},
+            {"bdcodtpla": "10", "bdctalon": "03.1.01", "bdnomcta": "VENDAS", "bdtipcta": "1"},
+            {"bdcodtpla": "11", "bdctalon": "03.1.02", "bdnomcta": "SERVICOS", "bdtipcta": "1"},
+            {"bdcodtpla": "12", "bdctalon": "03.1.03", "bdnomcta": "OUTRAS", "bdtipcta": "1"},
+            {"bdcodtpla": "13", "bdctalon": "03.1.04", "bdnomcta": "SEM SALDO", "bdtipcta": "1"},
+            {"bdcodtpla": "20", "bdctalon": "04.1.01", "bdnomcta": "CMV", "bdtipcta": "1"},
+        ]
+        referencia = {"10": "Receita Total", "11": "Receita serviços", "12": "Receita Total", "20": ""}
+
+        resultado = cobertura_depara(plano, contas, referencia=referencia)
+        self.assertEqual([c["bdcodtpla"] for c in resultado["nao_mapeadas"]], ["12", "13"])
+        self.assertEqual(resultado["duplicadas"][0]["parametros"], ["receita_servicos", "receita_total"])
+        self.assertEqual([(o["campo"], o["codigo"]) for o in resultado["orfaos"]], [("bdcodtpla", "99"), ("bdctalon", "05")])
+        self.assertEqual(
+            [(d["bdcodtpla"], d["planilha"]) for d in resultado["divergencias_planilha"]],
+            [("12", "receita_total"), ("20", "")],
+        )
+        self.assertEqual(resultado["resumo"]["mapeadas"], 3)
+
+        saldos = saldos_do_balancete([
+            {"bdcodtpla": 12, "bdtipcta": 1, "bdsaldo_atual": "150.00"},
+            {"bdcodtpla": 13, "bdtipcta": 1, "bdsaldo_atual": "0.00"},
+        ])
+        resultado = cobertura_depara(plano, contas, saldos)
+        self.assertEqual(resultado["nao_mapeadas"], [
+            {"bdcodtpla": "12", "bdctalon": "03.1.03", "bdnomcta": "OUTRAS", "saldo": "150.00"},
+        ])
+
+
+class IndicesConsultasTests(TestCase):
+    """As consultas da calculadora devem usar índice (EXPLAIN QUERY PLAN do SQLite)."""
+
+    def _plano(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return [linha[-1] for linha in cursor.fetchall()]
+
+    def _assert_usa_indice(self, queryset, tabela):
+        if connection.vendor != "sqlite":
+            self.skipTest("Verificação do plano de consulta feita só no SQLite.")
+        passos = [passo for passo in self._plano(queryset) if tabela in passo]
+        self.assertTrue(passos, passos)
+        for passo in passos:
+            self.assertIn("USING", passo, passo)
+
+    def test_consultas_usam_indice(self):
+        receita = D("180000.00")
+        consultas = [
+            (FaixaSimples.objects.filter(anexo__numero=3), "simulador_anexosimples"),
+            (
+                FaixaSimples.objects.filter(anexo_id=1, receita_de__lte=receita, receita_ate__gte=receita),
+                "simulador_faixasimples",
+            ),
+            (AliquotaFixa.objects.filter(imposto="ISS"), "simulador_aliquotafixa"),
+            (AliquotaFederal.objects.filter(imposto="PIS", base_calculo__iexact="Receita"), "simulador_aliquotafederal"),
+            (CnaeAnexo.objects.filter(cnae="6201501"), "simulador_cnaeanexo"),
+            (Resultado.objects.filter(simulacao_id=1, regime="Simples"), "simulador_resultado"),
+            (SimulacaoAnexoMercadoria.objects.filter(simulacao_id=1), "simulador_simulacaoanexomercadoria"),
+            (SimulacaoAnexoServico.objects.filter(simulacao_id=1), "simulador_simulacaoanexoservico"),
+        ]
+        for queryset, tabela in consultas:
+            with self.subTest(tabela=tabela):
+                self._assert_usa_indice(queryset, tabela)
+
+
+class _CursorFalso:
+    """Cursor mínimo do fdb: description (nome, type_code, ...) e as linhas."""
+
+    def __init__(self, description, linhas=()):
+        self.description = description
+        self._linhas = list(linhas)
+
+    def fetchall(self):
+        return list(self._linhas)
+
+    def prep(self, sql):
+        return self
+
+
+class ConversaoLinhasFirebirdTests(TestCase):
+    DESCRICAO = (
+        ("BDCTALON", str, 40, 40, 0, 0, True),
+        ("BDSALDO_ATUAL", Decimal, 20, 8, 18, -2, True),
+        ("BDDATA", date, 10, 4, 0, 0, True),
+        ("BDAPECTA", bytes, 10, 10, 0, 0, True),
+    )
+    LINHAS = [
+        ("1.1.01", D("1234.565"), date(2024, 12, 31), "Caixa".encode()),
+        ("1.1.02", None, None, None),
+    ]
+
+    def test_decimal_exato_em_texto_e_em_centavos(self):
+        colunas, linhas = _rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS), "str")
+        self.assertEqual(colunas, ["bdctalon", "bdsaldo_atual", "bddata", "bdapecta"])
+        self.assertEqual(linhas[0], ["1.1.01", "1234.565", "2024-12-31", "Caixa"])
+
+        _, linhas = _rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS), "centavos")
+        self.assertEqual(linhas[0][1], 123457)  # meio centavo arredonda para cima
+        self.assertEqual(_rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS))[1][0][1], 1234.565)
+
+    def test_nulos_passam_direto(self):
+        for decimais in DECIMAIS_MODOS:
+            with self.subTest(decimais):
+                _, linhas = _rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS), decimais)
+                self.assertEqual(linhas[1], ["1.1.02", None, None, None])
+
+    def test_dict_e_tuplas_com_os_mesmos_valores(self):
+        dicts = _rows_to_dicts(_CursorFalso(self.DESCRICAO, self.LINHAS), "str")
+        colunas, linhas = _rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS), "str")
+        self.assertEqual(dicts, [dict(zip(colunas, linha)) for linha in linhas])
+        self.assertEqual(dicts[0]["bddata"], "2024-12-31")
+
+        converter = _compilar_conversor(self.DESCRICAO, "str", como_dict=False)
+        self.assertIsInstance(converter(self.LINHAS[0]), list)
+
+    def test_tipo_desconhecido_usa_a_conversao_generica(self):
+        descricao = (("BDVALOR", None), ("BDQUANDO", object))
+        converter = _compilar_conversor(descricao, "centavos")
+        self.assertEqual(
+            converter((D("10.005"), datetime(2024, 1, 2, 3, 4))),
+            {"bdvalor": 1001, "bdquando": "2024-01-02T03:04:00"},
+        )
+
+    def test_modo_de_decimais_invalido(self):
+        with self.assertRaisesMessage(BalanceteError, "Modo de decimais inválido"):
+            _compilar_conversor(self.DESCRICAO, "double")
+        with self.assertRaises(BalanceteError):
+            _rows_to_tuples(_CursorFalso(self.DESCRICAO, self.LINHAS), "inteiro")
+
+
+class SQLBalanceteTests(TestCase):
+    DESCRICAO = tuple(
+        (nome, Decimal if nome.startswith("BDSALDO") else str)
+        for nome in ("BDCTALON", "BDNOMCTA", "BDTIPCTA", "BDSALDO_ANTERIOR", "BDSALDO_DEB", "BDSALDO_CRE",
+                     "BDSALDO_ATUAL")
+    )
+
+    def setUp(self):
+        patcher = mock.patch.object(firebird_balancete, "_colunas_procedure", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _sql(self, descricao=DESCRICAO, **filtros):
+        return firebird_balancete._sql_balancete(_CursorFalso(descricao), **filtros)
+
+    def test_sem_filtros_nao_prepara_a_procedure(self):
+        cursor = mock.Mock()
+        sql, colunas = firebird_balancete._sql_balancete(cursor)
+        self.assertEqual((sql, colunas), (f"SELECT * FROM {firebird_balancete.PROCEDURE_BALANCETE}", None))
+        cursor.prep.assert_not_called()
+
+    def test_prefixos_com_like_escapado(self):
+        sql, _ = self._sql(prefixos=["1.1", "2_0%"])
+        self.assertIn(
+            "WHERE (B.BDCTALON LIKE '1.1%' ESCAPE '\\' OR B.BDCTALON LIKE '2\\_0\\%%' ESCAPE '\\')", sql
+        )
+
+    def test_projecao_e_filtros(self):
+        sql, colunas = self._sql(
+            colunas=["BDCTALON", "bdsaldo_atual", "bdctalon", "inexistente"], somente_analiticas=True, nao_zeradas=True,
+        )
+        self.assertEqual(colunas, ["bdctalon", "bdsaldo_atual"])
+        self.assertTrue(sql.startswith("SELECT B.BDCTALON, B.BDSALDO_ATUAL FROM VSUC_SP_RETORNA_BALANCETE("))
+        self.assertTrue(sql.endswith(
+            " B WHERE B.BDTIPCTA > 0 AND (COALESCE(B.BDSALDO_ANTERIOR, 0) <> 0 OR COALESCE(B.BDSALDO_DEB, 0) <> 0"
+            " OR COALESCE(B.BDSALDO_CRE, 0) <> 0 OR COALESCE(B.BDSALDO_ATUAL, 0) <> 0)"
+        ))
+
+    def test_filtro_sem_a_coluna_gera_erro(self):
+        sem = lambda *nomes: tuple(col for col in self.DESCRICAO if col[0] not in nomes)  # noqa: E731
+        casos = {
+            "prefixos": ({"prefixos": ["1"]}, sem("BDCTALON"), "BDCTALON"),
+            "analíticas": ({"somente_analiticas": True}, sem("BDTIPCTA"), "BDTIPCTA"),
+            "não zeradas": (
+                {"nao_zeradas": True},
+                sem("BDSALDO_ANTERIOR", "BDSALDO_DEB", "BDSALDO_CRE", "BDSALDO_ATUAL"),
+                "colunas de saldo",
+            ),
+            "colunas": ({"colunas": ["bddebito"]}, self.DESCRICAO, "Nenhuma das colunas"),
+        }
+        for caso, (filtros, descricao, mensagem) in casos.items():
+            with self.subTest(caso), mock.patch.object(firebird_balancete, "_colunas_procedure", None):
+                with self.assertRaisesMessage(BalanceteError, mensagem):
+                    self._sql(descricao, **filtros)
+
+
+class EspelhoSCITests(TestCase):
+    def test_dados_da_empresa_vem_do_espelho_sem_consultar_o_sci(self):
+        EmpresaSCI.objects.create(codigo=7, razao_social="ESPELHADA LTDA", cnpj="12345678000190", cnae="4711302")
+        conexao = fake_fdb.FakeConnection([])
+        info = info_da_empresa(conexao.cursor(), 7)
+        self.assertEqual(info["razao_social"], "ESPELHADA LTDA")
+        self.assertEqual(conexao.consultas, [])
+
+    def test_sem_espelho_consulta_o_sci_e_grava(self):
+        conexao = fake_fdb.FakeConnection([])
+        info = info_da_empresa(conexao.cursor(), 8)
+        self.assertEqual(len(conexao.consultas), 1)
+        espelho = EmpresaSCI.objects.get(codigo=8)
+        self.assertEqual((espelho.razao_social, espelho.referencia), (info["razao_social"], "2024-01-01"))
+
+        # segunda consulta já sai do espelho
+        info_da_empresa(conexao.cursor(), 8)
+        self.assertEqual(len(conexao.consultas), 1)
+
+    def test_gravar_linhas_cria_e_atualiza_em_lote(self):
+        linha = {"codigo": 9, "razao_social": "EMPRESA", "cnpj": "12.345.678/0001-90", "cnae": "", "cod_cidade": None,
+                 "municipio": "", "referencia": "2024-01-01"}
+        self.assertEqual(gravar_linhas([linha, {**linha, "codigo": 10}], tamanho_lote=1)["criadas"], 2)
+        totais = gravar_linhas([{**linha, "razao_social": "EMPRESA NOVA"}, {**linha, "codigo": 10}])
+        self.assertEqual((totais["criadas"], totais["atualizadas"]), (0, 1))
+        self.assertEqual(EmpresaSCI.objects.get(codigo=9).cnpj_digitos, "12345678000190")
+
+
+class ImportarEmpresaSCITests(TestCase):
+    URL = "/api/empresas/importar-sci/"
+
+    def setUp(self):
+        self.conexao = fake_fdb.FakeConnection([])
+
+        @contextlib.contextmanager
+        def conexao_falsa():
+            yield self.conexao
+
+        patcher = mock.patch("simulador.services.espelho_sci.firebird_connection", conexao_falsa)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cadastra_a_partir_do_espelho_sem_consultar_o_sci(self):
+        EmpresaSCI.objects.create(codigo=7, razao_social="ESPELHADA LTDA", cnpj="12.345.678/0001-90",
+                                  cnpj_digitos="12345678000190", cnae="4711302", municipio="JOINVILLE")
+        resposta = self.client.post(self.URL, {"codigo": 7})
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        self.assertTrue(resposta.json()["criada"])
+        self.assertEqual(Empresa.objects.get(codigo_sci=7).razao_social, "ESPELHADA LTDA")
+        self.assertEqual(self.conexao.consultas, [])
+
+        # Segunda chamada devolve a mesma empresa
+        resposta = self.client.post(self.URL, {"codigo": 7})
+        self.assertEqual((resposta.status_code, resposta.json()["criada"]), (200, False))
+        self.assertEqual(Empresa.objects.filter(codigo_sci=7).count(), 1)
+
+    def test_empresa_cadastrada_pelo_cnpj_recebe_o_codigo(self):
+        EmpresaSCI.objects.create(codigo=8, razao_social="ESPELHADA LTDA", cnpj="12345678000190",
+                                  cnpj_digitos="12345678000190")
+        empresa = Empresa.objects.create(razao_social="JÁ CADASTRADA", cnpj="12.345.678/0001-90")
+        espelho, encontrada = localizar_empresa(8)
+        self.assertEqual((espelho.codigo, encontrada), (8, empresa))
+        empresa.refresh_from_db()
+        self.assertEqual(empresa.codigo_sci, 8)
+
+    def test_fora_do_espelho_consulta_o_sci_e_grava(self):
+        resposta = self.client.post(self.URL, {"codigo": 9})
+        self.assertEqual(resposta.status_code, 201, resposta.content)
+        self.assertEqual(len(self.conexao.consultas), 1)
+        self.assertEqual(EmpresaSCI.objects.get(codigo=9).razao_social, "EMPRESA SINTETICA LTDA")
+        self.assertEqual(Empresa.objects.get(codigo_sci=9).cnpj_digitos, "12345678000190")
+
+        # Já espelhada: não volta ao SCI
+        self.assertEqual(localizar_empresa(9)[0].codigo, 9)
+        self.assertEqual(len(self.conexao.consultas), 1)
+
+    def test_inexistente_no_sci_devolve_404(self):
+        with mock.patch.object(fake_fdb.FakeCursor, "fetchone", return_value=None):
+            resposta = self.client.post(self.URL, {"codigo": 10})
+        self.assertEqual(resposta.status_code, 404)
+        self.assertEqual(len(self.conexao.consultas), 1)
+        self.assertFalse(EmpresaSCI.objects.filter(codigo=10).exists())
+        self.assertFalse(Empresa.objects.exists())
+
+    def test_codigo_invalido_devolve_400(self):
+        self.assertEqual(self.client.post(self.URL, {"codigo": "abc"}).status_code, 400)
+        self.assertEqual(self.conexao.consultas, [])
+
+
+class VersoesModeloTests(TestCase):
+    def test_etag_vem_do_banco_e_nao_do_cache_local(self):
+        AliquotaFixa.objects.create(imposto="ISS", aliquota=D("5.00"))
+        etag = self.client.get("/api/aliquotas-fixas/")["ETag"]
+
+        # Cache local limpo (outro worker): mesma versão, 304
+        cache.clear()
+        resposta = self.client.get("/api/aliquotas-fixas/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        # Alteração feita por outro processo só aparece no contador do banco
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            versoes.tocar(AliquotaFixa)
+        resposta = self.client.get("/api/aliquotas-fixas/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+
+    def test_gravacao_incrementa_o_contador_uma_vez_no_commit(self):
+        antes = versoes.versao(AliquotaFixa)
+        contador = dict(VersaoModelo.objects.values_list("rotulo", "versao"))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, transaction.atomic():
+            for imposto in ("ICMS", "ISS", "IPI"):
+                AliquotaFixa.objects.create(imposto=imposto, aliquota=D("5.00"))
+            AliquotaFixa.objects.filter(imposto="IPI").get().delete()
+            CnaeImpedimento.objects.create(cnae="6201500")
+            # Nada muda até o commit
+            self.assertEqual(versoes.versao(AliquotaFixa), antes)
+        self.assertEqual(len(callbacks), 1)
+        versao = VersaoModelo.objects.get(rotulo="simulador.aliquotafixa")
+        self.assertEqual(versao.versao, contador.get("simulador.aliquotafixa", 0) + 1)
+        self.assertEqual(
+            VersaoModelo.objects.get(rotulo="simulador.cnaeimpedimento").versao,
+            contador.get("simulador.cnaeimpedimento", 0) + 1,
+        )
+        self.assertNotEqual(versoes.versao(AliquotaFixa), antes)
+        self.assertEqual(versoes.ultima_alteracao(AliquotaFixa), versao.alterado_em)
+
+    def test_rollback_nao_muda_a_versao(self):
+        antes = versoes.versao(AliquotaFixa)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks, transaction.atomic():
+            AliquotaFixa.objects.create(imposto="ICMS", aliquota=D("18.00"))
+            try:
+                with transaction.atomic():
+                    AliquotaFixa.objects.create(imposto="ISS", aliquota=D("5.00"))
+                    CnaeImpedimento.objects.create(cnae="6201500")
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        # Só o callback do bloco externo sobrevive, sem o CnaeImpedimento desfeito
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(callbacks[0].rotulos, {"simulador.aliquotafixa"})
+        self.assertNotEqual(versoes.versao(AliquotaFixa), antes)
+
+        antes = versoes.versao(AliquotaFixa)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    AliquotaFixa.objects.create(imposto="IPI", aliquota=D("5.00"))
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(versoes.versao(AliquotaFixa), antes)
+
+
+def _simulacao_calculo(**campos):
+    """Empresa/simulação de comércio (Anexo I) com as tabelas mínimas para processar."""
+    anexo, _ = AnexoSimples.objects.get_or_create(numero=1, defaults={"atividade": "Comércio"})
+    if not anexo.faixas.exists():
+        FaixaSimples.objects.bulk_create([
+            FaixaSimples(anexo=anexo, receita_de=D("0"), receita_ate=D("180000"), aliquota=D("4.00"), deducao=D("0")),
+            FaixaSimples(anexo=anexo, receita_de=D("180000.01"), receita_ate=D("4800000"), aliquota=D("7.30"),
+                         deducao=D("5940")),
+        ])
+    empresa = Empresa.objects.create(
+        razao_social="COMERCIO TESTE LTDA", cnpj=f"11.222.333/{Empresa.objects.count() + 1:04d}-81",
+        cnae_principal="4711302", municipio="FLORIANOPOLIS", uf="SC",
+    )
+    valores = {
+        "receita_total": D("10000"), "receita_mercadorias": D("10000"), "receita_12_meses": D("120000"),
+        "lucro_contabil": D("5000"), "aliquota_pis": D("1.65"), "aliquota_cofins": D("7.60"),
+        "presumido_irpj_merc": D("8"), "presumido_csll_merc": D("12"), "regime_atual": "Presumido",
+        **campos,
+    }
+    simulacao = Simulacao.objects.create(empresa=empresa, **valores)
+    SimulacaoAnexoMercadoria.objects.create(simulacao=simulacao, anexo=anexo, valor=valores["receita_mercadorias"])
+    return simulacao
+
+
+class TabelasVigentesTests(TestCase):
+    def test_alteracao_em_outro_processo_muda_o_reprocessamento(self):
+        AliquotaFixa.objects.create(imposto="IRPJ", aliquota=D("15.00"))
+        simulacao = _simulacao_calculo()
+        self.assertEqual(CalculadoraTributaria(simulacao).processar()["real"]["IRPJ"], "750.00")
+
+        # Outro worker grava a tabela: nenhum signal roda aqui, só o contador do banco muda
+        AliquotaFixa.objects.filter(imposto="IRPJ").update(aliquota=D("20.00"))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            versoes.tocar(AliquotaFixa)
+        resultado = CalculadoraTributaria(Simulacao.objects.get(pk=simulacao.pk)).processar()
+        self.assertEqual(resultado["real"]["IRPJ"], "1000.00")
+        self.assertEqual(resultado["recalculados"], ["Simples", "Presumido", "Real"])
+        self.assertEqual(Resultado.objects.get(simulacao=simulacao, regime="Real", imposto="IRPJ").valor, D("1000.00"))
+
+    def test_impressao_digital_lida_uma_vez_por_calculo(self):
+        tabelas = TabelasVigentes()
+        impressao = tabelas.impressao_digital()
+        with self.assertNumQueries(0):
+            self.assertEqual(tabelas.impressao_digital(), impressao)
+
+
+class TabelaSimplesTests(TestCase):
+    FAIXAS = [
+        (D("0"), D("180000"), D("4.00"), D("0")),
+        (D("180000.01"), D("360000"), D("7.30"), D("5940")),
+        (D("360000.01"), D("720000"), D("9.50"), D("13860")),
+        (D("720000.01"), D("4800000"), D("10.70"), D("22500")),
+    ]
+
+    @staticmethod
+    def _linear(faixas, rbt12):
+        for de, ate, aliquota, deducao in faixas:
+            if de <= rbt12 <= ate:
+                base = rbt12 if rbt12 > 0 else 1
+                return (rbt12 * (aliquota / 100) - deducao) / base
+        raise AssertionError(rbt12)
+
+    def test_busca_compilada_igual_a_varredura_das_faixas(self):
+        tabela = compilar_faixas(1, self.FAIXAS)
+        valores = [D("0"), D("0.01"), D("4800000")] + [
+            limite + delta for _, limite, _, _ in self.FAIXAS[:-1] for delta in (D("-0.01"), D("0"), D("0.01"))
+        ] + [D(n) / 100 for n in range(0, 480000000, 999983)]
+        for rbt12 in valores:
+            self.assertEqual(tabela.aliquota_efetiva(rbt12), self._linear(self.FAIXAS, rbt12), rbt12)
+
+    def test_faixas_com_lacuna_sao_rejeitadas(self):
+        with self.assertRaises(TabelaSimplesInvalida):
+            compilar_faixas(1, [self.FAIXAS[0], self.FAIXAS[2]])
+
+    def test_rbt12_acima_do_limite_deixa_o_simples_inelegivel(self):
+        simulacao = _simulacao_calculo(receita_12_meses=D("5000000"))
+        resultado = CalculadoraTributaria(simulacao).processar()
+
+        self.assertEqual(resultado["simples"]["TOTAL"], "0.00")
+        self.assertIn("acima do limite", resultado["simples"]["INELEGIVEL"])
+        self.assertNotEqual(simulacao.resumo.vencedor, "Simples")
+        self.assertEqual(resultado["presumido"]["TOTAL"], "1153.00")
+
+        # Detalhamento reaproveitado mantém a marcação
+        resultado = CalculadoraTributaria(Simulacao.objects.get(pk=simulacao.pk)).processar()
+        self.assertEqual(resultado["recalculados"], [])
+        self.assertIn("INELEGIVEL", resultado["simples"])
+
+    def test_faixas_alteradas_em_outro_processo_recompilam_a_tabela(self):
+        simulacao = _simulacao_calculo()
+        self.assertEqual(CalculadoraTributaria(simulacao).processar()["simples"]["DAS"], "400.00")
+
+        # Outro worker grava as faixas: aqui só o contador do banco muda
+        FaixaSimples.objects.filter(anexo__numero=1, receita_de=D("0")).update(aliquota=D("5.00"))
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            versoes.tocar(FaixaSimples)
+        resultado = CalculadoraTributaria(Simulacao.objects.get(pk=simulacao.pk)).processar()
+        self.assertEqual(resultado["simples"]["DAS"], "500.00")
+
+    def test_versao_lida_uma_vez_por_calculo(self):
+        _simulacao_calculo()
+        tabelas = TabelasVigentes()
+        tabelas.aliquota_efetiva_simples(1, D("100000"))
+        with self.assertNumQueries(0):
+            for rbt12 in range(1000, 200000, 1000):
+                tabelas.aliquota_efetiva_simples(1, D(rbt12))
+
+
+class ReferenciasTests(TestCase):
+    def test_payload_sem_empresas_e_etag_independente_do_cadastro(self):
+        AnexoSimples.objects.create(numero=1, atividade="Comércio")
+        resposta = self.client.get("/api/referencias/")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn("empresas", resposta.json())
+        self.assertEqual(len(resposta.json()["anexos_simples"]), 1)
+
+        _simulacao_calculo()  # grava Empresa
+        resposta = self.client.get("/api/referencias/", HTTP_IF_NONE_MATCH=resposta["ETag"])
+        self.assertEqual(resposta.status_code, 304)
+
+
+class CacheResultadosTests(TestCase):
+    def setUp(self):
+        cache_resultados.limpar(banco=True)
+
+    def test_simulacao_com_mesmas_entradas_vem_da_memoria(self):
+        CalculadoraTributaria(_simulacao_calculo()).processar()
+        copia = _simulacao_calculo()
+        # A versão do ResumoSimulacao é incrementada no commit, fora da contagem
+        with self.assertNumQueries(10):
+            resultado = CalculadoraTributaria(copia).processar()
+        self.assertEqual(resultado["do_cache"], ["Simples", "Presumido", "Real"])
+        self.assertEqual(cache_resultados.metricas()["acertos_memoria"], 3)
+        self.assertEqual(Resultado.objects.filter(simulacao=copia).count(), 2 + 8 + 8)
+
+    def test_acerto_no_banco_com_uma_consulta(self):
+        original = CalculadoraTributaria(_simulacao_calculo()).processar()
+        cache_resultados.limpar()  # outro processo: memória vazia, banco preenchido
+        resultado = CalculadoraTributaria(_simulacao_calculo()).processar()
+
+        self.assertEqual(resultado["do_cache"], ["Simples", "Presumido", "Real"])
+        self.assertEqual(resultado["real"], original["real"])
+        metricas = cache_resultados.metricas()
+        self.assertEqual((metricas["acertos_banco"], metricas["falhas"]), (3, 0))
+        self.assertEqual(set(ResultadoCalculoCache.objects.values_list("acessos", flat=True)), {1})
+
+    def test_poda_do_banco_e_descarte_da_memoria(self):
+        with self.settings(RESULTADO_CACHE_BANCO=2, RESULTADO_CACHE_MEMORIA=2):
+            for n in range(3):
+                cache_resultados.guardar_varios({"Real": (f"h{n}", {"TOTAL": f"{n}.00"})})
+            ResultadoCalculoCache.objects.filter(chave="Real:h0").update(ultimo_acesso=timezone.now() - timedelta(days=1))
+            self.assertEqual(cache_resultados.podar_banco(), 1)
+
+        self.assertEqual(sorted(ResultadoCalculoCache.objects.values_list("chave", flat=True)), ["Real:h1", "Real:h2"])
+        metricas = cache_resultados.metricas()
+        self.assertEqual((metricas["descartes_memoria"], metricas["descartes_banco"]), (1, 1))
+        self.assertEqual(cache_resultados.obter_varios({"Real": "h0"}), {})
+
+    def test_regravar_a_mesma_chave_atualiza(self):
+        cache_resultados.guardar_varios({"Real": ("h", {"TOTAL": "1.00"})})
+        cache_resultados.guardar_varios({"Real": ("h", {"TOTAL": "2.00"})})
+        cache_resultados.limpar()
+        self.assertEqual(cache_resultados.obter_varios({"Real": "h"}), {"Real": {"TOTAL": "2.00"}})
+
+
+class _ExecutorFake:
+    def __init__(self):
+        self.submetidos = []
+
+    def submit(self, func, *args):
+        self.submetidos.append((func, args))
+
+
+PARAMS_BALANCETE = {
+    "empresa": 7, "data_inicio": "2024-01-01", "data_fim": "2024-12-31", "competencia_ref": "2024-12-01",
+    "decimais": "str", "formato": "dict",
+}
+
+
+class BalanceteJobsTests(TestCase):
+    def setUp(self):
+        self.executor = _ExecutorFake()
+        patcher = mock.patch.object(balancete_jobs, "_get_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _executar_no_pool(self, retorno=None, erro=None):
+        """Corpo da thread do pool (sem fechar a conexão do TestCase)."""
+        (_, (job_id,)), = self.executor.submetidos
+        with mock.patch.object(tarefas, "obter_balancete_compartilhado", return_value=retorno, side_effect=erro):
+            jobs.executar(Job.objects.get(pk=job_id))
+        return job_id
+
+    def test_estado_no_banco_e_consulta_identica_compartilhada(self):
+        job = balancete_jobs.submeter_balancete(dict(PARAMS_BALANCETE))
+        self.assertEqual(job["status"], "executando")
+        self.assertEqual(Job.objects.get(pk=job["id"]).worker, jobs.identificador_worker())
+
+        repetido = balancete_jobs.submeter_balancete(dict(PARAMS_BALANCETE))
+        self.assertEqual((repetido["id"], repetido["compartilhado"]), (job["id"], True))
+        self.assertEqual(len(self.executor.submetidos), 1)
+
+        self._executar_no_pool(retorno={"dados": [{"bdcodtpla": 1}]})
+        # Outro worker HTTP só precisa do banco para acompanhar
+        resposta = self.client.get(f"/api/balancete/jobs/{job['id']}/")
+        self.assertEqual(resposta.json()["status"], "concluido")
+        self.assertEqual(resposta.json()["resultado"], {"dados": [{"bdcodtpla": 1}]})
+
+        novo = balancete_jobs.submeter_balancete(dict(PARAMS_BALANCETE))
+        self.assertNotEqual(novo["id"], job["id"])
+
+    def test_erro_do_balancete_vira_400_sem_nova_tentativa(self):
+        job = balancete_jobs.submeter_balancete(dict(PARAMS_BALANCETE))
+        self._executar_no_pool(erro=BalanceteError("Empresa sem plano de contas."))
+        dados = balancete_jobs.obter_job(job["id"])
+        self.assertEqual(
+            (dados["status"], dados["detail"], dados["http_status"]), ("erro", "Empresa sem plano de contas.", 400)
+        )
+
+    def test_job_inexistente(self):
+        self.assertEqual(self.client.get("/api/balancete/jobs/abc/").status_code, 404)
+        job = jobs.enfileirar("processar", {"simulacao_id": _simulacao_calculo().pk})
+        self.assertIsNone(balancete_jobs.obter_job(job.pk))
+
+    def test_thread_do_pool_fecha_a_conexao(self):
+        job = balancete_jobs.submeter_balancete(dict(PARAMS_BALANCETE))
+        with mock.patch.object(balancete_jobs, "connection") as conexao, \
+                mock.patch.object(balancete_jobs, "close_old_connections") as fechar_antigas, \
+                mock.patch.object(jobs, "executar", side_effect=RuntimeError("fdb indisponível")):
+            with self.assertRaises(RuntimeError):
+                balancete_jobs._executar(job["id"])
+        fechar_antigas.assert_called_once_with()
+        conexao.close.assert_called_once_with()
+
+
+class SingleFlightDistribuidoTests(TestCase):
+    """O lease fica no banco e o resultado no cache: a outra chamada simula outro worker."""
+
+    CHAVE = "balancete:7:2024"
+    HASH = hashlib.sha1(CHAVE.encode()).hexdigest()
+
+    def setUp(self):
+        cache.clear()
+
+    def _lease(self, dono="outro-worker", segundos=60):
+        return ExecucaoCompartilhada.objects.create(
+            chave=self.HASH, dono=dono, expira_em=timezone.now() + timedelta(seconds=segundos)
+        )
+
+    def _publicar_e_liberar(self, dono, valor):
+        cache.set(f"single_flight:resultado:{self.HASH}:{dono}", json.dumps(valor), 30)
+        ExecucaoCompartilhada.objects.filter(dono=dono).update(expira_em=timezone.now())
+
+    def test_dono_publica_json_no_cache_e_libera_o_lease(self):
+        def consulta():
+            lease = ExecucaoCompartilhada.objects.get(chave=self.HASH)
+            self.assertGreater(lease.expira_em, timezone.now())
+            return {"dados": [1, 2]}
+
+        self.assertEqual(single_flight.executar_distribuido(self.CHAVE, consulta), {"dados": [1, 2]})
+        lease = ExecucaoCompartilhada.objects.get(chave=self.HASH)
+        self.assertLessEqual(lease.expira_em, timezone.now())
+        publicado = cache.get(f"single_flight:resultado:{self.HASH}:{lease.dono}")
+        self.assertEqual(json.loads(publicado), {"dados": [1, 2]})
+
+    def test_aguarda_o_resultado_de_outro_worker(self):
+        self._lease()
+        consulta = mock.Mock(return_value="local")
+        antes = single_flight.contadores.copia()["deduplicadas_distribuidas"]
+        with mock.patch.object(
+            single_flight.time, "sleep", side_effect=lambda _: self._publicar_e_liberar("outro-worker", [1, "a"])
+        ) as espera:
+            valor = single_flight.executar_distribuido(self.CHAVE, consulta)
+        self.assertEqual(valor, [1, "a"])
+        consulta.assert_not_called()
+        espera.assert_called_once()
+        self.assertEqual(single_flight.contadores.copia()["deduplicadas_distribuidas"], antes + 1)
+
+    def test_resultado_continua_legivel_depois_que_outro_dono_assume(self):
+        self._lease()
+
+        def publica_e_novo_dono_assume(_):
+            self._publicar_e_liberar("outro-worker", {"ok": True})
+            self.assertTrue(single_flight._adquirir(self.HASH, "terceiro", 60))
+
+        with mock.patch.object(single_flight.time, "sleep", side_effect=publica_e_novo_dono_assume):
+            valor = single_flight.executar_distribuido(self.CHAVE, mock.Mock(side_effect=AssertionError))
+        self.assertEqual(valor, {"ok": True})
+        self.assertEqual(ExecucaoCompartilhada.objects.get(chave=self.HASH).dono, "terceiro")
+
+    def test_lease_ativo_nao_e_assumido(self):
+        self._lease()
+        self.assertFalse(single_flight._adquirir(self.HASH, "outro", 60))
+        self._publicar_e_liberar("outro-worker", 1)
+        self.assertTrue(single_flight._adquirir(self.HASH, "outro", 60))
+
+    def test_assume_lease_expirado(self):
+        self._lease(dono="worker-morto", segundos=-1)
+        with mock.patch.object(single_flight.time, "sleep") as espera:
+            self.assertEqual(single_flight.executar_distribuido(self.CHAVE, lambda: "novo"), "novo")
+        espera.assert_not_called()
+        self.assertNotEqual(ExecucaoCompartilhada.objects.get(chave=self.HASH).dono, "worker-morto")
+
+    def test_executa_localmente_se_o_dono_libera_sem_resultado(self):
+        # Erro do dono, resultado não serializável ou cache por processo: nada no cache
+        self._lease()
+        with mock.patch.object(
+            single_flight.time, "sleep",
+            side_effect=lambda _: ExecucaoCompartilhada.objects.update(expira_em=timezone.now()),
+        ):
+            self.assertEqual(single_flight.executar_distribuido(self.CHAVE, lambda: "local"), "local")
+
+    def test_erro_do_dono_libera_o_lease(self):
+        with self.assertRaises(BalanceteError):
+            single_flight.executar_distribuido(self.CHAVE, mock.Mock(side_effect=BalanceteError("fdb fora do ar")))
+        self.assertLessEqual(ExecucaoCompartilhada.objects.get(chave=self.HASH).expira_em, timezone.now())
+
+
+class ImportacaoSimulacoesTests(TestCase):
+    def setUp(self):
+        self.empresa = _simulacao_calculo().empresa
+
+    def _importar(self, conteudo: bytes, nome="simulacoes.csv", **params):
+        arquivo = SimpleUploadedFile(nome, conteudo, content_type="text/csv")
+        consulta = "&".join(f"{k}={v}" for k, v in params.items())
+        return self.client.post(f"/api/simulacoes/importar/?{consulta}", {"arquivo": arquivo})
+
+    def test_relatorio_de_erros_por_linha(self):
+        cnpj = self.empresa.cnpj
+        csv_ = "\n".join([
+            "cnpj;receita_total;receita_mercadorias;receita_12_meses;anexos_mercadoria;regime_atual;"
+            "presumido_irpj_merc;presumido_csll_merc;aliquota_pis;aliquota_cofins",
+            f"{cnpj};10.000,00;10.000,00;120.000,00;1=10000;Presumido;8;12;1,65;7,60",
+            f"{cnpj};10000;10000;0;1=10000;Presumido;8;12;1,65;7,60",
+            "99.999.999/9999-99;10000;10000;120000;1=10000;Presumido;8;12;1,65;7,60",
+            f"{cnpj};10000;10000;120000;1:10000;Presumido;8;12;1,65;7,60",
+            ";;;;;;;;;",
+            f"{cnpj};5000;5000;60000;1=2000;Presumido;8;12;1,65;7,60",
+            f"{cnpj};5000;5000;60000;1=5000;Presumido;8;12;1,65;7,60",
+        ]).encode()
+        antes = Simulacao.objects.count()
+
+        relatorio = self._importar(csv_).json()
+
+        # linha 6 (vazia) é ignorada sem deslocar a numeração das seguintes
+        self.assertEqual((relatorio["total_linhas"], relatorio["importadas"]), (6, 2))
+        self.assertEqual([erro["linha"] for erro in relatorio["erros"]], [3, 4, 5, 7])
+        erros = {erro["linha"]: erro["erros"] for erro in relatorio["erros"]}
+        self.assertIn("receita_12_meses", erros[3])
+        self.assertIn("empresa_id", erros[4])
+        self.assertIn("Rateio inválido", erros[5]["arquivo"][0])
+        self.assertIn("anexos_mercadoria", erros[7])
+        self.assertEqual(Simulacao.objects.count(), antes + 2)
+        importada = Simulacao.objects.get(pk=relatorio["simulacoes"][0])
+        self.assertEqual(importada.receita_12_meses, D("120000.00"))
+        self.assertEqual(list(importada.anexos_mercadoria.values_list("valor", flat=True)), [D("10000.00")])
+
+    def test_arquivo_ilegivel_devolve_400(self):
+        casos = {
+            "separador": b"coluna_unica\nvalor\n",
+            "codificação": "cnpj;receita_total\n11.222.333/0001-81;ação\n".encode("latin-1"),
+            "campo acima do limite do csv": b"cnpj;receita_total\n" + b"1" * 200000 + b";1\n",
+        }
+        for caso, conteudo in casos.items():
+            with self.subTest(caso):
+                resposta = self._importar(conteudo)
+                self.assertEqual(resposta.status_code, 400, resposta.content)
+
+    @skipUnless(importacao_simulacoes.openpyxl, "openpyxl não instalado")
+    def test_planilha_xlsx_com_celulas_numericas(self):
+        planilha = importacao_simulacoes.openpyxl.Workbook()
+        aba = planilha.active
+        aba.append([
+            "cnpj", "receita_total", "receita_mercadorias", "receita_12_meses", "anexos_mercadoria",
+            "regime_atual", "presumido_irpj_merc", "presumido_csll_merc", "aliquota_pis", "aliquota_cofins",
+        ])
+        aba.append([self.empresa.cnpj, 10000, 10000.5, "120.000,00", "1=10000.5", "Presumido", 8, 12, 1.65, 7.6])
+        aba.append([None] * 10)
+        aba.append([self.empresa.cnpj, 5000, 5000, 60000, "1=2000", "Presumido", 8, 12, 1.65, 7.6])
+        conteudo = io.BytesIO()
+        planilha.save(conteudo)
+
+        relatorio = self._importar(conteudo.getvalue(), nome="simulacoes.xlsx").json()
+
+        # A linha em branco não é gravada na planilha, mas a numeração segue a da aba
+        self.assertEqual((relatorio["total_linhas"], relatorio["importadas"]), (2, 1))
+        self.assertEqual([erro["linha"] for erro in relatorio["erros"]], [4])
+        importada = Simulacao.objects.get(pk=relatorio["simulacoes"][0])
+        self.assertEqual(
+            (importada.receita_total, importada.receita_mercadorias, importada.receita_12_meses),
+            (D("10000.00"), D("10000.50"), D("120000.00")),
+        )
+        self.assertEqual((importada.aliquota_pis, importada.aliquota_cofins), (D("1.65"), D("7.60")))
+        self.assertEqual(list(importada.anexos_mercadoria.values_list("valor", flat=True)), [D("10000.50")])
+
+    def test_xlsx_invalido_devolve_400(self):
+        resposta = self._importar(b"nao sou um zip", nome="simulacoes.xlsx")
+        self.assertEqual(resposta.status_code, 400, resposta.content)
+
+    def test_meses_invalido_devolve_400(self):
+        for meses in ("abc", "0"):
+            with self.subTest(meses):
+                self.assertEqual(self._importar(b"cnpj;receita_total\n", meses=meses, processar=1).status_code, 400)
+
+
+class SincronizacaoRateiosTests(TestCase):
+    def setUp(self):
+        self.simulacao = _simulacao_calculo()
+        self.anexos = [self.simulacao.anexos_mercadoria.get().anexo] + [
+            AnexoSimples.objects.create(numero=numero, atividade=f"Anexo {numero}") for numero in range(2, 9)
+        ]
+
+    def _atualizar(self, valores):
+        """valores: [(anexo, valor)]; a receita de mercadorias acompanha a soma."""
+        total = sum((valor for _, valor in valores), D("0"))
+        serializer = SimulacaoSerializer(self.simulacao, partial=True, data={
+            "receita_total": str(total),
+            "receita_mercadorias": str(total),
+            "anexos_mercadoria": [{"anexo": anexo.pk, "valor": str(valor)} for anexo, valor in valores],
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    def _linhas(self):
+        return {
+            linha.anexo.numero: (linha.pk, linha.valor)
+            for linha in self.simulacao.anexos_mercadoria.select_related("anexo")
+        }
+
+    def test_rateio_inalterado_nao_grava(self):
+        antes = self._linhas()
+        with CaptureQueriesContext(connection) as consultas:
+            self._atualizar([(self.anexos[0], D("10000"))])
+        gravacoes = [
+            q["sql"] for q in consultas.captured_queries
+            if "simulacaoanexomercadoria" in q["sql"] and not q["sql"].lstrip().upper().startswith("SELECT")
+        ]
+        self.assertEqual(gravacoes, [])
+        self.assertEqual(self._linhas(), antes)
+
+    def test_inclusao_alteracao_e_remocao_reaproveitam_as_linhas(self):
+        pk_anexo_1 = self._linhas()[1][0]
+
+        # Inclusão: a linha existente fica
+        self._atualizar([(self.anexos[0], D("6000")), (self.anexos[1], D("4000"))])
+        linhas = self._linhas()
+        self.assertEqual(linhas[1], (pk_anexo_1, D("6000.00")))
+        self.assertEqual(linhas[2][1], D("4000.00"))
+
+        # Alteração de valor: mesmas linhas
+        self._atualizar([(self.anexos[0], D("7000")), (self.anexos[1], D("3000"))])
+        self.assertEqual(self._linhas(), {1: (pk_anexo_1, D("7000.00")), 2: (linhas[2][0], D("3000.00"))})
+
+        # Troca de anexo: a linha que sobra é reaproveitada para o novo anexo
+        self._atualizar([(self.anexos[0], D("7000")), (self.anexos[2], D("3000"))])
+        self.assertEqual(self._linhas(), {1: (pk_anexo_1, D("7000.00")), 3: (linhas[2][0], D("3000.00"))})
+
+        # Remoção
+        self._atualizar([(self.anexos[0], D("10000"))])
+        self.assertEqual(self._linhas(), {1: (pk_anexo_1, D("10000.00"))})
+
+    def test_consultas_nao_crescem_com_os_anexos(self):
+        for quantidade in (2, 8):
+            with self.subTest(quantidade=quantidade):
+                # Parte das linhas muda de valor, parte é removida e parte é incluída
+                existentes = [
+                    SimulacaoAnexoMercadoria(simulacao=self.simulacao, anexo=anexo, valor=D("1"))
+                    for anexo in self.anexos[:quantidade]
+                ]
+                SimulacaoAnexoMercadoria.objects.filter(simulacao=self.simulacao).delete()
+                SimulacaoAnexoMercadoria.objects.bulk_create(existentes)
+                existentes = list(SimulacaoAnexoMercadoria.objects.filter(simulacao=self.simulacao))
+                metade = quantidade // 2
+                itens = [{"anexo": anexo, "valor": D("2")} for anexo in self.anexos[:metade]]
+                with self.assertNumQueries(2):  # bulk_update dos valores + delete das sobras
+                    SimulacaoSerializer._sincronizar_rateios(
+                        SimulacaoAnexoMercadoria, existentes, itens, self.simulacao
+                    )
+                self.assertEqual(self.simulacao.anexos_mercadoria.count(), metade)
+
+                novos = list(SimulacaoAnexoMercadoria.objects.filter(simulacao=self.simulacao))
+                itens = [{"anexo": anexo, "valor": D("3")} for anexo in self.anexos[:quantidade]]
+                with self.assertNumQueries(2):  # bulk_update dos valores + bulk_create dos novos
+                    SimulacaoSerializer._sincronizar_rateios(SimulacaoAnexoMercadoria, novos, itens, self.simulacao)
+                self.assertEqual(
+                    sorted(self.simulacao.anexos_mercadoria.values_list("valor", flat=True)), [D("3.00")] * quantidade
+                )
+
+
+class AnaliseCarteiraTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_alteracao_de_empresa_invalida_o_cache(self):
+        simulacao = _simulacao_calculo()
+        CalculadoraTributaria(simulacao).processar()
+        self.assertEqual([d["uf"] for d in analisar_carteira()["distribuicao"]], ["SC"])
+
+        empresa = simulacao.empresa
+        empresa.uf = "PR"
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            empresa.save()
+        self.assertEqual([d["uf"] for d in analisar_carteira()["distribuicao"]], ["PR"])
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            simulacao.delete()
+        self.assertEqual(analisar_carteira()["empresas"], 0)
+
+    def test_alteracao_em_outro_worker_invalida_o_cache(self):
+        CalculadoraTributaria(_simulacao_calculo()).processar()
+        self.assertEqual(analisar_carteira(regime="Presumido")["empresas"], 1)
+
+        # Sem signals neste processo: só o contador do banco muda
+        Simulacao.objects.update(regime_atual="Real")
+        self.assertEqual(analisar_carteira(regime="Presumido")["empresas"], 1)  # ainda em cache
+        versoes._incrementar("simulador.simulacao")
+        self.assertEqual(analisar_carteira(regime="Presumido")["empresas"], 0)
+
+    def test_regime_filtrado_na_simulacao_mais_recente(self):
+        antiga = _simulacao_calculo(regime_atual="Simples")
+        CalculadoraTributaria(antiga).processar()
+        recente = _simulacao_calculo(regime_atual="Presumido")
+        recente.empresa = antiga.empresa
+        recente.save()
+        CalculadoraTributaria(recente).processar()
+
+        self.assertEqual(analisar_carteira(regime="Simples")["empresas"], 0)
+        self.assertEqual(analisar_carteira(regime="Presumido")["empresas"], 1)
+
+
+@override_settings(SIMULADOR_INSTRUMENTACAO=True)
+class InstrumentacaoTests(TestCase):
+    def test_serializacao_medida_separada_da_renderizacao(self):
+        _simulacao_calculo()
+        resposta = self.client.get("/api/simulacoes/")
+        tempos = {parte.split(";")[0].strip() for parte in resposta["Server-Timing"].split(",")}
+        self.assertTrue({"serializacao", "render"} <= tempos, tempos)
+
+    def test_metricas_restritas_a_staff(self):
+        self.assertEqual(self.client.get("/api/_metrics/").status_code, 403)
+
+        usuario = User.objects.create_user("operador", password="x")
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get("/api/_metrics/").status_code, 403)
+
+        usuario.is_staff = True
+        usuario.save()
+        resposta = self.client.get("/api/_metrics/")
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn("endpoints", resposta.json())
+
+    @override_settings(SIMULADOR_METRICAS_ABERTAS=True)
+    def test_metricas_abertas_por_configuracao(self):
+        self.assertEqual(self.client.get("/api/_metrics/").status_code, 200)
+
+    def test_sem_coleta_o_serializer_nao_muda(self):
+        view = SimulacaoViewSet(request=None, format_kwarg=None, kwargs={})
+        self.assertIs(type(view.get_serializer(Simulacao())), SimulacaoSerializer)
+
+
+def _job(tipo="teste", **campos):
+    return Job.objects.create(tipo=tipo, disponivel_em=campos.pop("disponivel_em", timezone.now()), **campos)
+
+
+class JobsTests(TestCase):
+    def setUp(self):
+        self.chamadas = []
+
+        def executar(contexto, parametros):
+            self.chamadas.append(parametros)
+            contexto.verificar_cancelamento()
+            if parametros.get("falha") == "definitiva":
+                raise jobs.JobFalhaDefinitiva("Parâmetro inválido.")
+            if parametros.get("falha"):
+                raise RuntimeError("fdb indisponível")
+            return {"ok": True}
+
+        patcher = mock.patch.dict(jobs.TAREFAS, {"teste": jobs.Tarefa(nome="teste", executar=executar)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reserva_na_ordem_e_uma_vez_so(self):
+        agora = timezone.now()
+        segundo = _job(disponivel_em=agora - timedelta(seconds=1))
+        primeiro = _job(disponivel_em=agora - timedelta(seconds=2))
+        _job(disponivel_em=agora + timedelta(minutes=1))
+
+        reservado = jobs.reservar_proximo("w1")
+        self.assertEqual((reservado.pk, reservado.status, reservado.worker), (primeiro.pk, "executando", "w1"))
+        self.assertEqual(jobs.reservar_proximo("w2").pk, segundo.pk)
+        self.assertIsNone(jobs.reservar_proximo("w3"))  # o restante ainda não está disponível
+
+    def test_nova_tentativa_com_backoff_e_erro_final(self):
+        job = jobs.enfileirar("teste", {"falha": True}, max_tentativas=3)
+        esperas = []
+        for _ in range(2):
+            antes = timezone.now()
+            job = jobs.executar(jobs.reservar_proximo("w1"))
+            self.assertEqual((job.status, job.erro, job.worker), ("pendente", "fdb indisponível", ""))
+            esperas.append(job.disponivel_em - antes)
+            Job.objects.filter(pk=job.pk).update(disponivel_em=timezone.now())
+
+        self.assertGreaterEqual(esperas[0], jobs.BACKOFF_BASE)
+        self.assertGreaterEqual(esperas[1], jobs.BACKOFF_BASE * 2)
+        self.assertLess(esperas[0], jobs.BACKOFF_BASE * 2)
+
+        job = jobs.executar(jobs.reservar_proximo("w1"))
+        self.assertEqual((job.status, job.tentativas), ("erro", 3))
+        self.assertIn("Traceback", job.erro)
+
+    def test_falha_definitiva_nao_gera_nova_tentativa(self):
+        job = jobs.enfileirar("teste", {"falha": "definitiva"})
+        job = jobs.executar(jobs.reservar_proximo("w1"))
+        self.assertEqual((job.status, job.tentativas, job.erro), ("erro", 1, "Parâmetro inválido."))
+
+    def test_cancelamento(self):
+        pendente = jobs.cancelar(jobs.enfileirar("teste"))
+        self.assertEqual(pendente.status, "cancelado")
+
+        jobs.enfileirar("teste")
+        em_execucao = jobs.reservar_proximo("w1")
+        self.assertEqual(jobs.cancelar(em_execucao).status, "executando")  # a tarefa é avisada
+        self.assertEqual(jobs.executar(em_execucao).status, "cancelado")
+        self.assertEqual(self.chamadas, [])
+
+    def test_recuperacao_de_travados_respeita_as_tentativas(self):
+        antigo = timezone.now() - timedelta(hours=2)
+        comum = dict(status="executando", worker="w-morto", iniciado_em=antigo, max_tentativas=3)
+        devolver = _job(tentativas=1, **comum)
+        esgotado = _job(tentativas=3, **comum)
+        cancelado = _job(tentativas=1, cancelamento_solicitado=True, **comum)
+        recente = _job(tentativas=1, **{**comum, "iniciado_em": timezone.now()})
+
+        self.assertEqual(jobs.recuperar_travados(timedelta(hours=1)), (1, 2))
+
+        estados = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(
+            [estados[j.pk] for j in (devolver, esgotado, cancelado, recente)],
+            ["pendente", "erro", "cancelado", "executando"],
+        )
+        self.assertEqual(balancete_jobs._como_dict(Job.objects.get(pk=esgotado.pk))["http_status"], 500)
+
+        # Travado de novo em todas as tentativas restantes: termina em erro
+        for _ in range(2):
+            job = jobs.reservar_proximo("w1")
+            self.assertEqual(job.pk, devolver.pk)
+            Job.objects.filter(pk=job.pk).update(tentativas=F("tentativas") + 1, iniciado_em=antigo)
+            jobs.recuperar_travados(timedelta(hours=1))
+        self.assertEqual(Job.objects.get(pk=devolver.pk).status, "erro")
+
+
+class ResumoSimulacaoTests(TestCase):
+    def setUp(self):
+        cache_resultados.limpar(banco=True)
+        AliquotaFixa.objects.create(imposto="IRPJ", aliquota=D("15.00"))
+        self.simulacao = _simulacao_calculo()
+
+    def test_resumo_gravado_e_servido_no_comparativo(self):
+        resultado = CalculadoraTributaria(self.simulacao).processar()
+        resumo = ResumoSimulacao.objects.get(simulacao=self.simulacao)
+
+        totais = {
+            "Simples": D(resultado["simples"]["TOTAL"]),
+            "Presumido": D(resultado["presumido"]["TOTAL"]),
+            "Real": D(resultado["real"]["TOTAL"]),
+        }
+        self.assertEqual(resumo.totais(), totais)
+        self.assertEqual(resumo.vencedor, min(totais, key=totais.get))
+        self.assertEqual(resumo.economia_potencial, max(D("0"), totais["Presumido"] - totais[resumo.vencedor]))
+        self.assertEqual(resumo.carga_simples, (totais["Simples"] / D("100")).quantize(D("0.01")))
+        self.assertEqual(set(resumo.hashes_entradas), {"Simples", "Presumido", "Real"})
+
+        comparativo = self.client.get(f"/api/simulacoes/{self.simulacao.pk}/comparativo/").json()
+        self.assertEqual(comparativo["vencedor"], resumo.vencedor)
+        self.assertEqual(comparativo["totais"], {regime: f"{total:.2f}" for regime, total in totais.items()})
+        self.assertEqual(comparativo["detalhado"]["Simples"], resultado["simples"])
+
+    def test_so_recalcula_os_regimes_com_entradas_alteradas(self):
+        CalculadoraTributaria(self.simulacao).processar()
+        hashes = ResumoSimulacao.objects.get(simulacao=self.simulacao).hashes_entradas
+        sem_alteracao = CalculadoraTributaria(Simulacao.objects.get(pk=self.simulacao.pk)).processar()
+        self.assertEqual(sem_alteracao["recalculados"], [])
+
+        # lucro_contabil só entra no Lucro Real
+        Simulacao.objects.filter(pk=self.simulacao.pk).update(lucro_contabil=D("8000"))
+        resultado = CalculadoraTributaria(Simulacao.objects.get(pk=self.simulacao.pk)).processar()
+        self.assertEqual(resultado["recalculados"], ["Real"])
+        self.assertEqual(resultado["real"]["IRPJ"], "1200.00")
+        novos = ResumoSimulacao.objects.get(simulacao=self.simulacao).hashes_entradas
+        self.assertEqual({r for r in hashes if hashes[r] != novos[r]}, {"Real"})
+        irpj = Resultado.objects.get(simulacao=self.simulacao, regime="Real", imposto="IRPJ")
+        self.assertEqual(irpj.valor, D("1200.00"))
+        self.assertEqual(Resultado.objects.filter(simulacao=self.simulacao, regime="Simples").count(), 2)
+
+        forcado = CalculadoraTributaria(Simulacao.objects.get(pk=self.simulacao.pk)).processar(force=True)
+        self.assertEqual(forcado["recalculados"], ["Simples", "Presumido", "Real"])
+        self.assertEqual(forcado["do_cache"], [])
+
+
+class VersaoTabelasTests(TestCase):
+    def setUp(self):
+        cache_resultados.limpar(banco=True)
+        AliquotaFixa.objects.create(imposto="IRPJ", aliquota=D("15.00"))
+        self.simulacao = _simulacao_calculo(competencia=date(2024, 6, 1))
+
+    def test_competencia_usa_o_snapshot_vigente(self):
+        versao = publicar_versao(date(2024, 1, 1), "Tabelas 2024")
+        # Alterações posteriores nas tabelas atuais não mudam a versão publicada
+        AliquotaFixa.objects.filter(imposto="IRPJ").update(aliquota=D("25.00"))
+        FaixaSimples.objects.filter(receita_de=0).update(aliquota=D("5.00"))
+
+        resultado = CalculadoraTributaria(self.simulacao).processar()
+        self.assertEqual(resultado["versao_tabelas"], versao.pk)
+        self.assertEqual(resultado["real"]["IRPJ"], "750.00")
+        self.assertEqual(resultado["simples"]["TOTAL"], "400.00")
+
+        anterior = _simulacao_calculo(competencia=date(2023, 12, 1))
+        resultado = CalculadoraTributaria(anterior).processar()
+        self.assertIsNone(resultado["versao_tabelas"])
+        self.assertEqual(resultado["real"]["IRPJ"], "1250.00")
+
+    def test_nova_versao_muda_o_hash_das_entradas(self):
+        publicar_versao(date(2024, 1, 1))
+        CalculadoraTributaria(self.simulacao).processar()
+
+        AliquotaFixa.objects.filter(imposto="IRPJ").update(aliquota=D("20.00"))
+        publicar_versao(date(2024, 5, 1))
+        resultado = CalculadoraTributaria(Simulacao.objects.get(pk=self.simulacao.pk)).processar()
+        self.assertEqual(resultado["recalculados"], ["Simples", "Presumido", "Real"])
+        self.assertEqual(resultado["real"]["IRPJ"], "1000.00")
+
+    def test_publicacao_valida_as_tabelas(self):
+        publicar_versao(date(2024, 1, 1))
+        with self.assertRaises(ValueError):
+            publicar_versao(date(2024, 1, 1))
+
+        FaixaSimples.objects.filter(receita_de=D("180000.01")).update(receita_de=D("200000"))
+        with self.assertRaises(TabelaSimplesInvalida):
+            publicar_versao(date(2025, 1, 1))
+        self.assertEqual(VersaoTabelas.objects.count(), 1)
+
+
+class ProjecaoTributariaTests(TestCase):
+    def setUp(self):
+        self.simulacao = _simulacao_calculo()
+
+    @staticmethod
+    def _meses(inicio: date, receitas):
+        meses, competencia = [], inicio
+        for receita in receitas:
+            meses.append({"competencia": competencia, "receita_mercadorias": D(receita)})
+            competencia = date(competencia.year + competencia.month // 12, competencia.month % 12 + 1, 1)
+        return meses
+
+    def test_rbt12_movel_mes_a_mes(self):
+        projecao = ProjecaoTributaria(self.simulacao, self._meses(date(2024, 1, 1), [20000] * 3)).calcular()
+        self.assertEqual([m["rbt12"] for m in projecao["meses"]], ["120000.00", "130000.00", "140000.00"])
+        # faixa 1 (4%) enquanto o RBT12 não passa de 180 mil
+        self.assertEqual(projecao["meses"][0]["Simples"]["DAS"], "800.00")
+
+        historico = [D("15000")] * 12
+        projecao = ProjecaoTributaria(
+            self.simulacao, self._meses(date(2024, 1, 1), [20000] * 2), historico_receitas=historico
+        ).calcular()
+        # RBT12 de 185 mil no segundo mês: faixa 2 (7,30% com dedução)
+        self.assertEqual([m["rbt12"] for m in projecao["meses"]], ["180000.00", "185000.00"])
+        self.assertEqual(projecao["meses"][1]["Simples"]["DAS"], "817.84")
+
+    def test_irpj_csll_no_fechamento_do_trimestre(self):
+        projecao = ProjecaoTributaria(self.simulacao, self._meses(date(2024, 2, 1), [20000] * 3)).calcular()
+        presumido = [m["Presumido"] for m in projecao["meses"]]
+        self.assertNotIn("IRPJ", presumido[0])
+        # março fecha o 1º trimestre (fev + mar); abril é o último mês e fecha um trimestre parcial
+        self.assertEqual((presumido[1]["IRPJ"], presumido[1]["CSLL"]), ("480.00", "432.00"))
+        self.assertEqual((presumido[2]["IRPJ"], presumido[2]["CSLL"]), ("240.00", "216.00"))
+        self.assertEqual(presumido[1]["TOTAL"], "2762.00")
+
+    def test_adicional_do_irpj_pelo_limite_do_trimestre(self):
+        meses = self._meses(date(2024, 1, 1), [300000] * 3)
+        presumido = ProjecaoTributaria(self.simulacao, meses).calcular()["meses"][2]["Presumido"]
+        # base 72 mil no trimestre: 15% + 10% sobre o que excede 60 mil
+        self.assertEqual(presumido["IRPJ"], "12000.00")
+
+    def test_simples_inelegivel_acima_do_limite(self):
+        historico = [D("400000")] * 12  # RBT12 de 4,8 milhões: ainda no limite
+        projecao = ProjecaoTributaria(
+            self.simulacao, self._meses(date(2024, 1, 1), [500000] * 2), historico_receitas=historico
+        ).calcular()
+        self.assertEqual(projecao["simples_inelegivel"], ["2024-02"])
+        self.assertNotIn("simples_inelegivel", projecao["meses"][0])
+        self.assertIn("acima do limite", projecao["meses"][1]["simples_inelegivel"])
+        self.assertEqual(projecao["meses"][1]["Simples"]["DAS"], "0.00")
+        self.assertNotEqual(projecao["vencedor"], "Simples")
+
+
+class BuscaEmpresasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.empresas = {}
+        for razao, cnpj, codigo in (
+            ("Açougue São Jorge Ltda", "12.345.678/0001-90", None),
+            ("São João Comércio de Alimentos", "98.765.432/0001-10", 4321),
+            ("Padaria Central", "43.210.000/0001-55", None),
+        ):
+            cls.empresas[razao] = Empresa.objects.create(
+                razao_social=razao, cnpj=cnpj, codigo_sci=codigo,
+                cnae_principal="4711302", municipio="FLORIANOPOLIS", uf="SC",
+            )
+
+    def _razoes(self, termo, limite=20):
+        return [item["razao_social"] for item in buscar_empresas(termo, limite)]
+
+    def test_inicio_antes_do_trecho_sem_acentos(self):
+        self.assertEqual(
+            self._razoes("sao jo"), ["São João Comércio de Alimentos", "Açougue São Jorge Ltda"]
+        )
+        self.assertEqual(self._razoes("SAO", limite=1), ["São João Comércio de Alimentos"])
+
+    def test_cnpj_e_codigo_sci(self):
+        self.assertEqual(self._razoes("12.345.678"), ["Açougue São Jorge Ltda"])
+        self.assertEqual(self._razoes("0001-10"), ["São João Comércio de Alimentos"])
+        # 4321 é o código SCI de uma empresa e o início do CNPJ de outra
+        self.assertEqual(self._razoes("4321"), ["Padaria Central", "São João Comércio de Alimentos"])
+
+    def test_reindexar_cadastros_gravados_sem_save(self):
+        Empresa.objects.filter(razao_social="Padaria Central").update(razao_social="Panificadora Estrela")
+        self.assertEqual(self._razoes("estrela"), [])
+        self.assertEqual(reindexar_busca(), 3)
+        self.assertEqual(self._razoes("estrela"), ["Panificadora Estrela"])
+
+    def test_endpoint_com_etag_pela_versao_das_empresas(self):
+        url = "/api/empresas/buscar/?q=padaria"
+        resposta = self.client.get(url)
+        self.assertEqual([item["cnpj"] for item in resposta.json()["resultados"]], ["43.210.000/0001-55"])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"]).status_code, 304)
+
+        empresa = self.empresas["Padaria Central"]
+        empresa.uf = "PR"
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            empresa.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"]).status_code, 200)
+        self.assertEqual(self.client.get(url + "&limite=abc").status_code, 400)
+
+    def test_reindexacao_invalida_o_etag(self):
+        url = "/api/empresas/buscar/?q=estrela"
+        Empresa.objects.filter(razao_social="Padaria Central").update(razao_social="Panificadora Estrela")
+        resposta = self.client.get(url)
+        self.assertEqual(resposta.json()["resultados"], [])
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            reindexar_busca()
+        resposta = self.client.get(url, HTTP_IF_NONE_MATCH=resposta["ETag"])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual([item["razao_social"] for item in resposta.json()["resultados"]], ["Panificadora Estrela"])
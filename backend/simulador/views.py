@@ -3,34 +3,60 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound
-from django.db.models import Sum
+from rest_framework.permissions import BasePermission
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date
 
 from .models import (
-    Empresa, Simulacao, Resultado,
+    Empresa, Simulacao, Resultado, ResumoSimulacao,
     CnaeImpedimento, CnaeAnexo, AnexoSimples, FaixaSimples,
-    BasePresumido, AliquotaFixa, AliquotaFederal
+    BasePresumido, AliquotaFixa, AliquotaFederal, Job, VersaoTabelas,
 )
 from .serializers import (
     EmpresaSerializer, SimulacaoSerializer, ResultadoSerializer,
     CnaeImpedimentoSerializer, CnaeAnexoSerializer, AnexoSimplesSerializer, FaixaSimplesSerializer,
     BasePresumidoSerializer, AliquotaFixaSerializer, AliquotaFederalSerializer,
-    BalanceteDeParaItemSerializer,
+    BalanceteDeParaItemSerializer, JobSerializer, JobResumoSerializer,
+    VersaoTabelasSerializer, VersaoTabelasResumoSerializer, ProjecaoSerializer,
 )
 from .services.calculadora import CalculadoraTributaria, _q
-from .services.firebird_balancete import obter_balancete, BalanceteError
+from .services.analise_carteira import analisar_carteira
+from .services.arvore_contas import ArvoreContas
+from .services.consolidacao import consolidar_por_arvore
+from .services.depara_regras import DeParaInvalido, plano_depara
+from .services.cobertura_depara import cobertura_depara, contas_plano, mapeamento_csv, saldos_do_balancete
+from .services.busca_empresas import buscar_empresas, LIMITE_PADRAO as LIMITE_BUSCA_PADRAO
+from .services.espelho_sci import localizar_empresa as localizar_empresa_sci, dados_empresa as dados_empresa_sci
+from .services.tabelas_versionadas import publicar_versao
+from .services.projecao import ProjecaoTributaria, meses_da_simulacao
+from .services.referencias import obter_referencias, MODELOS_REFERENCIA
+from .cache_http import (
+    ValidacaoCondicionalMixin, responder_condicional, REVALIDAR, IMUTAVEL, SEM_CACHE,
+)
+from .services import versoes
+from .services.importacao_simulacoes import importar_simulacoes, ler_linhas, ImportacaoError
+from .services.metricas import SerializacaoMedidaMixin, resumo_metricas
+from .services import cache_resultados
+from .services.single_flight import contadores as contadores_single_flight
+from .services.firebird_balancete import obter_balancete_compartilhado, obter_parametros_balancete, BalanceteError
+from .services.balancete_jobs import submeter_balancete, obter_job as obter_balancete_job
+from .services import tarefas  # noqa: F401 - registra as tarefas da fila de jobs
+from .services.jobs import enfileirar, cancelar as cancelar_job
 from .services.depara_storage import (
     list_entries as listar_depara,
     create_entry as criar_depara,
     get_entry as obter_depara,
     update_entry as atualizar_depara,
     delete_entry as remover_depara,
+    assinatura_arquivo as assinatura_depara,
 )
 
 
 # ------------------------
 # EMPRESA
 # ------------------------
-class EmpresaViewSet(viewsets.ModelViewSet):
+class EmpresaViewSet(SerializacaoMedidaMixin, viewsets.ModelViewSet):
     queryset = Empresa.objects.all()
     serializer_class = EmpresaSerializer
 
@@ -44,12 +70,7 @@ class EmpresaViewSet(viewsets.ModelViewSet):
         if not digits:
             return Response({"detail": "CNPJ inválido."}, status=status.HTTP_400_BAD_REQUEST)
 
-        empresa = None
-        for item in Empresa.objects.all():
-            cnpj_item = "".join(ch for ch in str(item.cnpj or "") if ch.isdigit())
-            if cnpj_item == digits:
-                empresa = item
-                break
+        empresa = Empresa.objects.filter(cnpj_digitos=digits).order_by("id").first()
 
         if not empresa:
             return Response({"detail": "Empresa não encontrada."}, status=status.HTTP_404_NOT_FOUND)
@@ -57,12 +78,56 @@ class EmpresaViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(empresa)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["post"], url_path="importar-sci")
+    def importar_sci(self, request):
+        """Empresa do código SCI informado, cadastrada a partir do espelho do SCI se ainda não existir."""
+        try:
+            codigo = int(request.data.get("codigo"))
+        except (TypeError, ValueError):
+            return Response({"detail": "Parâmetro 'codigo' deve ser numérico."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            espelho, empresa = localizar_empresa_sci(codigo)
+        except BalanceteError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except RuntimeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if espelho is None:
+            return Response({"detail": "Empresa não encontrada no SCI."}, status=status.HTTP_404_NOT_FOUND)
+        if empresa is not None:
+            return Response({"empresa": self.get_serializer(empresa).data, "criada": False})
+
+        serializer = self.get_serializer(data=dados_empresa_sci(espelho))
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"empresa": serializer.data, "criada": True}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"])
+    def buscar(self, request):
+        """Autocomplete: ?q= (razão social, CNPJ ou código SCI) e ?limite= (máx. 50)."""
+        termo = request.query_params.get("q", "")
+        try:
+            limite = int(request.query_params.get("limite", LIMITE_BUSCA_PADRAO))
+        except ValueError:
+            return Response({"detail": "Parâmetro 'limite' inválido."}, status=status.HTTP_400_BAD_REQUEST)
+        etag, ultima = versoes.validadores((Empresa,), request.get_full_path())
+        return responder_condicional(
+            request,
+            etag,
+            ultima,
+            lambda: Response({"resultados": buscar_empresas(termo, limite)}),
+            **REVALIDAR,
+        )
+
 
 # ------------------------
 # SIMULAÇÃO
 # ------------------------
-class SimulacaoViewSet(viewsets.ModelViewSet):
-    queryset = Simulacao.objects.all().order_by("-id").prefetch_related(
+class SimulacaoViewSet(SerializacaoMedidaMixin, viewsets.ModelViewSet):
+    queryset = Simulacao.objects.all().order_by("-id").select_related(
+        "empresa",
+        "resumo",
+    ).prefetch_related(
         "anexos_mercadoria__anexo",
         "anexos_servico__anexo",
         "resultados",
@@ -73,55 +138,172 @@ class SimulacaoViewSet(viewsets.ModelViewSet):
     def processar(self, request, pk=None):
         sim = self.get_object()
         meses = int(request.query_params.get("meses", "1"))
+        force = str(request.query_params.get("force", "")).lower() in ("1", "true", "sim")
         calc = CalculadoraTributaria(sim, meses_no_periodo=meses)
         try:
-            resultado = calc.processar()
+            resultado = calc.processar(force=force)
         except ValueError as exc:
             return Response({"ok": False, "detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"ok": True, "resultado": resultado})
 
-    @action(detail=True, methods=["get"])
-    def comparativo(self, request, pk=None):
+    @action(detail=True, methods=["post"])
+    def projecao(self, request, pk=None):
+        """
+        Matriz mês x regime. Sem 'meses', repete a média mensal da simulação
+        por 'quantidade' meses a partir da competência.
+        """
         sim = self.get_object()
-        # Totais por regime
-        totais = (
-            Resultado.objects
-            .filter(simulacao=sim)
-            .values("regime")
-            .annotate(total=Sum("valor"))
+        entrada = ProjecaoSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        dados = entrada.validated_data
+
+        padrao = meses_da_simulacao(
+            sim, dados["quantidade"], meses_no_periodo=dados["meses_no_periodo"]
         )
-        by_regime = {t["regime"]: _q(t["total"]) for t in totais}
+        if dados.get("meses"):
+            base = {k: v for k, v in padrao[0].items() if k != "competencia"}
+            meses = [{**base, **mes} for mes in dados["meses"]]
+        else:
+            meses = padrao
 
-        receita = _q(sim.receita_total) if sim.receita_total else _q(0)
-        carga = {}
-        for regime, total in by_regime.items():
-            carga[regime] = f"{(_q(0) if receita == 0 else (total / receita * 100)).quantize(_q(0.01)):.2f}"
+        try:
+            projecao = ProjecaoTributaria(
+                sim, meses, historico_receitas=dados.get("historico_receitas")
+            ).calcular()
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(projecao)
+
+    @action(detail=False, methods=["post"])
+    def importar(self, request):
+        arquivo = request.FILES.get("arquivo")
+        if not arquivo:
+            return Response({"detail": "Envie o arquivo no campo 'arquivo'."}, status=status.HTTP_400_BAD_REQUEST)
+        processar = str(request.query_params.get("processar", "")).lower() in ("1", "true", "sim")
+        try:
+            meses = int(request.query_params.get("meses", "1"))
+        except ValueError:
+            meses = 0
+        if meses < 1:
+            return Response({"detail": "Parâmetro 'meses' deve ser um inteiro positivo."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            relatorio = importar_simulacoes(
+                ler_linhas(arquivo, arquivo.name),
+                processar=processar,
+                meses_no_periodo=meses,
+            )
+        except ImportacaoError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(relatorio)
+
+    def _condicional(self, request, pk, gerar):
+        """
+        ETag/Last-Modified da simulação: atualizado_em da simulação e do resumo
+        (gravado a cada processar) + versões de Empresa/AnexoSimples aninhados.
+        """
+        try:
+            datas = Simulacao.objects.filter(pk=pk).values_list("atualizado_em", "resumo__atualizado_em").first()
+        except (TypeError, ValueError):
+            datas = None
+        if datas is None:
+            return gerar()  # 404 pelo caminho normal
+        aninhados = (Empresa, AnexoSimples)
+        etag, ultima = versoes.validadores(aninhados, self.action, request.get_full_path(), *datas)
+        instantes = [d for d in (*datas, ultima) if d is not None]
+        return responder_condicional(request, etag, max(instantes) if instantes else None, gerar, **REVALIDAR)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._condicional(request, kwargs.get("pk"), lambda: super(SimulacaoViewSet, self).retrieve(request, *args, **kwargs))
 
-        # detalhamento por regime
-        detalhado = {}
-        for regime in ["Simples", "Presumido", "Real"]:
-            linhas = Resultado.objects.filter(simulacao=sim, regime=regime).values("imposto", "valor")
-            detalhado[regime] = {l["imposto"]: f"{_q(l['valor']):.2f}" for l in linhas}
+    @action(detail=True, methods=["get"])
+    def comparativo(self, request, pk=None):
+        return self._condicional(request, pk, self._comparativo)
 
-        # vencedor
-        regime_vencedor = None
-        if by_regime:
-            regime_vencedor = min(by_regime.keys(), key=lambda r: by_regime[r])
+    def _comparativo(self):
+        sim = self.get_object()
+        receita = _q(sim.receita_total) if sim.receita_total else _q(0)
+        try:
+            resumo = sim.resumo
+        except ResumoSimulacao.DoesNotExist:
+            # Simulação ainda não processada
+            return Response({
+                "simulacao_id": sim.id,
+                "receita_total": f"{receita:.2f}",
+                "totais": {},
+                "carga_percent": {},
+                "vencedor": None,
+                "detalhado": {regime: {} for regime in ["Simples", "Presumido", "Real"]},
+            })
 
         return Response({
             "simulacao_id": sim.id,
-            "receita_total": f"{receita:.2f}",
-            "totais": {k: f"{v:.2f}" for k, v in by_regime.items()},
-            "carga_percent": carga,
-            "vencedor": regime_vencedor,
-            "detalhado": detalhado,
+            "receita_total": f"{_q(resumo.receita_total):.2f}",
+            "totais": {k: f"{_q(v):.2f}" for k, v in resumo.totais().items()},
+            "carga_percent": {k: f"{_q(v):.2f}" for k, v in resumo.cargas().items()},
+            "vencedor": resumo.vencedor,
+            "economia_potencial": f"{_q(resumo.economia_potencial):.2f}",
+            "detalhado": resumo.detalhado,
         })
 
 
+class AnaliseCarteiraAPIView(APIView):
+    """
+    Agregados da carteira: economia potencial e carga tributária por CNAE/UF.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        datas = {}
+        for nome in ("data_inicio", "data_fim"):
+            valor = params.get(nome)
+            if not valor:
+                continue
+            try:
+                datas[nome] = parse_date(valor)
+            except ValueError:
+                datas[nome] = None
+            if datas[nome] is None:
+                return Response(
+                    {"detail": f"Parâmetro '{nome}' deve estar no formato AAAA-MM-DD."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        try:
+            dados = analisar_carteira(
+                regime=params.get("regime") or None,
+                cnae=params.get("cnae") or None,
+                agrupar_por=params.get("agrupar_por", "uf"),
+                **datas,
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(dados)
+
+
+class ReferenciasAPIView(APIView):
+    """
+    Tabelas auxiliares em um só payload para abrir a NovaSimulacao (empresas vêm
+    da busca em /api/empresas/buscar/). ETag muda apenas quando alguma dessas
+    tabelas é gravada (304 na revalidação).
+    """
+
+    def get(self, request):
+        etag, ultima = versoes.validadores(MODELOS_REFERENCIA)
+        return responder_condicional(
+            request,
+            etag,
+            ultima,
+            lambda: Response(obter_referencias()[1]),
+            **REVALIDAR,
+        )
+
+
 # ------------------------
 # RESULTADO
 # ------------------------
-class ResultadoViewSet(viewsets.ModelViewSet):
+class ResultadoViewSet(SerializacaoMedidaMixin, viewsets.ReadOnlyModelViewSet):
+    """Somente leitura: os resultados são gravados pelo processamento da simulação."""
+
     queryset = Resultado.objects.all()
     serializer_class = ResultadoSerializer
 
@@ -129,38 +311,45 @@ class ResultadoViewSet(viewsets.ModelViewSet):
 # ------------------------
 # TABELAS AUXILIARES
 # ------------------------
-class CnaeImpedimentoViewSet(viewsets.ModelViewSet):
+class CnaeImpedimentoViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = CnaeImpedimento.objects.all()
+    modelos_versao = (CnaeImpedimento,)
     serializer_class = CnaeImpedimentoSerializer
 
 
-class CnaeAnexoViewSet(viewsets.ModelViewSet):
+class CnaeAnexoViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = CnaeAnexo.objects.all()
+    modelos_versao = (CnaeAnexo,)
     serializer_class = CnaeAnexoSerializer
 
 
-class AnexoSimplesViewSet(viewsets.ModelViewSet):
+class AnexoSimplesViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = AnexoSimples.objects.all()
+    modelos_versao = (AnexoSimples,)
     serializer_class = AnexoSimplesSerializer
 
 
-class FaixaSimplesViewSet(viewsets.ModelViewSet):
+class FaixaSimplesViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = FaixaSimples.objects.all()
+    modelos_versao = (FaixaSimples,)
     serializer_class = FaixaSimplesSerializer
 
 
-class BasePresumidoViewSet(viewsets.ModelViewSet):
+class BasePresumidoViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = BasePresumido.objects.all()
+    modelos_versao = (BasePresumido,)
     serializer_class = BasePresumidoSerializer
 
 
-class AliquotaFixaViewSet(viewsets.ModelViewSet):
+class AliquotaFixaViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = AliquotaFixa.objects.all()
+    modelos_versao = (AliquotaFixa,)
     serializer_class = AliquotaFixaSerializer
 
 
-class AliquotaFederalViewSet(viewsets.ModelViewSet):
+class AliquotaFederalViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ModelViewSet):
     queryset = AliquotaFederal.objects.all()
+    modelos_versao = (AliquotaFederal,)
     serializer_class = AliquotaFederalSerializer
 
     def get_queryset(self):
@@ -174,13 +363,57 @@ class AliquotaFederalViewSet(viewsets.ModelViewSet):
         return qs
 
 
+class VersaoTabelasViewSet(SerializacaoMedidaMixin, ValidacaoCondicionalMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Versões publicadas das tabelas auxiliares. O POST copia as tabelas atuais
+    para uma nova versão (imutável) com a vigência informada.
+    """
+    queryset = VersaoTabelas.objects.all()
+    serializer_class = VersaoTabelasSerializer
+    modelos_versao = (VersaoTabelas,)
+
+    def get_cache_control(self):
+        # versão publicada não muda: cache longo no navegador
+        return IMUTAVEL if self.action == "retrieve" else REVALIDAR
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == "list":
+            qs = qs.defer("snapshot")
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return VersaoTabelasResumoSerializer
+        return super().get_serializer_class()
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            versao = publicar_versao(
+                serializer.validated_data["vigencia_inicio"],
+                serializer.validated_data.get("descricao", ""),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(versao).data, status=status.HTTP_201_CREATED)
+
+
 class BalanceteDeParaViewSet(viewsets.ViewSet):
     """
     CRUD baseado em arquivo JSON para o DE-PARA do balancete.
     """
 
     def list(self, request):
-        return Response(listar_depara())
+        identificador, modificado_em = assinatura_depara()
+        return responder_condicional(
+            request,
+            f'"depara-{identificador}"',
+            modificado_em,
+            lambda: Response(listar_depara()),
+            **REVALIDAR,
+        )
 
     def create(self, request):
         serializer = BalanceteDeParaItemSerializer(data=request.data)
@@ -209,6 +442,131 @@ class BalanceteDeParaViewSet(viewsets.ViewSet):
             raise NotFound("Item de DE-PARA não encontrado.")
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=["get"])
+    def conflitos(self, request):
+        """
+        Contas reivindicadas por mais de um parâmetro. Sem empresa, só as
+        sobreposições das próprias regras; com empresa/data_inicio/data_fim/comp_ref,
+        também as contas do balancete que caem em mais de um parâmetro.
+        """
+        try:
+            plano = plano_depara()
+        except DeParaInvalido as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        resultado = {"regras": plano.conflitos_estaticos()}
+        if request.query_params.get("empresa"):
+            params, erro = _parametros_balancete(request.query_params)
+            if erro:
+                return erro
+            params.update({"decimais": "str", "formato": "dict"})
+            try:
+                balancete = obter_balancete_compartilhado(**params)
+            except BalanceteError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            except RuntimeError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            resultado["contas"] = plano.conflitos(balancete["dados"])
+        return Response(resultado)
+
+    @action(detail=False, methods=["get"])
+    def cobertura(self, request):
+        """
+        Cobertura do DE-PARA no plano de contas: ?plano= (BDCODPLAPADRAO) ou os
+        parâmetros do balancete (empresa, data_inicio, data_fim, comp_ref), que
+        limitam as contas sem parâmetro às que têm saldo no período.
+        """
+        try:
+            plano = plano_depara()
+        except DeParaInvalido as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        codigo_plano = (request.query_params.get("plano") or "").strip()
+        saldos = None
+        try:
+            if request.query_params.get("empresa"):
+                params, erro = _parametros_balancete(request.query_params)
+                if erro:
+                    return erro
+                params.update({"decimais": "str", "formato": "dict"})
+                balancete = obter_balancete_compartilhado(**params)
+                codigo_plano = str(balancete["plano_contas"])
+                saldos = saldos_do_balancete(balancete["dados"])
+            elif not codigo_plano:
+                return Response(
+                    {"detail": "Informe 'plano' ou os parâmetros do balancete."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            contas = contas_plano(codigo_plano)
+        except BalanceteError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except RuntimeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        resultado = cobertura_depara(plano, contas, saldos, mapeamento_csv())
+        return Response({"plano_contas": codigo_plano, **resultado})
+
+
+def _parametros_balancete(dados):
+    """Valida os parâmetros do balancete; devolve (params, None) ou (None, Response de erro)."""
+    empresa = dados.get("empresa")
+    data_inicio = dados.get("data_inicio")
+    data_fim = dados.get("data_fim")
+    competencia = dados.get("comp_ref")
+
+    missing = [
+        nome for nome, valor in [
+            ("empresa", empresa),
+            ("data_inicio", data_inicio),
+            ("data_fim", data_fim),
+            ("comp_ref", competencia),
+        ] if not valor
+    ]
+    if missing:
+        return None, Response(
+            {"detail": f"Parâmetros obrigatórios ausentes: {', '.join(missing)}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        empresa_int = int(empresa)
+    except (TypeError, ValueError):
+        return None, Response(
+            {"detail": "O parâmetro 'empresa' deve ser numérico."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    params = {
+        "empresa": empresa_int,
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "competencia_ref": competencia,
+        "decimais": dados.get("decimais", "float"),
+        "formato": dados.get("formato", "dict"),
+    }
+    # Filtros/projeção opcionais (aplicados no SQL em volta da stored procedure);
+    # só entram quando informados, para não mudar a chave do single-flight.
+    for nome in ("prefixos", "colunas"):
+        valores = _lista_parametro(dados.get(nome))
+        if valores:
+            params[nome] = valores
+    for nome in ("somente_analiticas", "nao_zeradas"):
+        if _parametro_booleano(dados.get(nome)):
+            params[nome] = True
+    return params, None
+
+
+def _lista_parametro(valor):
+    """'03,04.1' ou lista -> ['03', '04.1'] (sem vazios)."""
+    if isinstance(valor, (list, tuple)):
+        itens = valor
+    else:
+        itens = str(valor or "").split(",")
+    return [str(item).strip() for item in itens if str(item).strip()]
+
+
+def _parametro_booleano(valor) -> bool:
+    return str(valor or "").strip().lower() in ("1", "true", "sim")
+
 
 class BalanceteAPIView(APIView):
     """
@@ -216,39 +574,37 @@ class BalanceteAPIView(APIView):
     """
 
     def get(self, request):
-        empresa = request.query_params.get("empresa")
-        data_inicio = request.query_params.get("data_inicio")
-        data_fim = request.query_params.get("data_fim")
-        competencia = request.query_params.get("comp_ref")
-
-        missing = [
-            nome for nome, valor in [
-                ("empresa", empresa),
-                ("data_inicio", data_inicio),
-                ("data_fim", data_fim),
-                ("comp_ref", competencia),
-            ] if not valor
-        ]
-        if missing:
-            return Response(
-                {"detail": f"Parâmetros obrigatórios ausentes: {', '.join(missing)}"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        params, erro = _parametros_balancete(request.query_params)
+        if erro:
+            return erro
 
         try:
-            empresa_int = int(empresa)
-        except (TypeError, ValueError):
-            return Response(
-                {"detail": "O parâmetro 'empresa' deve ser numérico."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+            resultado = obter_balancete_compartilhado(**params)
+        except BalanceteError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except RuntimeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        return Response(resultado)
+
+
+class BalanceteParametrosAPIView(APIView):
+    """
+    Parâmetros da simulação consolidados pelo DE-PARA no próprio Firebird
+    (só a linha agregada trafega). ?somente_analiticas=1 ignora contas sintéticas.
+    """
+
+    def get(self, request):
+        params, erro = _parametros_balancete(request.query_params)
+        if erro:
+            return erro
         try:
-            resultado = obter_balancete(
-                empresa=empresa_int,
-                data_inicio=data_inicio,
-                data_fim=data_fim,
-                competencia_ref=competencia,
+            resultado = obter_parametros_balancete(
+                empresa=params["empresa"],
+                data_inicio=params["data_inicio"],
+                data_fim=params["data_fim"],
+                competencia_ref=params["competencia_ref"],
+                somente_analiticas=params.get("somente_analiticas", False),
             )
         except BalanceteError as exc:
             return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
@@ -256,3 +612,154 @@ class BalanceteAPIView(APIView):
             return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         return Response(resultado)
+
+
+class BalanceteArvoreAPIView(APIView):
+    """
+    Balancete como árvore de contas (BDCTALON) com o total de cada grupo e as
+    contas sintéticas cujo saldo não bate com a soma das filhas.
+    ?campo= (padrão bdsaldo_atual), ?profundidade= e ?depara=1 (parâmetros pelo DE-PARA).
+    """
+
+    def get(self, request):
+        params, erro = _parametros_balancete(request.query_params)
+        if erro:
+            return erro
+        params.update({"decimais": "str", "formato": "dict"})
+        campo = (request.query_params.get("campo") or "bdsaldo_atual").strip().lower()
+        try:
+            profundidade = int(request.query_params["profundidade"]) if request.query_params.get("profundidade") else None
+        except ValueError:
+            return Response({"detail": "Parâmetro 'profundidade' inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            balancete = obter_balancete_compartilhado(**params)
+        except BalanceteError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except RuntimeError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        arvore = ArvoreContas(balancete["dados"], campo=campo)
+        resultado = {
+            "empresa": balancete["empresa"],
+            "empresa_detalhes": balancete["empresa_detalhes"],
+            "periodo": balancete["periodo"],
+            "campo": campo,
+            "total_contas": len(arvore.nos),
+            "divergencias": arvore.divergencias(),
+            "contas": arvore.como_dict(profundidade),
+        }
+        if _parametro_booleano(request.query_params.get("depara")):
+            resultado["parametros"] = {
+                parametro: f"{valor:.2f}"
+                for parametro, valor in consolidar_por_arvore(balancete["dados"]).items()
+            }
+        return Response(resultado)
+
+
+class BalanceteJobsAPIView(APIView):
+    """
+    Agenda a consulta do balancete fora do worker HTTP e devolve o id do job.
+    Consultas idênticas em andamento compartilham o mesmo job.
+    """
+
+    def post(self, request):
+        dados = request.data if request.data else request.query_params
+        params, erro = _parametros_balancete(dados)
+        if erro:
+            return erro
+        try:
+            job = submeter_balancete(params)
+        except (BalanceteError, ValueError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(job, status=status.HTTP_202_ACCEPTED)
+
+
+class BalanceteJobDetalheAPIView(APIView):
+    """
+    Situação do job do balancete; quando concluído, inclui o 'resultado'.
+    """
+
+    def get(self, request, job_id):
+        job = obter_balancete_job(job_id)
+        if not job:
+            raise NotFound("Job do balancete não encontrado.")
+        return Response(job)
+
+
+class MetricasInternas(BasePermission):
+    """Usuários staff, ou qualquer um com SIMULADOR_METRICAS_ABERTAS (rede interna)."""
+
+    def has_permission(self, request, view):
+        if getattr(settings, "SIMULADOR_METRICAS_ABERTAS", False):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class MetricasAPIView(APIView):
+    """
+    Percentis por endpoint coletados pelo InstrumentacaoMiddleware (por processo).
+    """
+    permission_classes = [MetricasInternas]
+
+    def get(self, request):
+        resposta = Response({
+            "ativo": bool(getattr(settings, "SIMULADOR_INSTRUMENTACAO", False)),
+            "endpoints": resumo_metricas(),
+            "single_flight": contadores_single_flight.copia(),
+            "cache_resultados": cache_resultados.metricas(),
+        })
+        patch_cache_control(resposta, **SEM_CACHE)
+        return resposta
+
+
+# ------------------------
+# JOBS EM SEGUNDO PLANO
+# ------------------------
+class JobViewSet(SerializacaoMedidaMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Fila de jobs executada pelo comando `jobs_worker`.
+    POST cria o job (202) e o cliente acompanha pelo GET /api/jobs/<id>/.
+    """
+    queryset = Job.objects.all().order_by("-id")
+    serializer_class = JobSerializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        patch_cache_control(response, **SEM_CACHE)
+        return response
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        if params.get("tipo"):
+            qs = qs.filter(tipo=params["tipo"])
+        if params.get("status"):
+            qs = qs.filter(status=params["status"])
+        if self.action == "list":
+            # o resultado pode ser grande; fica só no detalhe
+            qs = qs.defer("resultado")
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return JobResumoSerializer
+        return super().get_serializer_class()
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            job = enfileirar(
+                serializer.validated_data["tipo"],
+                serializer.validated_data.get("parametros") or {},
+                max_tentativas=serializer.validated_data.get("max_tentativas", 3),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=["post"])
+    def cancelar(self, request, pk=None):
+        job = cancelar_job(self.get_object())
+        return Response(self.get_serializer(job).data)
@@ -17,11 +17,22 @@ const crud = (endpoint) => ({
 export const EmpresaAPI = crud("empresas");
 EmpresaAPI.findByCnpj = (cnpj) =>
   api.get(`/empresas/buscar-por-cnpj/`, { params: { cnpj } });
+EmpresaAPI.importarSci = (codigo) =>
+  api.post(`/empresas/importar-sci/`, { codigo });
+EmpresaAPI.buscar = (q, limite = 20) =>
+  api.get(`/empresas/buscar/`, { params: { q, limite } });
 export const SimulacaoAPI = {
   ...crud("simulacoes"),
   retrieve: (id) => api.get(`/simulacoes/${id}/`),
-  processar: (id, meses = 1) => api.post(`/simulacoes/${id}/processar/?meses=${meses}`),
+  processar: (id, meses = 1, { force = false } = {}) =>
+    api.post(`/simulacoes/${id}/processar/`, null, { params: { meses, ...(force ? { force: 1 } : {}) } }),
   comparativo: (id) => api.get(`/simulacoes/${id}/comparativo/`),
+  projecao: (id, payload = {}) => api.post(`/simulacoes/${id}/projecao/`, payload),
+  importar: (arquivo, { processar = false, meses = 1 } = {}) => {
+    const form = new FormData();
+    form.append("arquivo", arquivo);
+    return api.post(`/simulacoes/importar/`, form, { params: { processar: processar ? 1 : 0, meses } });
+  },
 };
 export const ResultadoAPI = crud("resultados");
 
@@ -32,8 +43,25 @@ export const FaixaSimplesAPI = crud("faixas-simples");
 export const BasePresumidoAPI = crud("base-presumido");
 export const AliquotaFixaAPI = crud("aliquotas-fixas");
 export const AliquotaFederalAPI = crud("aliquotas-federais");
+export const AnaliseAPI = {
+  carteira: (params) => api.get("/analises/carteira/", { params }),
+};
 export const BalanceteAPI = {
   fetch: (params) => api.get("/balancete/", { params }),
+  submit: (params) => api.post("/balancete/jobs/", params),
+  job: (id) => api.get(`/balancete/jobs/${id}/`),
+};
+
+// Tabelas auxiliares em uma chamada (ETag: o navegador revalida com 304)
+export const ReferenciasAPI = {
+  get: () => api.get("/referencias/"),
+};
+
+export const JobAPI = {
+  list: (params) => api.get("/jobs/", { params }),
+  get: (id) => api.get(`/jobs/${id}/`),
+  create: (tipo, parametros) => api.post("/jobs/", { tipo, parametros }),
+  cancel: (id) => api.post(`/jobs/${id}/cancelar/`),
 };
 
 export default api;
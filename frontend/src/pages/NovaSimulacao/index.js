@@ -1,6 +1,6 @@
 import React, { useState, useMemo, useEffect } from "react";
 import { Info } from "lucide-react";
-import { EmpresaAPI, SimulacaoAPI, BalanceteAPI, AnexoSimplesAPI, BasePresumidoAPI, AliquotaFederalAPI } from "../../api";
+import { EmpresaAPI, SimulacaoAPI, BalanceteAPI, ReferenciasAPI } from "../../api";
 import Modal from "../../components/Modal";
 import { consolidarBalancete } from "./balanceteMap";
 import "./NovaSimulacao.css";
@@ -110,6 +110,7 @@ const resolverEmpresa = (metadados, linhas) => {
       return {
         ok: true,
         dados: {
+          ...(metadados.codigo ? { codigo_sci: metadados.codigo } : {}),
           razao_social,
           cnpj,
           cnae_principal,
@@ -264,32 +265,31 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
     localStorage.setItem("ui.collapsed", JSON.stringify(collapsed));
   }, [collapsed]);
 
-  // Carrega valores padrão de PIS/COFINS (Cumulativo - Presumido)
+  // Carrega tabelas de referência (anexos, bases do presumido e PIS/COFINS padrão - Cumulativo)
   useEffect(() => {
     (async () => {
+      let pisAliq = "0.65";
+      let cofinsAliq = "3.00";
       try {
-        const [pis, cofins] = await Promise.all([
-          AliquotaFederalAPI.list({ imposto: "PIS", base_calculo: "Cumulativo" }),
-          AliquotaFederalAPI.list({ imposto: "COFINS", base_calculo: "Cumulativo" }),
-        ]);
-        const pisAliq = (pis && pis.data && pis.data[0] && pis.data[0].aliquota) || "0.65";
-        const cofinsAliq = (cofins && cofins.data && cofins.data[0] && cofins.data[0].aliquota) || "3.00";
-        setAliqPisDefault(String(pisAliq));
-        setAliqCofinsDefault(String(cofinsAliq));
-        setForm((prev) => ({
-          ...prev,
-          aliquota_pis: prev.aliquota_pis || String(pisAliq),
-          aliquota_cofins: prev.aliquota_cofins || String(cofinsAliq),
-        }));
+        const { data } = await ReferenciasAPI.get();
+        setAnexos(data.anexos_simples || []);
+        setBasesPresumidas(data.base_presumido || []);
+        const federal = (imposto) =>
+          (data.aliquotas_federais || []).find(
+            (a) => a.imposto.toUpperCase() === imposto && String(a.base_calculo).toLowerCase() === "cumulativo"
+          );
+        pisAliq = (federal("PIS") && federal("PIS").aliquota) || pisAliq;
+        cofinsAliq = (federal("COFINS") && federal("COFINS").aliquota) || cofinsAliq;
       } catch (_e) {
-        setAliqPisDefault("0.65");
-        setAliqCofinsDefault("3.00");
-        setForm((prev) => ({
-          ...prev,
-          aliquota_pis: prev.aliquota_pis || "0.65",
-          aliquota_cofins: prev.aliquota_cofins || "3.00",
-        }));
+        // mantém os padrões
       }
+      setAliqPisDefault(String(pisAliq));
+      setAliqCofinsDefault(String(cofinsAliq));
+      setForm((prev) => ({
+        ...prev,
+        aliquota_pis: prev.aliquota_pis || String(pisAliq),
+        aliquota_cofins: prev.aliquota_cofins || String(cofinsAliq),
+      }));
     })();
   }, []);
 
@@ -399,14 +399,6 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
     // comp_ref é o próprio último mês do período selecionado
     const comp = calcularCompetencia(fimStr);
     try {
-      const { data } = await BalanceteAPI.fetch({
-        empresa: empresaId,
-        data_inicio: inicioStr,
-        data_fim: fimStr,
-        comp_ref: comp,
-      });
-      const linhas = (data && data.dados) ? data.dados : [];
-      if (!linhas.length) return 0;
       // Preferir campo de movimento do período quando existir
       const candidatosCampo = [
         "bdvalor_periodo",
@@ -416,6 +408,18 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
         "bdvalor",
         "bdsaldo_atual",
       ];
+      // Só o grupo de receitas (03) e as colunas usadas na receita bruta
+      const { data } = await BalanceteAPI.fetch({
+        empresa: empresaId,
+        data_inicio: inicioStr,
+        data_fim: fimStr,
+        comp_ref: comp,
+        prefixos: "03,3",
+        colunas: ["bdctalon", "bdcodcta", "bdtipcta", ...candidatosCampo].join(","),
+        nao_zeradas: 1,
+      });
+      const linhas = (data && data.dados) ? data.dados : [];
+      if (!linhas.length) return 0;
       const consol = consolidarBalancete(linhas, candidatosCampo);
       // Para RBT12 do Simples, usar receita bruta (conta 03)
       const base = valorParaNumero(consol.receita_bruta ?? 0);
@@ -520,17 +524,6 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
     );
   }, [form]);
 
-  useEffect(() => {
-    AnexoSimplesAPI.list().then(({ data }) => {
-      const lista = Array.isArray(data) ? data : data.results || [];
-      setAnexos(lista);
-    });
-    BasePresumidoAPI.list().then(({ data }) => {
-      const lista = Array.isArray(data) ? data : data.results || [];
-      setBasesPresumidas(lista);
-    });
-  }, []);
-
   // Helper: tenta casar percentuais atuais com uma base presumida e selecionar o id
   useEffect(() => {
     if (!basesPresumidas.length) return;
@@ -782,6 +775,7 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
         data_inicio: importParams.dataInicio,
         data_fim: importParams.dataFim,
         comp_ref: competencia,
+        nao_zeradas: 1,
       });
 
       const linhas = (data && data.dados) ? data.dados : [];
@@ -798,16 +792,30 @@ export default function NovaSimulacao({ onSaved, initialData = null, allowImport
 
       let empresaRegistrada = null;
       let empresaCriada = false;
-      try {
-        const { data: encontrada } = await EmpresaAPI.findByCnpj(empresaExtraida.dados.cnpj);
-        empresaRegistrada = encontrada;
-      } catch (consultaErro) {
-        if (consultaErro && consultaErro.response && consultaErro.response.status !== 404) {
-          setImportErro(
-            (consultaErro && consultaErro.response && consultaErro.response.data && consultaErro.response.data.detail) ||
-              "Falha ao consultar a empresa cadastrada. Tente novamente."
-          );
-          return;
+      const codigoSci = data && data.empresa_detalhes && data.empresa_detalhes.codigo;
+      if (codigoSci) {
+        // Cadastro pelo espelho local do SCI; sem registro no espelho, segue pelo CNPJ
+        try {
+          const { data: importada } = await EmpresaAPI.importarSci(codigoSci);
+          empresaRegistrada = importada.empresa;
+          empresaCriada = importada.criada;
+        } catch (importacaoErro) {
+          empresaRegistrada = null;
+        }
+      }
+
+      if (!empresaRegistrada) {
+        try {
+          const { data: encontrada } = await EmpresaAPI.findByCnpj(empresaExtraida.dados.cnpj);
+          empresaRegistrada = encontrada;
+        } catch (consultaErro) {
+          if (consultaErro && consultaErro.response && consultaErro.response.status !== 404) {
+            setImportErro(
+              (consultaErro && consultaErro.response && consultaErro.response.data && consultaErro.response.data.detail) ||
+                "Falha ao consultar a empresa cadastrada. Tente novamente."
+            );
+            return;
+          }
         }
       }
 
@@ -1733,28 +1741,24 @@ function ModalPesquisarEmpresa({ open, onClose, onSelect }) {
     regime_tributario: "Outras",
   });
 
+  // Busca no servidor (com atraso para não consultar a cada tecla)
   useEffect(() => {
-    if (open) {
-      EmpresaAPI.list().then(({ data }) => {
-        const lista = Array.isArray(data) ? data : data.results || [];
-        setEmpresas(lista);
+    if (!open) return undefined;
+    let cancelado = false;
+    const timer = setTimeout(() => {
+      EmpresaAPI.buscar(busca.trim()).then(({ data }) => {
+        if (!cancelado) setEmpresas(data.resultados || []);
       });
-    }
-  }, [open]);
+    }, 250);
+    return () => {
+      cancelado = true;
+      clearTimeout(timer);
+    };
+  }, [open, busca]);
 
   if (!open) return null;
 
-  const buscaLower = busca.toLowerCase();
-  const filtradas = empresas.filter((e) => {
-    const regimeTexto = (e.regime_tributario || e.planilha_regime || "").toLowerCase();
-    return (
-      e.razao_social.toLowerCase().includes(buscaLower) ||
-      e.cnpj.includes(busca) ||
-      e.municipio.toLowerCase().includes(buscaLower) ||
-      e.uf.toLowerCase().includes(buscaLower) ||
-      regimeTexto.includes(buscaLower)
-    );
-  });
+  const filtradas = empresas;
 
   const handleSalvar = async () => {
     if (editarEmpresa) {
@@ -1907,7 +1911,7 @@ function ModalPesquisarEmpresa({ open, onClose, onSelect }) {
         {/* Busca */}
         <input
           type="text"
-          placeholder="Buscar por razão social, CNPJ, município ou UF..."
+          placeholder="Buscar por razão social, CNPJ ou código SCI..."
           value={busca}
           onChange={(e) => setBusca(e.target.value)}
           style={{ marginBottom: 12, width: "100%", padding: "6px" }}